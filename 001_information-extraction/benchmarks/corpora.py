@@ -0,0 +1,108 @@
+"""
+Synthetic corpora for the benchmarks
+
+Texts mix sentences built from the risk vocabulary of the ontology (so that part of the
+chunks passes the relevance filter) with generic filler sentences, like an annual report.
+PDFs are written with a minimal PDF writer, so that text extraction with pypdf can be timed
+without shipping real documents.
+"""
+
+import random
+from pathlib import Path
+from typing import List
+
+from rdflib import Graph
+from rdflib.namespace import SKOS
+
+
+CORPUS_SIZES = {
+    "small": 20_000,
+    "medium": 200_000,
+    "large": 1_000_000,
+}
+
+FILLER_SENTENCES = [
+    "The board of directors met four times during the fiscal year.",
+    "Revenue recognition follows the applicable accounting standards.",
+    "Our headquarters are located in a leased office building.",
+    "The company employs staff in several countries and regions.",
+    "Dividends were paid in accordance with the approved policy.",
+    "Further information is available on the investor relations website.",
+    "Management discussion and analysis is presented in the next section.",
+    "Figures are presented in millions unless stated otherwise.",
+]
+
+
+def risk_sentences(ontology_file: Path) -> List[str]:
+    """Sentences about risks, taken from the SKOS definitions of the risk taxonomy"""
+    graph = Graph()
+    graph.parse(str(ontology_file), format="turtle")
+    return [str(definition) for definition in graph.objects(None, SKOS.definition)]
+
+
+def synthetic_text(n_chars: int, ontology_file: Path, relevant_share: float = 0.3, seed: int = 42) -> str:
+    """Generate a deterministic text of about n_chars characters"""
+    rng = random.Random(seed)
+    relevant = risk_sentences(ontology_file)
+    parts: List[str] = []
+    length = 0
+    while length < n_chars:
+        # relevant passages come in paragraphs, like the risk factor section of a report
+        pool = relevant if rng.random() < relevant_share else FILLER_SENTENCES
+        paragraph = " ".join(rng.choice(pool) for _ in range(rng.randint(3, 8))) + "\n\n"
+        parts.append(paragraph)
+        length += len(paragraph)
+    return "".join(parts)[:n_chars]
+
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(text: str, path: Path, chars_per_line: int = 90, lines_per_page: int = 50) -> Path:
+    """Write the text as a minimal multi-page PDF (Helvetica, one text object per page)"""
+    words = text.encode("latin-1", "replace").decode("latin-1").split()
+    lines, line = [], ""
+    for word in words:
+        if len(line) + len(word) + 1 > chars_per_line:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    font_id = 3 + 2 * n_pages
+    page_ids = [3 + 2 * i for i in range(n_pages)]
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    for i, page_lines in enumerate(pages):
+        content_id = page_ids[i] + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        stream = "BT /F1 10 Tf 12 TL 40 760 Td " + " ".join(
+            f"({_escape_pdf_text(l)}) Tj T*" for l in page_lines) + " ET"
+        data = stream.encode("latin-1")
+        objects.append(b"<< /Length " + str(len(data)).encode() + b" >>\nstream\n" + data + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+
+    path.write_bytes(bytes(output))
+    return path
@@ -0,0 +1,134 @@
+"""
+Accuracy of compact embeddings and quantized inference on the SKOS mapping
+
+Classifies risk descriptions against the concepts of the RiskTaxonomy (label and definition,
+as RiskTaxonomyMapper does) with every combination of inference backend and storage dtype of
+src/embedding_store.py, and compares the result to the float32 torch baseline:
+- top-1 agreement: share of descriptions mapped to the same concept as the baseline (flat argmax)
+- hierarchical agreement: the same for the top-down beam search through the taxonomy
+  (TaxonomyIndex.descend), which RiskTaxonomyMapper uses by default
+- mean / max absolute error of the cosine scores
+- bytes per stored vector and encoding time per text
+
+Descriptions are the RiskEvents of semantics/bizrisk_examples.ttl plus the concept definitions
+themselves (each should map to its own concept).
+
+Usage:
+    python embedding_accuracy.py                                   # all backends (downloads the model)
+    python embedding_accuracy.py --backends torch torch-int8       # skip the ONNX backends
+    python embedding_accuracy.py --fake                            # storage dtypes only, offline
+    python embedding_accuracy.py --beam-width 2                    # beam width of the hierarchical search
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+import numpy as np
+from rdflib import Graph
+
+from embedding_store import BACKENDS, DTYPES, EmbeddingStore, get_similarity_model
+from kg_post_processing import RiskTaxonomyMapper, SKOSConcept, TaxonomyIndex
+from fakes import FakeEmbeddingModel, FakeGraphIO, RecordingDriver
+
+
+ONTOLOGY_FILE = BENCHMARKS_DIR.parent / "semantics" / "bizrisk.ttl"
+EXAMPLES_FILE = BENCHMARKS_DIR.parent / "semantics" / "bizrisk_examples.ttl"
+
+
+def risk_descriptions() -> List[str]:
+    # the examples are a fragment of the ontology and use its prefixes without declaring them
+    lines = ONTOLOGY_FILE.read_text(encoding="utf-8").splitlines()
+    prefixes = "\n".join(line for line in lines if line.startswith("@prefix"))
+    examples = Graph()
+    examples.parse(data=prefixes + "\n" + EXAMPLES_FILE.read_text(encoding="utf-8"), format="turtle")
+    query = """
+    PREFIX bizrisk: <http://example.com/bizrisk#>
+    SELECT ?description WHERE { ?event a bizrisk:RiskEvent ; bizrisk:hasRiskEventDescription ?description }
+    """
+    return sorted(str(row.description) for row in examples.query(query))
+
+
+def load_concepts() -> List[SKOSConcept]:
+    mapper = RiskTaxonomyMapper(ontology_file=str(ONTOLOGY_FILE), neo4j_uri="", neo4j_user="", neo4j_password="",
+                                graph_io=FakeGraphIO(RecordingDriver()), similarity_model=FakeEmbeddingModel())
+    return mapper.get_skos_concepts_from_scheme()
+
+
+def concept_texts(concepts: List[SKOSConcept]) -> List[str]:
+    """Texts the concepts are matched on"""
+    return [f"{c.label}: {c.definition}".lower() for c in concepts]
+
+
+def hierarchical_choices(scores: np.ndarray, taxonomy: TaxonomyIndex, uris: List[str],
+                         beam_width: int) -> np.ndarray:
+    """Concept index chosen by the top-down search of RiskTaxonomyMapper.classify_hierarchically, per query"""
+    index = {uri: i for i, uri in enumerate(uris)}
+    choices = []
+    for row in scores:
+        def score(batch: List[str]) -> List[Tuple[str, float]]:
+            return [(uri, float(row[index[uri]])) for uri in batch]
+        choices.append(index[taxonomy.descend(score, beam_width)[0]])
+    return np.array(choices)
+
+
+def evaluate(model, queries: List[str], concepts: List[str], dtype: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    query_embeddings = model.encode([query.lower() for query in queries])
+    concept_embeddings = model.encode(concepts)
+    seconds = time.perf_counter() - started
+    store = EmbeddingStore.from_array(concept_embeddings, dtype=dtype)
+    return {
+        "scores": store.dot(query_embeddings).T,  # (queries, concepts)
+        "bytes_per_vector": store.nbytes / len(store),
+        "ms_per_text": 1000 * seconds / (len(queries) + len(concepts)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--dtypes", nargs="+", default=list(DTYPES), choices=list(DTYPES))
+    parser.add_argument("--fake", action="store_true", help="use the offline FakeEmbeddingModel (storage dtypes only)")
+    parser.add_argument("--beam-width", type=int, default=1, help="beam width of the hierarchical search")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    skos_concepts = load_concepts()
+    taxonomy = TaxonomyIndex.from_concepts(skos_concepts)
+    uris = [c.uri for c in skos_concepts]
+    concepts = concept_texts(skos_concepts)
+    queries = risk_descriptions() + concepts
+    offset = len(queries) - len(concepts)  # queries from here on are the concepts themselves
+    backends = ["fake"] if args.fake else args.backends
+
+    baseline = baseline_hierarchical = None
+    print(f"{len(queries)} descriptions, {len(concepts)} concepts, beam width {args.beam_width}\n")
+    print(f"{'backend':<12}{'dtype':<9}{'top-1 agree':>12}{'hier agree':>11}{'own concept':>12}{'mean |err|':>12}"
+          f"{'max |err|':>11}{'bytes/vec':>11}{'ms/text':>9}")
+    for backend in backends:
+        model = FakeEmbeddingModel() if backend == "fake" else get_similarity_model(backend)
+        for dtype in ["float32"] + [d for d in args.dtypes if d != "float32"]:
+            result = evaluate(model, queries, concepts, dtype)
+            scores = result["scores"]
+            hierarchical = hierarchical_choices(scores, taxonomy, uris, args.beam_width)
+            if baseline is None:
+                baseline, baseline_hierarchical = scores, hierarchical  # first backend, float32
+            top1 = scores.argmax(axis=1)
+            agreement = float(np.mean(top1 == baseline.argmax(axis=1)))
+            hierarchical_agreement = float(np.mean(hierarchical == baseline_hierarchical))
+            own = float(np.mean(top1[offset:] == np.arange(len(concepts))))
+            errors = np.abs(scores - baseline)
+            print(f"{backend:<12}{dtype:<9}{agreement:>12.1%}{hierarchical_agreement:>11.1%}{own:>12.1%}"
+                  f"{errors.mean():>12.4f}"
+                  f"{errors.max():>11.4f}{result['bytes_per_vector']:>11.0f}{result['ms_per_text']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
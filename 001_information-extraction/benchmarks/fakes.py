@@ -0,0 +1,328 @@
+"""
+Offline stand-ins for the external services used by the pipelines in src/
+
+- FakeEmbeddingModel: deterministic bag-of-words embeddings with the interface of SentenceTransformer.encode
+- FakeLLM: neo4j_graphrag LLM returning schema-conformant entity/relation JSON after a configurable latency
+- RecordingDriver: Neo4j driver stand-in that records every statement and its parameters
+- RecordingKGWriter: SimpleKGPipeline writer that sends the extracted graph to a RecordingDriver
+- FakeGraphIO: stand-in for neo4j_connection.GraphIO on top of a RecordingDriver
+- InMemoryRetrievalGraph: GraphIO stand-in answering the queries of graphrag_retrieval.py from
+  chunk embeddings in memory, with a configurable round trip latency and server concurrency
+
+None of them needs network access, so benchmark numbers only reflect the code in this repository.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from neo4j_graphrag.experimental.components.kg_writer import KGWriter, KGWriterModel
+from neo4j_graphrag.experimental.components.types import LexicalGraphConfig, Neo4jGraph
+from neo4j_graphrag.llm.base import LLMInterface
+from neo4j_graphrag.llm.types import LLMResponse
+from pydantic import validate_call
+
+from neo4j_connection import WriteResult
+
+
+class FakeEmbeddingModel:
+    """Hashes words into a fixed number of buckets and L2-normalizes, like all-MiniLM-L6-v2 (384 dims)"""
+
+    def __init__(self, dimensions: int = 384, latency_per_text: float = 0.0, latency_per_call: float = 0.0,
+                 exclusive: bool = False, busy: bool = False):
+        """
+        exclusive: one encode call at a time, like a model that uses all CPU cores
+        busy: spend the latency computing instead of sleeping, like a model on one core
+        """
+        self.dimensions = dimensions
+        self.latency_per_text = latency_per_text
+        self.latency_per_call = latency_per_call
+        self.busy = busy
+        self._lock = threading.Lock() if exclusive else None
+        self.encoded_texts = 0
+
+    def _bucket(self, word: str) -> int:
+        return int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimensions
+
+    def _wait(self, seconds: float):
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        embeddings = np.zeros((len(sentences), self.dimensions), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in re.findall(r"\w+", sentence.lower()):
+                embeddings[row, self._bucket(word)] += 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.encoded_texts += len(sentences)
+        if self.latency_per_text or self.latency_per_call:
+            if self._lock is not None:
+                with self._lock:
+                    self._wait(self.latency_per_call + self.latency_per_text * len(sentences))
+            else:
+                self._wait(self.latency_per_call + self.latency_per_text * len(sentences))
+        return embeddings / norms
+
+
+class FakeLLM(LLMInterface):
+    """
+    Deterministic LLM for the knowledge graph extraction. Every response contains `nodes_per_call`
+    nodes (as `{"nodes": [...], "relationships": [...]}`) whose labels cycle through `labels`,
+    starting at an offset derived from a hash of the prompt; the prompt content is otherwise
+    ignored. With the schema labels, the downstream parsing and writing code gets realistic input.
+    """
+
+    def __init__(self, labels: List[str], relationship_types: Optional[List[str]] = None,
+                 latency: float = 0.0, nodes_per_call: int = 5, **kwargs):
+        super().__init__(model_name="fake-llm", **kwargs)
+        self.labels = labels or ["Entity"]
+        self.relationship_types = relationship_types or ["relatedTo"]
+        self.latency = latency
+        self.nodes_per_call = nodes_per_call
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def _response(self, input: str) -> LLMResponse:
+        self.calls += 1
+        self.prompt_chars += len(input)
+        seed = int(hashlib.md5(input.encode("utf-8")).hexdigest(), 16)
+        nodes = []
+        for i in range(self.nodes_per_call):
+            label = self.labels[(seed + i) % len(self.labels)]
+            nodes.append({"id": str(i), "label": label,
+                          "properties": {"name": f"{label} {seed % 10000}-{i}"}})
+        relationships = [
+            {"type": self.relationship_types[(seed + i) % len(self.relationship_types)],
+             "start_node_id": str(i), "end_node_id": str(i + 1), "properties": {}}
+            for i in range(self.nodes_per_call - 1)
+        ]
+        return LLMResponse(content=json.dumps({"nodes": nodes, "relationships": relationships}))
+
+    def invoke(self, input: str, message_history=None, system_instruction: Optional[str] = None) -> LLMResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(input)
+
+    async def ainvoke(self, input: str, message_history=None, system_instruction: Optional[str] = None) -> LLMResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(input)
+
+
+@dataclass
+class _Counters:
+    nodes_created: int = 0
+    relationships_created: int = 0
+    nodes_deleted: int = 0
+    relationships_deleted: int = 0
+    properties_set: int = 0
+
+
+@dataclass
+class _Summary:
+    counters: _Counters = field(default_factory=_Counters)
+
+
+class _Result:
+    def __init__(self, records: List[Dict[str, Any]]):
+        self._records = records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return list(self._records)
+
+    def consume(self):
+        return _Summary()
+
+
+class _Session:
+    def __init__(self, driver: "RecordingDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query: str, parameters: Optional[Dict] = None, **kwargs) -> _Result:
+        return self.driver._record(query, {**(parameters or {}), **kwargs})
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def close(self):
+        pass
+
+
+class RecordingDriver:
+    """
+    Neo4j driver stand-in. Statements are recorded instead of executed; `responses` maps a
+    substring of a query to the records that should be returned for it.
+    """
+
+    def __init__(self, responses: Optional[Dict[str, List[Dict[str, Any]]]] = None, latency: float = 0.0):
+        self.responses = responses or {}
+        self.latency = latency
+        self.statements: List[str] = []
+        self.parameters: List[Dict[str, Any]] = []  # of every statement, in the same order
+        self.rows_written = 0
+
+    def _record(self, query: str, parameters: Dict) -> _Result:
+        self.statements.append(query)
+        self.parameters.append(parameters)
+        for value in parameters.values():
+            if isinstance(value, list):
+                self.rows_written += len(value)
+        if self.latency:
+            time.sleep(self.latency)
+        for fragment, records in self.responses.items():
+            if fragment in query:
+                return _Result(records)
+        return _Result([])
+
+    def session(self, **kwargs) -> _Session:
+        return _Session(self)
+
+    def execute_query(self, query: str, parameters: Optional[Dict] = None, **kwargs):
+        return self._record(query, {**(parameters or {}), **kwargs}).data(), _Summary(), []
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingKGWriter(KGWriter):
+    """
+    Writer component for SimpleKGPipeline that sends the nodes and relationships of the extracted
+    graph to a RecordingDriver as UNWIND batches (Neo4jWriter needs a real server for its version check)
+    """
+
+    def __init__(self, driver: RecordingDriver):
+        self.driver = driver
+        self.nodes = 0
+        self.entities = 0  # nodes extracted by the LLM, without the lexical graph (chunks, documents)
+        self.relationships = 0
+
+    @validate_call
+    async def run(self, graph: Neo4jGraph,
+                  lexical_graph_config: LexicalGraphConfig = LexicalGraphConfig()) -> KGWriterModel:
+        with self.driver.session() as session:
+            session.run("UNWIND $rows AS row MERGE (n:__KGBuilder__ {id: row.id})",
+                        rows=[node.model_dump() for node in graph.nodes])
+            session.run("UNWIND $rows AS row MATCH (start {id: row.start_node_id}), (end {id: row.end_node_id}) "
+                        "MERGE (start)-[:REL]->(end)",
+                        rows=[relationship.model_dump() for relationship in graph.relationships])
+        self.nodes += len(graph.nodes)
+        self.entities += sum(node.label not in lexical_graph_config.lexical_graph_node_labels for node in graph.nodes)
+        self.relationships += len(graph.relationships)
+        return KGWriterModel(status="SUCCESS", metadata={"node_count": len(graph.nodes),
+                                                         "relationship_count": len(graph.relationships)})
+
+
+class FakeGraphIO:
+    """Runs reads and writes synchronously against a RecordingDriver and returns completed futures"""
+
+    def __init__(self, driver: RecordingDriver):
+        self.driver = driver
+
+    @staticmethod
+    def _done(value) -> Future:
+        future: Future = Future()
+        future.set_result(value)
+        return future
+
+    def _write(self, query: str, parameters: Optional[Dict]) -> WriteResult:
+        started = time.perf_counter()
+        records = self.driver._record(query, parameters or {}).data()
+        return WriteResult(records, _Counters(), time.perf_counter() - started)
+
+    def read(self, query: str, parameters: Optional[Dict] = None) -> Future:
+        return self._done(self.driver._record(query, parameters or {}).data())
+
+    def write(self, query: str, parameters: Optional[Dict] = None, lock_keys=()) -> Future:
+        return self._done(self._write(query, parameters))
+
+    def write_transaction(self, statements, lock_keys=()) -> Future:
+        return self._done([self._write(query, parameters) for query, parameters in statements])
+
+    def close(self):
+        pass
+
+
+class InMemoryRetrievalGraph:
+    """
+    GraphIO stand-in for graphrag_retrieval.py: vector search by brute force over the chunk
+    embeddings, the entities of each chunk from a dict, and the IngestionRun nodes. Every
+    read takes `latency` seconds (network round trip) plus `latency_per_query` per query of an
+    UNWIND batch; at most `server_threads` reads are answered at once.
+    """
+
+    def __init__(self, texts: List[str], embeddings: np.ndarray, entities: Optional[Dict[int, List[Dict]]] = None,
+                 latency: float = 0.0, latency_per_query: float = 0.0, server_threads: int = 8):
+        self.texts = texts
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.entities = entities or {}
+        self.latency = latency
+        self.latency_per_query = latency_per_query
+        self.run_id: Optional[str] = None
+        self.reads = 0
+        self._executor = ThreadPoolExecutor(max_workers=server_threads, thread_name_prefix="fake-graph")
+
+    def _search(self, parameters: Dict) -> List[Dict[str, Any]]:
+        queries = parameters["queries"]
+        time.sleep(self.latency + self.latency_per_query * len(queries))
+        records = []
+        for query in queries:
+            scores = self.embeddings @ np.asarray(query["embedding"], dtype=np.float32)
+            top = np.argsort(-scores)[:parameters["top_k"]]
+            records.extend({"query": query["id"], "chunk_id": f"chunk:{i}", "text": self.texts[i],
+                            "score": float(scores[i]), "entities": self.entities.get(int(i), [])[:parameters["max_entities"]]}
+                           for i in top)
+        return records
+
+    def _answer(self, query: str, parameters: Dict) -> List[Dict[str, Any]]:
+        self.reads += 1
+        if "db.index.vector.queryNodes" in query:
+            return self._search(parameters)
+        time.sleep(self.latency)
+        if "IngestionRun" in query:
+            return [{"run_id": self.run_id}] if self.run_id else []
+        return []
+
+    def read(self, query: str, parameters: Optional[Dict] = None) -> Future:
+        return self._executor.submit(self._answer, query, parameters or {})
+
+    def write(self, query: str, parameters: Optional[Dict] = None, lock_keys=()) -> Future:
+        if "IngestionRun" in query:
+            self.run_id = parameters["run_id"]
+        future: Future = Future()
+        future.set_result(WriteResult([], _Counters(), 0.0))
+        return future
+
+    def close(self):
+        self._executor.shutdown()
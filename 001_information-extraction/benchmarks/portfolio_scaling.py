@@ -0,0 +1,70 @@
+"""
+Scaling of the parallel portfolio post-processing
+
+Runs src/portfolio_post_processing.py on a synthetic portfolio (companies with RiskEvents built
+from the risk vocabulary of the ontology) with an increasing number of worker processes and
+reports the wall-clock time and the speedup against one worker. The embedding model is
+FakeEmbeddingModel spending a fixed CPU time per text (like all-MiniLM-L6-v2 on one core), and
+the writes go to a RecordingDriver, so the numbers show how the mapping scales with the cores.
+
+Usage:
+    python portfolio_scaling.py --companies 200 --events 50 --workers 1 2 4 8
+"""
+
+import argparse
+import functools
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+from portfolio_post_processing import PortfolioPostProcessor
+from corpora import risk_sentences
+from fakes import FakeEmbeddingModel, FakeGraphIO, RecordingDriver
+
+
+ONTOLOGY_FILE = BENCHMARKS_DIR.parent / "semantics" / "bizrisk.ttl"
+
+
+def portfolio_records(companies: int, events: int, seed: int = 42):
+    rng = random.Random(seed)
+    sentences = risk_sentences(ONTOLOGY_FILE)
+    return [{"node_id": c * events + e, "description": rng.choice(sentences), "partition": f"Company {c:04d}"}
+            for c in range(companies) for e in range(events)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--events", type=int, default=40, help="RiskEvents per company")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--cpu-per-text", type=float, default=0.002, help="model CPU seconds per description")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    records = portfolio_records(args.companies, args.events)
+    model_factory = functools.partial(FakeEmbeddingModel, latency_per_text=args.cpu_per_text, busy=True)
+    print(f"{len(records)} RiskEvents of {args.companies} companies, {os.cpu_count()} CPU cores\n")
+    print(f"{'workers':>8}{'seconds':>10}{'speedup':>9}{'events/s':>10}{'failed':>8}{'write batches':>15}")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        driver = RecordingDriver(responses={"MATCH (risk_event:RiskEvent)": records})
+        processor = PortfolioPostProcessor(ontology_file=ONTOLOGY_FILE, workers=workers,
+                                           graph_io=FakeGraphIO(driver), model_factory=model_factory)
+        started = time.perf_counter()
+        results = processor.run()
+        seconds = time.perf_counter() - started
+        baseline = baseline or seconds
+        failed = sum(r.status == "failed" for r in results)
+        batches = sum("UNWIND $rows" in statement for statement in driver.statements)
+        print(f"{workers:>8}{seconds:>10.2f}{baseline / seconds:>9.2f}{len(records) / seconds:>10.0f}"
+              f"{failed:>8}{batches:>15}")
+
+
+if __name__ == "__main__":
+    main()
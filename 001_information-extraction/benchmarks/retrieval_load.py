@@ -0,0 +1,139 @@
+"""
+Load test for the GraphRAG retrieval service
+
+Runs concurrent clients against src/graphrag_retrieval.py on an in-memory stand-in graph
+(fakes.InMemoryRetrievalGraph built from a synthetic corpus), once per configuration:
+- baseline: no caches, no batching (every query is embedded and sent on its own)
+- caches: query embedding and result LRU caches
+- caches+batching: caches, and concurrent queries share embedding calls and graph round trips
+
+Questions are drawn with a Zipf-like skew from a fixed pool, so popular questions repeat as
+they would on a dashboard. Halfway through each run a new ingestion run is recorded, which
+invalidates the cached results. Reports latency percentiles, throughput and cache hit rates.
+
+Usage:
+    python retrieval_load.py --clients 16 --requests 200 --latency 0.005
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+import numpy as np
+from rdflib import Graph
+
+from utils import chunk_text, get_classes_from_onto
+from graphrag_retrieval import GraphRetriever, record_ingestion_run
+from corpora import CORPUS_SIZES, risk_sentences, synthetic_text
+from fakes import FakeEmbeddingModel, InMemoryRetrievalGraph
+
+
+ONTOLOGY_FILE = BENCHMARKS_DIR.parent / "semantics" / "bizrisk.ttl"
+CONFIGURATIONS = {
+    "baseline": {"embedding_cache_size": 0, "result_cache_size": 0, "batch_window": 0.0},
+    "caches": {"batch_window": 0.0},
+    "caches+batching": {},
+}
+
+
+def build_graph(size: str, latency: float, latency_per_query: float) -> InMemoryRetrievalGraph:
+    """Chunks of a synthetic report with their embeddings; ontology labels found in a chunk are its entities"""
+    text = synthetic_text(CORPUS_SIZES[size], ONTOLOGY_FILE)
+    chunks = chunk_text(text, chunk_size=2000, overlap=200)
+    onto = Graph()
+    onto.parse(str(ONTOLOGY_FILE), format="turtle")
+    labels = get_classes_from_onto(onto)
+    entities = {i: [{"id": f"{label}:{i}", "labels": [label], "name": label, "risk_types": []}
+                    for label in labels if label.lower() in chunk.lower()]
+                for i, chunk in enumerate(chunks)}
+    return InMemoryRetrievalGraph(chunks, FakeEmbeddingModel().encode(chunks), entities,
+                                  latency=latency, latency_per_query=latency_per_query)
+
+
+def question_stream(n: int, pool: List[str], skew: float, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(pool) + 1) ** skew
+    return [pool[i] for i in rng.choice(len(pool), size=n, p=weights / weights.sum())]
+
+
+def run_load(retriever: GraphRetriever, graph: InMemoryRetrievalGraph, questions: List[str],
+             clients: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+    done = [0]
+    halfway = len(questions) // 2
+
+    def client(own: List[str]):
+        for question in own:
+            started = time.perf_counter()
+            retriever.retrieve(question)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                done[0] += 1
+                if done[0] == halfway:
+                    record_ingestion_run(graph, "load-test")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client, [questions[i::clients] for i in range(clients)]))
+    seconds = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    stats = retriever.cache_stats()
+    return {
+        "p50": float(np.percentile(ms, 50)), "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)), "max": float(ms.max()),
+        "qps": len(latencies) / seconds,
+        "embedding_hits": stats["embeddings"]["hit_rate"], "result_hits": stats["results"]["hit_rate"],
+        "graph_reads": graph.reads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="medium", choices=list(CORPUS_SIZES))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests in total")
+    parser.add_argument("--questions", type=int, default=200, help="distinct questions in the pool")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the question popularity")
+    parser.add_argument("--latency", type=float, default=0.005, help="graph round trip in seconds")
+    parser.add_argument("--latency-per-query", type=float, default=0.0005, help="graph seconds per query")
+    parser.add_argument("--embed-latency", type=float, default=0.004,
+                        help="model seconds per encode call (calls do not overlap, like a CPU-bound model)")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    sentences = risk_sentences(ONTOLOGY_FILE)
+    pool = [f"{sentences[i % len(sentences)]} ({i // len(sentences)})" for i in range(args.questions)]
+    questions = question_stream(args.requests, pool, args.skew, seed=7)
+
+    print(f"{args.requests} requests from {args.clients} clients, {args.questions} distinct questions, "
+          f"graph round trip {args.latency * 1000:.1f} ms\n")
+    print(f"{'configuration':<17}{'p50 ms':>8}{'p90 ms':>8}{'p99 ms':>8}{'max ms':>8}{'qps':>8}"
+          f"{'emb hit':>9}{'res hit':>9}{'reads':>7}")
+    for name in args.configs:
+        graph = build_graph(args.size, args.latency, args.latency_per_query)
+        model = FakeEmbeddingModel(latency_per_call=args.embed_latency, latency_per_text=args.embed_latency / 10,
+                                   exclusive=True)
+        retriever = GraphRetriever(graph_io=graph, similarity_model=model, run_id_ttl=0.05, **CONFIGURATIONS[name])
+        try:
+            r = run_load(retriever, graph, questions, args.clients)
+        finally:
+            retriever.close()
+            graph.close()
+        print(f"{name:<17}{r['p50']:>8.1f}{r['p90']:>8.1f}{r['p99']:>8.1f}{r['max']:>8.1f}{r['qps']:>8.0f}"
+              f"{r['embedding_hits']:>9.1%}{r['result_hits']:>9.1%}{r['graph_reads']:>7}")
+
+
+if __name__ == "__main__":
+    main()
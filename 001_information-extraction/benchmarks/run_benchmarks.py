@@ -0,0 +1,257 @@
+"""
+End-to-end benchmarks for the information extraction pipeline
+
+Times the stages of src/kg_construction_graphrag.py and src/kg_post_processing.py on synthetic
+corpora, without OpenAI, Neo4j or a downloaded embedding model (see fakes.py):
+- PDF text extraction (pypdf)
+- chunk_text
+- relevance filtering against the ontology embedding
+- get_schema_from_onto
+- knowledge graph extraction of the relevant text slices with SimpleKGPipeline, configured as in
+  kg_construction_graphrag.py (splitting, chunk embeddings, LLM extraction with FakeLLM and a
+  configurable latency, parsing and schema pruning, lexical graph), written to a RecordingDriver
+- RiskTaxonomyMapper mapping of RiskEvents to the SKOS taxonomy
+- Cypher write path of the mapper (RecordingDriver)
+
+Each run appends its results (duration, throughput, peak memory) together with the current git
+commit to results/history.jsonl and prints the change against the last run of another commit.
+
+Usage:
+    python run_benchmarks.py --sizes small medium --repeats 3 --llm-latency 0.05
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+import neo4j
+import numpy as np
+from neo4j_graphrag.experimental.components.text_splitters.fixed_size_splitter import FixedSizeSplitter
+from neo4j_graphrag.experimental.pipeline.kg_builder import SimpleKGPipeline
+from pypdf import PdfReader
+from rdflib import Graph
+
+from utils import chunk_text, filter_relevant_chunks, get_classes_from_onto, get_schema_from_onto
+from kg_post_processing import RiskEventNode, RiskTaxonomyMapper
+from embedding_store import SharedModelEmbeddings
+from instrumentation import PipelineMetrics, InstrumentedLLM, InstrumentedEmbedder
+from corpora import CORPUS_SIZES, synthetic_text, write_pdf
+from fakes import FakeEmbeddingModel, FakeGraphIO, FakeLLM, RecordingDriver, RecordingKGWriter
+
+
+ONTOLOGY_FILE = BENCHMARKS_DIR.parent / "semantics" / "bizrisk.ttl"
+RESULTS_FILE = BENCHMARKS_DIR / "results" / "history.jsonl"
+
+# Same settings as kg_construction_graphrag.py, except for the similarity threshold: the fake embeddings
+# score lower than all-MiniLM-L6-v2, so by default the median chunk similarity is used (half of the chunks pass)
+TOKENS_LIMIT = 10000
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+
+logger = logging.getLogger(__name__)
+
+
+def measure(fn: Callable[[], int], repeats: int) -> Dict[str, float]:
+    """Run fn `repeats` times (timing) and once more under tracemalloc (peak memory). fn returns the items processed."""
+    durations = []
+    items = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        items = fn()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = statistics.median(durations)
+    return {
+        "seconds": seconds,
+        "items": items,
+        "items_per_second": items / seconds if seconds else float("inf"),
+        "peak_mb": peak / 2**20,
+    }
+
+
+def quiet(fn: Callable[[], int]) -> Callable[[], int]:
+    """The pipeline functions print progress per chunk/statement; keep that out of the measurements' output"""
+    def wrapper() -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return wrapper
+
+
+def run_size(size: str, repeats: int, llm_latency: float, workdir: Path,
+             similarity_threshold: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+    text = synthetic_text(CORPUS_SIZES[size], ONTOLOGY_FILE)
+    pdf_path = write_pdf(text, workdir / f"{size}.pdf")
+
+    onto = Graph()
+    onto.parse(str(ONTOLOGY_FILE), format="turtle")
+    labels = get_classes_from_onto(onto)
+
+    model = FakeEmbeddingModel()
+    ontology_embedding = model.encode([" ".join(labels)])
+    chunks = chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    if similarity_threshold is None:
+        similarity_threshold = float(np.median(np.dot(model.encode(chunks), ontology_embedding.T)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        relevant_chunks = filter_relevant_chunks(chunks, model, ontology_embedding, similarity_threshold)
+    relevant_text = " ".join(chunk_info['content'] for chunk_info in relevant_chunks)
+    slices = [relevant_text[i:i + TOKENS_LIMIT] for i in range(0, len(relevant_text), TOKENS_LIMIT)]
+
+    driver = RecordingDriver()
+    mapper = RiskTaxonomyMapper(ontology_file=str(ONTOLOGY_FILE), neo4j_uri="", neo4j_user="", neo4j_password="",
+                                graph_io=FakeGraphIO(driver), similarity_model=model)
+    concepts = mapper.get_skos_concepts_from_scheme()
+    # one RiskEvent per relevant sentence-sized piece of text
+    risk_events = [RiskEventNode(neo4j_id=str(i), description=relevant_text[i * 300:(i + 1) * 300], properties={})
+                   for i in range(max(1, len(relevant_text) // 300))]
+    llm = FakeLLM(labels=labels, latency=llm_latency)
+    metrics = PipelineMetrics()
+    kg_writer = RecordingKGWriter(RecordingDriver())
+    # SimpleKGPipeline requires a neo4j.Driver; it never connects, since the writer is replaced and
+    # entity resolution is off
+    unconnected_driver = neo4j.GraphDatabase.driver("neo4j://localhost:7687", auth=("neo4j", "unused"))
+    kg_builder = SimpleKGPipeline(
+        llm=InstrumentedLLM(llm, metrics),
+        driver=unconnected_driver,
+        text_splitter=FixedSizeSplitter(chunk_size=2500, chunk_overlap=10),
+        embedder=InstrumentedEmbedder(SharedModelEmbeddings(model), metrics),
+        schema=get_schema_from_onto(onto, ["Risk", "Organization"]),
+        kg_writer=kg_writer,
+        perform_entity_resolution=False,
+        on_error="IGNORE",
+        from_pdf=False,
+    )
+
+    def pdf_extraction() -> int:
+        reader = PdfReader(pdf_path)
+        extracted = ""
+        for page in reader.pages:
+            extracted += page.extract_text()
+        return len(reader.pages)
+
+    def chunking() -> int:
+        return len(chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+
+    def relevance_filter() -> int:
+        filter_relevant_chunks(chunks, model, ontology_embedding, similarity_threshold)
+        return len(chunks)
+
+    def schema_from_onto() -> int:
+        schema = get_schema_from_onto(onto, ["Risk", "Organization"])
+        return len(schema.node_types)
+
+    def llm_extraction() -> int:
+        for text_slice in slices:
+            asyncio.run(kg_builder.run_async(text=text_slice))
+        return len(slices)
+
+    mapped_risks = []
+
+    def taxonomy_mapping() -> int:
+        mapped_risks[:] = mapper.create_mapped_risks(risk_events, concepts)
+        return len(risk_events)
+
+    def cypher_write() -> int:
+        statements = mapper.generate_cypher_statements(mapped_risks)
+        mapper.execute_cypher_statements(statements)
+        return len(mapped_risks)
+
+    benchmarks: List[Tuple[str, Callable[[], int]]] = [
+        ("pdf_extraction", pdf_extraction),
+        ("chunk_text", chunking),
+        ("relevance_filter", quiet(relevance_filter)),
+        ("get_schema_from_onto", schema_from_onto),
+        ("llm_extraction", llm_extraction),
+        ("taxonomy_mapping", quiet(taxonomy_mapping)),
+        ("cypher_write", quiet(cypher_write)),
+    ]
+
+    results = {}
+    try:
+        for name, fn in benchmarks:
+            results[name] = measure(fn, repeats)
+            r = results[name]
+            print(f"  {name:22s} {r['seconds'] * 1000:10.2f} ms  {r['items_per_second']:12.1f} items/s  "
+                  f"{r['peak_mb']:8.2f} MB peak  ({r['items']} items)")
+    finally:
+        unconnected_driver.close()
+    if not kg_writer.entities:
+        logger.warning("llm_extraction: SimpleKGPipeline wrote no entities, check the FakeLLM labels against the schema")
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_results(commit: str, size: str) -> Tuple[str, Dict]:
+    """Last recorded results for the corpus size from another commit"""
+    if not RESULTS_FILE.exists():
+        return "", {}
+    last_commit, last_results = "", {}
+    for line in RESULTS_FILE.read_text(encoding="utf-8").splitlines():
+        entry = json.loads(line)
+        if entry["size"] == size and entry["commit"] != commit:
+            last_commit, last_results = entry["commit"], entry["results"]
+    return last_commit, last_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(CORPUS_SIZES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--similarity-threshold", type=float, default=None,
+                        help="relevance filter threshold (default: median chunk similarity)")
+    parser.add_argument("--no-record", action="store_true", help="do not append the results to the history")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    commit = current_commit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            print(f"\nCorpus '{size}' ({CORPUS_SIZES[size]:,} characters), commit {commit}")
+            results = run_size(size, args.repeats, args.llm_latency, Path(tmp), args.similarity_threshold)
+
+            last_commit, last_results = previous_results(commit, size)
+            if last_results:
+                print(f"  Change against {last_commit}:")
+                for name, r in results.items():
+                    if name in last_results and last_results[name]["seconds"]:
+                        change = (r["seconds"] / last_results[name]["seconds"] - 1) * 100
+                        print(f"    {name:20s} {change:+7.1f} % time")
+
+            if not args.no_record:
+                RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+                with RESULTS_FILE.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps({"commit": commit, "timestamp": datetime.now().isoformat(),
+                                        "size": size, "repeats": args.repeats,
+                                        "llm_latency": args.llm_latency, "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Check of the incremental SHACL validation
+
+Runs src/shacl_validation.py on a RecordingDriver that returns an exported subgraph of three
+chunks: one whose RiskEvent is linked to a Risk of the taxonomy, one whose RiskEvent is linked
+to a Risk outside the taxonomy, and one without a linked Risk. The first has to conform, the
+second has to report a violation, and all three have to be marked as validated - the third
+without a result, since it has no focus node. Linking a Risk to a RiskEvent later (the writes
+of RiskTaxonomyMapper) has to clear the mark of its chunks. Exits with status 1 if a check fails.
+
+Usage:
+    python shacl_check.py
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+from shacl_validation import IncrementalShaclValidator
+from kg_post_processing import MappedRisk, RiskTaxonomyMapper
+from fakes import FakeEmbeddingModel, FakeGraphIO, RecordingDriver
+
+
+SEMANTICS_DIR = BENCHMARKS_DIR.parent / "semantics"
+
+
+def risk_event_record(chunk: str, index: int, risk_type: str = None):
+    rels = []
+    if risk_type:
+        rels.append({"type": "materializedIn", "outgoing": False, "id": f"risk-{risk_type}", "labels": ["Risk"],
+                     "props": {"type": risk_type, "description": f"{risk_type} risk"}})
+    return {"chunk_id": chunk, "chunk_index": index, "id": f"event-{chunk}", "labels": ["RiskEvent"],
+            "props": {"description": "rising interest rates"}, "rels": rels}
+
+
+def main():
+    logging.disable(logging.INFO)
+    records = [risk_event_record("conforming", 0, "EconomicVolatility"),
+               risk_event_record("violating", 1, "MadeUpRisk"),
+               risk_event_record("unlinked", 2)]
+    driver = RecordingDriver(responses={"MATCH (c:Chunk) WHERE c.shaclValidated IS NULL": records})
+    validator = IncrementalShaclValidator(driver, ontology_file=SEMANTICS_DIR / "bizrisk.ttl",
+                                          shapes_file=SEMANTICS_DIR / "shapes.ttl")
+    reports = {r.chunk_id: r for r in validator.validate_new_chunks()}
+    marked = {row["chunk_id"]: row for p in driver.parameters for row in p.get("rows", [])}
+
+    # a Risk linked by the post-processing after the validation
+    link_driver = RecordingDriver()
+    mapper = RiskTaxonomyMapper(ontology_file=str(SEMANTICS_DIR / "bizrisk.ttl"), neo4j_uri="", neo4j_user="",
+                                neo4j_password="", graph_io=FakeGraphIO(link_driver),
+                                similarity_model=FakeEmbeddingModel())
+    mapper.write_mapped_risk(MappedRisk(neo4j_id="1", description="", skos_type="EconomicVolatility",
+                                        ancestors=["FinancialRisk"])).result()
+
+    checks = {
+        "Risk of the taxonomy conforms": reports["conforming"].focus_nodes == 1 and reports["conforming"].conforms,
+        "Risk outside the taxonomy violates the shapes": not reports["violating"].conforms,
+        "chunk without focus nodes has no result": reports["unlinked"].focus_nodes == 0,
+        "all exported chunks are marked": set(marked) == {"conforming", "violating", "unlinked"},
+        "chunk without focus nodes is marked without a result":
+            marked["unlinked"]["focus_nodes"] == 0 and marked["unlinked"]["conforms"] is None,
+        "linking a Risk clears the mark of the RiskEvent's chunks":
+            any("SET chunk.shaclValidated = NULL" in statement for statement in link_driver.statements),
+    }
+    for name, passed in checks.items():
+        print(f"{'✓' if passed else '✗'} {name}")
+    for violation in reports["violating"].violations:
+        print(f"    {violation}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""
+Bulk CSV Export for neo4j-admin import
+
+Export mode of the extraction pipeline for initial loads of a large corpus: instead of
+MERGE-ing into a live database, the extraction (SimpleKGPipeline), the taxonomy mapping and
+the company linking write node and relationship CSV files in the format of
+
+    neo4j-admin database import full <database> --nodes=... --relationships=...
+
+which loads them offline, without transactions.
+
+- Nodes get stable IDs: chunks from the document and their text, entities from their label and
+  resolve property (`name`, like the resolver of SimpleKGPipeline, and the inverse functional
+  properties of the ontology), Risk nodes from their taxonomy type, companies from their name.
+  The same entity extracted from several chunks or documents becomes one node.
+- Relationships are deduplicated by start node, type and end node.
+- One CSV file per label and per relationship type, with typed headers
+  (`:ID`, `:LABEL`, `name:string`, `index:int`, `embedding:float[]`, `:START_ID`, `:END_ID`, `:TYPE`).
+- Chunk nodes (text and embedding) are streamed to their file, only entities are kept in memory.
+
+The import command is written to import.sh in the output directory.
+
+Usage:
+    python bulk_export.py reports/*.pdf --output export --companies companies.json
+
+Requirements:
+- pypdf for text extraction
+- sentence-transformers for the relevance filter and the taxonomy mapping
+- neo4j-graphrag for the extraction (the Neo4j driver is required by SimpleKGPipeline but not used)
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from time import sleep
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from pydantic import validate_call
+from pypdf import PdfReader
+from neo4j import GraphDatabase
+from neo4j_graphrag.experimental.components.kg_writer import KGWriter, KGWriterModel
+from neo4j_graphrag.experimental.components.text_splitters.fixed_size_splitter import FixedSizeSplitter
+from neo4j_graphrag.experimental.components.types import LexicalGraphConfig, Neo4jGraph
+from neo4j_graphrag.experimental.pipeline.kg_builder import SimpleKGPipeline
+from neo4j_graphrag.llm.openai_llm import OpenAILLM
+from rdflib import Graph
+
+from utils import get_schema_from_onto, get_pkeys, get_classes_from_onto, chunk_text, filter_relevant_chunks
+from kg_post_processing import RiskEventNode, RiskTaxonomyMapper
+from embedding_store import SharedModelEmbeddings, get_similarity_model
+
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+BASE_DIR = Path(__file__).resolve().parents[1]
+ONTOLOGY_FILE = BASE_DIR / "semantics" / "bizrisk.ttl"
+EXPORT_DIR = BASE_DIR / "export"
+
+SIMILARITY_THRESHOLD = 0.42  # (0.0 = no similarity, 1.0 = identical)
+TOKENS_LIMIT = 10000  # Max tokens for OpenAI API
+SLICE_PAUSE_SECONDS = 60  # pause between LLM slices (rate limit)
+
+ARRAY_DELIMITER = "|"  # passed to neo4j-admin; ';' (the default) is common in extracted texts
+ENTITY_LABEL = "__Entity__"  # added to extracted entities, like the Neo4jWriter of neo4j_graphrag
+RESOLVE_PROPERTY = "name"  # property the default resolver of SimpleKGPipeline merges entities on
+CHUNK_PROPERTIES = [("text", "string"), ("index", "int"), ("embedding", "float[]")]
+
+
+@dataclass
+class ExportNode:
+    labels: Set[str]
+    properties: Dict[str, Any]
+
+
+@dataclass
+class ExportStats:
+    nodes: int = 0
+    duplicate_nodes: int = 0
+    relationships: int = 0
+    duplicate_relationships: int = 0
+    dangling_relationships: int = 0
+    files: List[str] = field(default_factory=list)
+
+
+def stable_id(prefix: str, *parts: Any) -> str:
+    """Deterministic node ID: the same parts give the same ID in every run"""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f"{prefix}-{digest}"
+
+
+def csv_type(values: Iterable[Any]) -> str:
+    """neo4j-admin header type for the values of one property column"""
+    kinds = set()
+    array = False
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            array = True
+            kinds.update(type(item) for item in value)
+        else:
+            kinds.add(type(value))
+    if kinds == {bool}:
+        kind = "boolean"
+    elif kinds and kinds <= {int}:
+        kind = "long"
+    elif kinds and kinds <= {int, float}:
+        kind = "double"
+    else:
+        kind = "string"
+    return kind + "[]" if array else kind
+
+
+def csv_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return ARRAY_DELIMITER.join(csv_value(item) for item in value)
+    return str(value)
+
+
+class CsvGraphExporter:
+    def __init__(self, output_dir: Path):
+        """Collect nodes and relationships for neo4j-admin import in the output directory"""
+        self.output_dir = output_dir
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._nodes: Dict[str, ExportNode] = {}
+        self._relationships: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = defaultdict(dict)
+        self._streamed_ids: Set[str] = set()
+        self._chunk_file = None
+        self._chunk_writer = None
+        self.stats = ExportStats()
+
+    def add_node(self, node_id: str, labels: Iterable[str], properties: Dict[str, Any]) -> str:
+        """Add a node; for an existing ID the labels are merged and missing properties are added"""
+        properties = {k: v for k, v in properties.items() if v is not None}
+        existing = self._nodes.get(node_id)
+        if existing is None:
+            self._nodes[node_id] = ExportNode(labels=set(labels), properties=properties)
+            self.stats.nodes += 1
+        else:
+            existing.labels.update(labels)
+            for name, value in properties.items():
+                existing.properties.setdefault(name, value)
+            self.stats.duplicate_nodes += 1
+        return node_id
+
+    def stream_chunk(self, node_id: str, properties: Dict[str, Any]) -> str:
+        """Write a Chunk node straight to its file (fixed header), so texts and embeddings are not kept in memory"""
+        if node_id in self._streamed_ids:
+            self.stats.duplicate_nodes += 1
+            return node_id
+        if self._chunk_writer is None:
+            path = self.output_dir / "nodes_Chunk.csv"
+            self._chunk_file = open(path, "w", newline="", encoding="utf-8")
+            self._chunk_writer = csv.writer(self._chunk_file)
+            self._chunk_writer.writerow([":ID", ":LABEL"] + [f"{name}:{kind}" for name, kind in CHUNK_PROPERTIES])
+            self.stats.files.append(path.name)
+        self._chunk_writer.writerow([node_id, "Chunk"] + [csv_value(properties.get(name)) for name, _ in CHUNK_PROPERTIES])
+        self._streamed_ids.add(node_id)
+        self.stats.nodes += 1
+        return node_id
+
+    def add_relationship(self, start_id: str, rel_type: str, end_id: str, properties: Optional[Dict[str, Any]] = None):
+        rows = self._relationships[rel_type]
+        if (start_id, end_id) in rows:
+            self.stats.duplicate_relationships += 1
+            return
+        rows[(start_id, end_id)] = {k: v for k, v in (properties or {}).items() if v is not None}
+        self.stats.relationships += 1
+
+    def nodes_with_label(self, label: str) -> Dict[str, ExportNode]:
+        return {node_id: node for node_id, node in self._nodes.items() if label in node.labels}
+
+    def _has_node(self, node_id: str) -> bool:
+        return node_id in self._nodes or node_id in self._streamed_ids
+
+    def _write_nodes(self) -> List[str]:
+        # one file per primary label, so that every file has the properties of one kind of node
+        by_label: Dict[str, List[Tuple[str, ExportNode]]] = defaultdict(list)
+        for node_id, node in self._nodes.items():
+            primary = sorted(label for label in node.labels if label != ENTITY_LABEL) or [ENTITY_LABEL]
+            by_label[primary[0]].append((node_id, node))
+
+        files = []
+        for label, nodes in sorted(by_label.items()):
+            names = sorted({name for _, node in nodes for name in node.properties})
+            types = {name: csv_type(node.properties.get(name) for _, node in nodes) for name in names}
+            path = self.output_dir / f"nodes_{label}.csv"
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([":ID", ":LABEL"] + [f"{name}:{types[name]}" for name in names])
+                for node_id, node in nodes:
+                    writer.writerow([node_id, ARRAY_DELIMITER.join(sorted(node.labels))]
+                                    + [csv_value(node.properties.get(name)) for name in names])
+            files.append(path.name)
+        return files
+
+    def _write_relationships(self) -> List[str]:
+        files = []
+        for rel_type, rows in sorted(self._relationships.items()):
+            valid = {key: props for key, props in rows.items() if self._has_node(key[0]) and self._has_node(key[1])}
+            self.stats.dangling_relationships += len(rows) - len(valid)
+            if not valid:
+                continue
+            names = sorted({name for props in valid.values() for name in props})
+            types = {name: csv_type(props.get(name) for props in valid.values()) for name in names}
+            path = self.output_dir / f"relationships_{rel_type}.csv"
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([":START_ID", ":END_ID", ":TYPE"] + [f"{name}:{types[name]}" for name in names])
+                for (start_id, end_id), props in valid.items():
+                    writer.writerow([start_id, end_id, rel_type] + [csv_value(props.get(name)) for name in names])
+            files.append(path.name)
+        return files
+
+    def import_command(self, database: str = "neo4j") -> str:
+        nodes = " ".join(f"--nodes={name}" for name in self.stats.files if name.startswith("nodes_"))
+        relationships = " ".join(f"--relationships={name}" for name in self.stats.files if name.startswith("relationships_"))
+        # chunk texts span several lines, which the importer only accepts with --multiline-fields
+        return (f"neo4j-admin database import full {database} --overwrite-destination "
+                f"--array-delimiter=\"{ARRAY_DELIMITER}\" --multiline-fields=true {nodes} {relationships}")
+
+    def write(self, database: str = "neo4j") -> Path:
+        """Write the node and relationship files and the import script; returns the script path"""
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+            self._chunk_file, self._chunk_writer = None, None
+        self.stats.files += self._write_nodes()
+        self.stats.files += self._write_relationships()
+        script = self.output_dir / "import.sh"
+        script.write_text("#!/bin/sh\n# run in this directory, with the database stopped\n"
+                          f"{self.import_command(database)}\n", encoding="utf-8")
+        logger.info(f"Exported {self.stats.nodes} nodes and {self.stats.relationships} relationships to {self.output_dir} "
+                    f"({self.stats.duplicate_nodes} duplicate nodes and {self.stats.duplicate_relationships} duplicate "
+                    f"relationships merged, {self.stats.dangling_relationships} relationships without nodes dropped)")
+        return script
+
+
+class CsvKGWriter(KGWriter):
+    """KGWriter for SimpleKGPipeline that adds the extracted graph to a CsvGraphExporter instead of Neo4j"""
+
+    def __init__(self, exporter: CsvGraphExporter, document: str, resolve_properties: List[str]):
+        self.exporter = exporter
+        self.document = document
+        self.resolve_properties = resolve_properties
+        self.entity_ids: Set[str] = set()  # entities extracted from this document
+
+    def entity_id(self, label: str, properties: Dict[str, Any]) -> str:
+        for name in self.resolve_properties:
+            if properties.get(name) is not None:
+                return stable_id(label, name, properties[name])
+        return stable_id(label, json.dumps(properties, sort_keys=True, default=str))
+
+    @validate_call
+    async def run(self, graph: Neo4jGraph, lexical_graph_config: LexicalGraphConfig = LexicalGraphConfig()) -> KGWriterModel:
+        ids: Dict[str, str] = {}
+        for node in graph.nodes:
+            properties = {**node.properties, **(node.embedding_properties or {})}
+            if node.label == lexical_graph_config.chunk_node_label:
+                node_id = stable_id("Chunk", self.document, properties.get("index"), properties.get("text"))
+                ids[node.id] = self.exporter.stream_chunk(node_id, properties)
+            elif node.label in lexical_graph_config.lexical_graph_node_labels:
+                ids[node.id] = self.exporter.add_node(stable_id(node.label, self.document), [node.label], properties)
+            else:
+                node_id = self.entity_id(node.label, node.properties)
+                ids[node.id] = self.exporter.add_node(node_id, [node.label, ENTITY_LABEL], properties)
+                self.entity_ids.add(node_id)
+
+        for rel in graph.relationships:
+            if rel.start_node_id in ids and rel.end_node_id in ids:
+                self.exporter.add_relationship(ids[rel.start_node_id], rel.type, ids[rel.end_node_id], rel.properties)
+        return KGWriterModel(status="SUCCESS",
+                             metadata={"node_count": len(graph.nodes), "relationship_count": len(graph.relationships)})
+
+
+def export_taxonomy_mapping(exporter: CsvGraphExporter, mapper: RiskTaxonomyMapper) -> int:
+    """
+    Map the exported RiskEvent nodes to the risk taxonomy and export the Risk nodes and
+    materializedIn relationships, like RiskTaxonomyMapper.run_complete_mapping does in Neo4j
+    """
+    concepts = mapper.get_skos_concepts_from_scheme()
+    risk_events = [RiskEventNode(neo4j_id=node_id, description=node.properties.get('hasRiskEventDescription', ''),
+                                 properties=node.properties)
+                   for node_id, node in exporter.nodes_with_label("RiskEvent").items()]
+    if not concepts or not risk_events:
+        logger.warning(f"Nothing to map: {len(concepts)} concepts, {len(risk_events)} RiskEvent nodes")
+        return 0
+
+    def risk_node(risk_type: str, properties: Dict[str, Any]) -> str:
+        properties = {"type": risk_type, "uuid": str(uuid.uuid5(uuid.NAMESPACE_URL, risk_type)), **properties}
+        return exporter.add_node(stable_id("Risk", risk_type), ["Risk"], properties)
+
+    mapped_risks = mapper.create_mapped_risks(risk_events, concepts)
+    for mapped_risk in mapped_risks:
+        risk_id = risk_node(mapped_risk.skos_type, {"description": mapped_risk.description,
+                                                     "ancestors": mapped_risk.ancestors})
+        exporter.add_relationship(risk_id, "materializedIn", mapped_risk.neo4j_id)
+        if mapper.attach_to_ancestors:
+            for ancestor in mapped_risk.ancestors:
+                exporter.add_relationship(risk_node(ancestor, {}), "materializedIn", mapped_risk.neo4j_id)
+    return len(mapped_risks)
+
+
+def export_company_links(exporter: CsvGraphExporter, company_name: str, entity_ids: Iterable[str], processing_date: str):
+    """Export the Company node and its occursFor relationships from the RiskEvents of its documents"""
+    company_id = exporter.add_node(stable_id("Company", company_name), ["Company"], {"name": company_name})
+    risk_events = exporter.nodes_with_label("RiskEvent")
+    for node_id in entity_ids:
+        if node_id in risk_events:
+            exporter.add_relationship(node_id, "occursFor", company_id, {"date": processing_date})
+
+
+class BulkExtractionExporter:
+    def __init__(self, output_dir: Path, ontology_file: Path = ONTOLOGY_FILE, pause_seconds: float = SLICE_PAUSE_SECONDS):
+        """Set up extraction components that write to CSV files instead of Neo4j"""
+        self.exporter = CsvGraphExporter(output_dir)
+        self.ontology_file = ontology_file
+        self.pause_seconds = pause_seconds
+        self.ontology = Graph()
+        self.ontology.parse(str(ontology_file), format="turtle")
+        self.resolve_properties = [RESOLVE_PROPERTY] + get_pkeys(self.ontology)
+        self.schema = get_schema_from_onto(self.ontology, ["Risk", "Organization"])
+        self.similarity_model = get_similarity_model()
+        self.ontology_embedding = self.similarity_model.encode([" ".join(get_classes_from_onto(self.ontology))])
+        self.embedder = SharedModelEmbeddings(self.similarity_model)
+        self.llm = OpenAILLM(
+            model_name="gpt-4o",
+            model_params={
+                "max_tokens": 10000,
+                "response_format": {"type": "json_object"},
+                "temperature": 0,
+            },
+        )
+        self.entities_by_document: Dict[str, Set[str]] = {}
+
+    def relevant_slices(self, document: Path) -> List[str]:
+        reader = PdfReader(document)
+        text = "".join(page.extract_text() for page in reader.pages)
+        chunks = chunk_text(text, chunk_size=2000, overlap=200)
+        relevant_chunks = filter_relevant_chunks(chunks, self.similarity_model, self.ontology_embedding,
+                                                 SIMILARITY_THRESHOLD)
+        relevant_text = " ".join(chunk_info['content'] for chunk_info in relevant_chunks)
+        return [relevant_text[start:start + TOKENS_LIMIT] for start in range(0, len(relevant_text), TOKENS_LIMIT)]
+
+    def extract(self, document: Path):
+        writer = CsvKGWriter(self.exporter, document.name, self.resolve_properties)
+        slices = self.relevant_slices(document)
+        # SimpleKGPipeline requires a neo4j.Driver; it never connects, since the writer is replaced and
+        # entity resolution is done by the stable IDs of the export
+        with GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)) as driver:
+            kg_builder = SimpleKGPipeline(
+                llm=self.llm,
+                driver=driver,
+                text_splitter=FixedSizeSplitter(chunk_size=2500, chunk_overlap=10),
+                embedder=self.embedder,
+                schema=self.schema,
+                kg_writer=writer,
+                perform_entity_resolution=False,
+                on_error="IGNORE",
+                from_pdf=False,
+            )
+            for i, text_slice in enumerate(slices):
+                logger.info(f"{document.name}: slice {i + 1}/{len(slices)} ({len(text_slice)} characters)")
+                asyncio.run(kg_builder.run_async(text=text_slice))
+                if self.pause_seconds and i < len(slices) - 1:
+                    sleep(self.pause_seconds)
+        self.entities_by_document[document.name] = writer.entity_ids
+
+    def map_and_link(self, companies: Dict[str, str]):
+        # the mapper only classifies here, so it never opens its graph I/O
+        mapper = RiskTaxonomyMapper(
+            ontology_file=str(self.ontology_file),
+            neo4j_uri=NEO4J_URI,
+            neo4j_user=NEO4J_USERNAME,
+            neo4j_password=NEO4J_PASSWORD,
+            similarity_model=self.similarity_model,
+        )
+        mapped = export_taxonomy_mapping(self.exporter, mapper)
+        logger.info(f"Mapped {mapped} RiskEvent nodes to the risk taxonomy")
+
+        processing_date = datetime.today().strftime('%Y-%m-%d')
+        entities_by_company: Dict[str, Set[str]] = defaultdict(set)
+        for document, entity_ids in self.entities_by_document.items():
+            if companies.get(document):
+                entities_by_company[companies[document]].update(entity_ids)
+        for company_name, entity_ids in entities_by_company.items():
+            export_company_links(self.exporter, company_name, entity_ids, processing_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract documents into CSV files for neo4j-admin database import")
+    parser.add_argument("documents", nargs="+", type=Path, help="PDF files or directories of PDF files")
+    parser.add_argument("--output", type=Path, default=EXPORT_DIR)
+    parser.add_argument("--company", default=os.getenv('COMPANY_NAME'), help="company of all documents")
+    parser.add_argument("--companies", type=Path, help="JSON file mapping document file names to companies")
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--pause", type=float, default=SLICE_PAUSE_SECONDS, help="seconds between LLM slices")
+    args = parser.parse_args()
+
+    documents = [pdf for path in args.documents for pdf in (sorted(path.glob("*.pdf")) if path.is_dir() else [path])]
+    companies = json.loads(args.companies.read_text(encoding="utf-8")) if args.companies else {}
+    companies = {document.name: companies.get(document.name, args.company) for document in documents}
+
+    bulk = BulkExtractionExporter(args.output, pause_seconds=args.pause)
+    for i, document in enumerate(documents, 1):
+        logger.info(f"Extracting document {i}/{len(documents)}: {document}")
+        try:
+            bulk.extract(document)
+        except Exception as e:
+            logger.error(f"Error extracting {document}, continuing with the next document: {e}")
+    bulk.map_and_link(companies)
+    script = bulk.exporter.write(args.database)
+    print(f"\nImport with (database stopped): cd {args.output} && sh {script.name}")
+
+
+if __name__ == "__main__":
+    main()
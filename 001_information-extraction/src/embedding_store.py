@@ -0,0 +1,190 @@
+"""
+Compact Embeddings
+
+Storage and inference for the all-MiniLM-L6-v2 embeddings used by the relevance filter, the
+taxonomy mapper and the GraphRAG embedder.
+
+- EmbeddingStore: embeddings as float16 (2x smaller than float32) or int8 with one scale per
+  vector (4x smaller), saved as .npy files that are memory-mapped when opened. Similarities
+  are computed block-wise on the codes, so the float32 matrix is never materialized.
+- get_similarity_model: one SentenceTransformer per process, optionally with a faster CPU
+  backend: dynamic int8 quantization of the linear layers (torch), or ONNX Runtime with the
+  float32 or the int8 quantized ONNX export of the model.
+- SharedModelEmbeddings: neo4j_graphrag embedder on top of the shared model, so SimpleKGPipeline
+  does not load a second copy.
+
+The effect on the SKOS mapping is measured by benchmarks/embedding_accuracy.py.
+
+Usage:
+    store = EmbeddingStore.save(Path("chunks"), embeddings, dtype="int8")
+    scores = EmbeddingStore.open(Path("chunks")).dot(ontology_embedding[0])
+
+Requirements:
+- numpy for the storage
+- sentence-transformers for the model (optimum[onnxruntime] for the ONNX backends)
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from neo4j_graphrag.embeddings.base import Embedder
+
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_MODEL = "all-MiniLM-L6-v2"
+DTYPES = ("float32", "float16", "int8")
+INT8_MAX = 127
+BLOCK_ROWS = 65536  # rows dequantized at once when computing similarities
+
+# Inference backends of the shared model; EMBEDDING_BACKEND in .env selects one
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"  # quantized export published with the model
+
+
+def quantize(embeddings: np.ndarray, dtype: str):
+    """Codes and per-vector scales (None unless int8) of a float matrix"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float32":
+        return embeddings, None
+    if dtype == "float16":
+        return embeddings.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=1) / INT8_MAX
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -INT8_MAX, INT8_MAX).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {DTYPES}")
+
+
+class EmbeddingStore:
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], dtype: str,
+                 keys: Optional[List[str]] = None, model: Optional[str] = None):
+        """Quantized embeddings; use from_array, save or open to create one"""
+        self.codes = codes
+        self.scales = scales
+        self.dtype = dtype
+        self.keys = keys
+        self.model = model
+        self._index = {key: i for i, key in enumerate(keys)} if keys else {}
+
+    @classmethod
+    def from_array(cls, embeddings: np.ndarray, dtype: str = "int8", keys: Optional[List[str]] = None,
+                   model: Optional[str] = None) -> "EmbeddingStore":
+        codes, scales = quantize(embeddings, dtype)
+        return cls(codes, scales, dtype, keys, model)
+
+    @staticmethod
+    def _paths(path: Path) -> Dict[str, Path]:
+        return {"codes": path.with_suffix(".npy"), "scales": path.with_suffix(".scales.npy"),
+                "meta": path.with_suffix(".json")}
+
+    @classmethod
+    def save(cls, path: Path, embeddings: np.ndarray, dtype: str = "int8", keys: Optional[List[str]] = None,
+             model: Optional[str] = None) -> "EmbeddingStore":
+        """Quantize and write the embeddings to <path>.npy (+ .scales.npy for int8, .json metadata)"""
+        store = cls.from_array(embeddings, dtype, keys, model)
+        paths = cls._paths(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(paths["codes"], store.codes)
+        if store.scales is not None:
+            np.save(paths["scales"], store.scales)
+        paths["meta"].write_text(json.dumps({"dtype": dtype, "shape": list(store.codes.shape),
+                                             "model": model, "keys": keys}), encoding="utf-8")
+        return store
+
+    @classmethod
+    def open(cls, path: Path) -> "EmbeddingStore":
+        """Memory-map stored embeddings; only the pages that are used are read"""
+        paths = cls._paths(path)
+        meta = json.loads(paths["meta"].read_text(encoding="utf-8"))
+        codes = np.load(paths["codes"], mmap_mode="r")
+        scales = np.load(paths["scales"]) if meta["dtype"] == "int8" else None
+        return cls(codes, scales, meta["dtype"], meta.get("keys"), meta.get("model"))
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.codes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Dequantized float32 rows (index, slice or index array)"""
+        block = np.asarray(self.codes[rows], dtype=np.float32)
+        if self.scales is not None:
+            scales = self.scales[rows]
+            block = block * (scales[..., None] if block.ndim > 1 else scales)
+        return block
+
+    def vector(self, key: str) -> np.ndarray:
+        return self[self._index[key]]
+
+    def dot(self, queries: np.ndarray) -> np.ndarray:
+        """Similarities of all stored vectors with one query (n,) or several queries (n, k)"""
+        queries = np.asarray(queries, dtype=np.float32)
+        transposed = queries.T if queries.ndim > 1 else queries
+        results = []
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + BLOCK_ROWS], dtype=np.float32) @ transposed
+            if self.scales is not None:
+                scales = self.scales[start:start + BLOCK_ROWS]
+                block = block * (scales[:, None] if block.ndim > 1 else scales)
+            results.append(block)
+        if not results:
+            return np.zeros((0,) + transposed.shape[1:], dtype=np.float32)
+        return np.concatenate(results)
+
+
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+
+
+def _load_model(model_name: str, backend: str):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "torch-int8":
+        import torch
+
+        model = SentenceTransformer(model_name, device="cpu")
+        # int8 weights for the linear layers (most of the compute of a MiniLM), activations stay float
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": ONNX_INT8_FILE})
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+
+def get_similarity_model(backend: Optional[str] = None, model_name: str = SIMILARITY_MODEL):
+    """SentenceTransformer shared by all stages of the process, loaded once per backend"""
+    backend = backend or os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND)
+    key = f"{model_name}:{backend}"
+    with _models_lock:
+        if key not in _models:
+            _models[key] = _load_model(model_name, backend)
+            logger.info(f"Loaded embedding model {model_name} with backend '{backend}'")
+        return _models[key]
+
+
+class SharedModelEmbeddings(Embedder):
+    """neo4j_graphrag embedder using the shared similarity model"""
+
+    def __init__(self, model=None, backend: Optional[str] = None):
+        self.model = model or get_similarity_model(backend)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode([text])[0].tolist()
@@ -0,0 +1,379 @@
+"""
+GraphRAG Retrieval
+
+Serving path for question answering over the knowledge graph built by SimpleKGPipeline:
+vector search over the Chunk embeddings, then the entities extracted from the found chunks
+(FROM_CHUNK) and the taxonomy types of the risks materialized in them.
+
+- Query embeddings are kept in an LRU cache, so repeated questions are not embedded again.
+- Results are kept in an LRU cache keyed by the ingestion run id: every run of the pipeline
+  records an IngestionRun node, and results of older runs are dropped once a newer run is seen.
+- Several queries are embedded in one model call and retrieved in one Cypher query (UNWIND);
+  concurrent retrieve() calls are collected into such batches within a few milliseconds.
+
+Latencies are recorded in PipelineMetrics ("retrieval" per query); benchmarks/retrieval_load.py
+measures the percentiles under concurrent load against an in-memory stand-in graph.
+
+Usage:
+    retriever = GraphRetriever()
+    retriever.ensure_vector_index()
+    result = retriever.retrieve("Which supply chain risks were reported?")
+    results = retriever.retrieve_many(["cyberattack", "supplier bankruptcy"])
+
+Requirements:
+- neo4j (5.13+ for vector indexes)
+- sentence-transformers for the query embeddings (the model of the chunk embeddings)
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_store import get_similarity_model
+from instrumentation import PipelineMetrics
+from neo4j_connection import GraphIO, close_drivers, get_graph_io
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+
+VECTOR_INDEX = "chunk_embeddings"
+EMBEDDING_DIMENSIONS = 384  # all-MiniLM-L6-v2
+TOP_K = 5
+MAX_ENTITIES = 10  # per chunk
+EMBEDDING_CACHE_SIZE = 10000
+RESULT_CACHE_SIZE = 2000
+RUN_ID_TTL_SECONDS = 5.0  # how long the latest ingestion run id is trusted before it is read again
+BATCH_WINDOW_SECONDS = 0.002  # concurrent queries arriving within this window share one batch
+MAX_BATCH = 32
+MAX_BATCHES_IN_FLIGHT = 4
+
+CREATE_INDEX_QUERY = f"""
+CREATE VECTOR INDEX {VECTOR_INDEX} IF NOT EXISTS FOR (chunk:Chunk) ON chunk.embedding
+OPTIONS {{indexConfig: {{`vector.dimensions`: {EMBEDDING_DIMENSIONS}, `vector.similarity_function`: 'cosine'}}}}
+"""
+
+RETRIEVAL_QUERY = """
+UNWIND $queries AS query
+CALL db.index.vector.queryNodes($index, $top_k, query.embedding) YIELD node AS chunk, score
+OPTIONAL MATCH (entity)-[:FROM_CHUNK]->(chunk)
+OPTIONAL MATCH (risk:Risk)-[:materializedIn]->(entity)
+WITH query, chunk, score, entity, collect(DISTINCT risk.type) AS risk_types
+WITH query, chunk, score,
+     collect(CASE WHEN entity IS NOT NULL THEN {
+         id: elementId(entity), labels: [l IN labels(entity) WHERE l <> '__Entity__'],
+         name: entity.name, risk_types: risk_types} END)[..$max_entities] AS entities
+RETURN query.id AS query, elementId(chunk) AS chunk_id, chunk.text AS text, score, entities
+ORDER BY query, score DESC
+"""
+
+LATEST_RUN_QUERY = """
+MATCH (run:IngestionRun)
+RETURN run.id AS run_id ORDER BY run.completed_at DESC LIMIT 1
+"""
+
+# RiskEvents written since the previous run are stamped with the run (partitions of the post-processing)
+RECORD_RUN_QUERY = """
+MERGE (run:IngestionRun {id: $run_id})
+SET run.document = $document, run.completed_at = datetime()
+WITH run
+OPTIONAL MATCH (risk_event:RiskEvent) WHERE risk_event.ingestion_run IS NULL
+SET risk_event.ingestion_run = run.id
+RETURN run.id AS run_id, count(risk_event) AS risk_events
+"""
+
+
+def record_ingestion_run(graph_io: GraphIO, document: str, run_id: Optional[str] = None) -> str:
+    """Mark the end of an ingestion; retrieval results cached before it become stale"""
+    run_id = run_id or uuid.uuid4().hex
+    graph_io.write(RECORD_RUN_QUERY, {"run_id": run_id, "document": document}).result()
+    logger.info(f"Recorded ingestion run {run_id} ({document})")
+    return run_id
+
+
+@dataclass
+class RetrievedChunk:
+    chunk_id: str
+    text: str
+    score: float
+    entities: List[Dict[str, Any]] = field(default_factory=list)  # id, labels, name, risk_types
+
+
+@dataclass
+class RetrievalResult:
+    query: str
+    chunks: List[RetrievedChunk]
+    run_id: Optional[str]  # ingestion run the result was computed for
+    cached: bool = False
+
+
+class LRUCache:
+    """Thread-safe least recently used cache with hit and miss counters"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, count_miss: bool = True) -> Optional[Any]:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += count_miss
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class QueryBatcher:
+    """Collects concurrently submitted queries into batches; up to `max_in_flight` batches run at once"""
+
+    def __init__(self, execute, window: float = BATCH_WINDOW_SECONDS, max_batch: int = MAX_BATCH,
+                 max_in_flight: int = MAX_BATCHES_IN_FLIGHT):
+        self.execute = execute  # (queries, top_k) -> results in the same order
+        self.window = window
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="retrieval-batch")
+        self._queue: "queue.Queue[Optional[Tuple[str, int, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, top_k: int) -> Future:
+        future: Future = Future()
+        self._queue.put((query, top_k, future))
+        return future
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[str, int, Future]]):
+        by_top_k: Dict[int, List[Tuple[str, Future]]] = defaultdict(list)
+        for query, top_k, future in batch:
+            by_top_k[top_k].append((query, future))
+        for top_k, items in by_top_k.items():
+            try:
+                results = self.execute([query for query, _ in items], top_k)
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown()
+
+
+class GraphRetriever:
+    def __init__(self, neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME,
+                 neo4j_password: str = NEO4J_PASSWORD, graph_io: Optional[GraphIO] = None,
+                 similarity_model=None, top_k: int = TOP_K, index_name: str = VECTOR_INDEX,
+                 embedding_cache_size: int = EMBEDDING_CACHE_SIZE, result_cache_size: int = RESULT_CACHE_SIZE,
+                 batch_window: float = BATCH_WINDOW_SECONDS, max_batch: int = MAX_BATCH,
+                 run_id_ttl: float = RUN_ID_TTL_SECONDS, metrics: Optional[PipelineMetrics] = None):
+        """
+        graph_io, similarity_model: graph I/O / embedding model to use instead of the shared ones
+        batch_window: seconds that retrieve() waits for other queries to batch with (0: no batching)
+        run_id_ttl: seconds before the latest ingestion run id is read again
+        """
+        self.graph_io = graph_io or get_graph_io(neo4j_uri, neo4j_user, neo4j_password)
+        self.similarity_model = similarity_model or get_similarity_model()
+        self.top_k = top_k
+        self.index_name = index_name
+        self.embedding_cache = LRUCache(embedding_cache_size)
+        self.result_cache = LRUCache(result_cache_size)
+        self.metrics = metrics or PipelineMetrics()
+        self.run_id_ttl = run_id_ttl
+        self._run_id: Optional[str] = None
+        self._run_id_checked = float("-inf")
+        self._run_id_lock = threading.Lock()
+        self.batcher = QueryBatcher(self.retrieve_many, batch_window, max_batch) if batch_window > 0 else None
+
+    def ensure_vector_index(self):
+        """Create the vector index on the Chunk embeddings written by SimpleKGPipeline"""
+        self.graph_io.write(CREATE_INDEX_QUERY).result()
+
+    def current_run_id(self) -> Optional[str]:
+        """Latest ingestion run id; the result cache is cleared when it changes"""
+        with self._run_id_lock:
+            now = time.monotonic()
+            if now - self._run_id_checked >= self.run_id_ttl:
+                records = self.graph_io.read(LATEST_RUN_QUERY).result()
+                run_id = records[0]["run_id"] if records else None
+                if run_id != self._run_id:
+                    if self._run_id is not None:
+                        logger.info(f"New ingestion run {run_id}, dropping {len(self.result_cache)} cached results")
+                    self.result_cache.clear()
+                    self._run_id = run_id
+                self._run_id_checked = now
+            return self._run_id
+
+    def invalidate(self):
+        """Drop the cached results and read the ingestion run id again on the next query"""
+        with self._run_id_lock:
+            self.result_cache.clear()
+            self._run_id_checked = float("-inf")
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.split())
+
+    def embed(self, queries: List[str]) -> np.ndarray:
+        """Embeddings of the queries; the ones not in the cache are encoded in one batch"""
+        embeddings: List[Optional[np.ndarray]] = [self.embedding_cache.get(query) for query in queries]
+        missing = sorted({query for query, embedding in zip(queries, embeddings) if embedding is None})
+        if missing:
+            with self.metrics.span("query_embedding") as span:
+                encoded = np.asarray(self.similarity_model.encode(missing), dtype=np.float32)
+                span.count("texts", len(missing))
+            new = dict(zip(missing, encoded))
+            for query, embedding in new.items():
+                self.embedding_cache.put(query, embedding)
+            embeddings = [new[query] if embedding is None else embedding for query, embedding in zip(queries, embeddings)]
+        return np.stack(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    def retrieve_many(self, queries: List[str], top_k: Optional[int] = None) -> List[RetrievalResult]:
+        """Retrieve several queries at once: one embedding call and one graph query for all cache misses"""
+        top_k = top_k or self.top_k
+        normalized = [self._normalize(query) for query in queries]
+        with self.metrics.span("retrieval_batch") as span:
+            run_id = self.current_run_id()
+            results: Dict[str, RetrievalResult] = {}
+            for query in normalized:
+                cached = self.result_cache.get((run_id, query, top_k))
+                if cached is not None:
+                    results[query] = replace(cached, cached=True)
+            missing = sorted(set(normalized) - set(results))
+            span.count("queries", len(queries))
+            span.count("result_cache_hits", sum(query in results for query in normalized))
+
+            if missing:
+                embeddings = self.embed(missing)
+                parameters = {
+                    "queries": [{"id": i, "embedding": embedding.tolist()} for i, embedding in enumerate(embeddings)],
+                    "index": self.index_name,
+                    "top_k": top_k,
+                    "max_entities": MAX_ENTITIES,
+                }
+                with self.metrics.span("graph_retrieval") as graph_span:
+                    records = self.graph_io.read(RETRIEVAL_QUERY, parameters).result()
+                    graph_span.count("queries", len(missing))
+                    graph_span.count("chunks", len(records))
+                chunks: Dict[int, List[RetrievedChunk]] = defaultdict(list)
+                for record in records:
+                    chunks[record["query"]].append(RetrievedChunk(record["chunk_id"], record["text"],
+                                                                  record["score"], record["entities"] or []))
+                for i, query in enumerate(missing):
+                    result = RetrievalResult(query=query, chunks=chunks[i], run_id=run_id)
+                    self.result_cache.put((run_id, query, top_k), result)
+                    results[query] = result
+        return [results[query] for query in normalized]
+
+    def retrieve(self, query: str, top_k: Optional[int] = None) -> RetrievalResult:
+        """Retrieve one query; with batching, concurrent calls share embedding and graph round trips"""
+        started = time.perf_counter()
+        top_k = top_k or self.top_k
+        if self.batcher is not None:
+            # cache hits are answered right away instead of waiting for a batch
+            key = (self.current_run_id(), self._normalize(query), top_k)
+            cached = self.result_cache.get(key, count_miss=False)  # a miss is counted by the batch
+            if cached is not None:
+                result = replace(cached, cached=True)
+            else:
+                result = self.batcher.submit(query, top_k).result()
+        else:
+            result = self.retrieve_many([query], top_k)[0]
+        self.metrics.record("retrieval", time.perf_counter() - started, cached=float(result.cached))
+        return result
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        return {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+
+def main():
+    """Answer questions from the command line with the retrieved chunks and entities"""
+    retriever = None
+    try:
+        retriever = GraphRetriever()
+        retriever.ensure_vector_index()
+        while True:
+            question = input("\nQuestion (empty to quit): ").strip()
+            if not question:
+                break
+            result = retriever.retrieve(question)
+            for chunk in result.chunks:
+                entities = ", ".join(f"{e['name']} ({'/'.join(e['labels'])})" for e in chunk.entities if e.get("name"))
+                print(f"\n[{chunk.score:.3f}] {chunk.text[:300]}")
+                if entities:
+                    print(f"  entities: {entities}")
+    except Exception as e:
+        logger.error(f"Retrieval failed: {e}")
+    finally:
+        if retriever is not None:
+            retriever.close()
+            print(retriever.metrics.format_summary())
+        close_drivers()
+
+
+if __name__ == "__main__":
+    main()
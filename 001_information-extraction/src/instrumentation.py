@@ -0,0 +1,265 @@
+"""
+Pipeline Instrumentation
+
+Structured timing spans and counters for the stages of the extraction pipeline (PDF extraction,
+chunking, embedding, relevance filtering, LLM calls, Neo4j writes, entity resolution), with
+per-stage summaries exported as JSON and in the Prometheus text exposition format.
+
+Usage:
+    metrics = PipelineMetrics(document="report-2024.pdf")
+    with metrics.span("chunking") as span:
+        chunks = chunk_text(text)
+        span.count("chunks", len(chunks))
+    metrics.write(Path("metrics"))
+
+The LLM and embedder wrappers plug into neo4j_graphrag components, so every call made by
+SimpleKGPipeline is measured (latency, prompt and completion tokens).
+
+Token counts come from the LLM response usage if available, otherwise from tiktoken (optional);
+without tiktoken they are estimated from the text length and marked as estimated.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from neo4j_graphrag.embeddings.base import Embedder
+from neo4j_graphrag.llm.base import LLMInterface
+from neo4j_graphrag.llm.types import LLMResponse
+
+try:
+    import tiktoken
+except ImportError:  # token counts are estimated without it
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "kg_pipeline"
+CHARS_PER_TOKEN = 4  # rough average for English text with OpenAI tokenizers
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@dataclass
+class Span:
+    """A single measured execution of a stage"""
+    stage: str
+    start: float
+    duration: float = 0.0
+    counters: Dict[str, float] = field(default_factory=dict)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def count(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+@dataclass
+class StageSummary:
+    stage: str
+    calls: int
+    total_seconds: float
+    mean_seconds: float
+    max_seconds: float
+    quantiles: Dict[str, float]
+    counters: Dict[str, float]
+    rates: Dict[str, float]  # counter per second of stage time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.__dict__.copy()
+
+
+class PipelineMetrics:
+    def __init__(self, **labels: str):
+        """Collect spans for one pipeline run; labels (e.g. document) are attached to all exported metrics"""
+        self.labels = labels
+        self._spans: Dict[str, List[Span]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str, **attributes: Any) -> Iterator[Span]:
+        """Measure the enclosed block as one execution of the stage"""
+        span = Span(stage=stage, start=time.time(), attributes=attributes)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            span.count("errors")
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            with self._lock:
+                self._spans[stage].append(span)
+            logger.debug(f"{stage}: {span.duration:.3f}s {span.counters}")
+
+    def record(self, stage: str, duration: float, **counters: float):
+        """Add an already measured execution of a stage"""
+        span = Span(stage=stage, start=time.time() - duration, duration=duration, counters=dict(counters))
+        with self._lock:
+            self._spans[stage].append(span)
+
+    def summaries(self) -> List[StageSummary]:
+        summaries = []
+        with self._lock:
+            spans_by_stage = {stage: list(spans) for stage, spans in self._spans.items()}
+        for stage, spans in spans_by_stage.items():
+            durations = np.array([s.duration for s in spans])
+            counters: Dict[str, float] = defaultdict(float)
+            for s in spans:
+                for name, value in s.counters.items():
+                    counters[name] += value
+            total = float(durations.sum())
+            summaries.append(StageSummary(
+                stage=stage,
+                calls=len(spans),
+                total_seconds=total,
+                mean_seconds=float(durations.mean()),
+                max_seconds=float(durations.max()),
+                quantiles={str(q): float(np.quantile(durations, q)) for q in QUANTILES},
+                counters=dict(counters),
+                rates={name: value / total for name, value in counters.items() if total > 0},
+            ))
+        return sorted(summaries, key=lambda s: s.total_seconds, reverse=True)
+
+    def bottleneck(self) -> Optional[str]:
+        """Stage with the largest total time"""
+        summaries = self.summaries()
+        return summaries[0].stage if summaries else None
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "labels": self.labels,
+            "bottleneck": self.bottleneck(),
+            "stages": [s.to_dict() for s in self.summaries()],
+        }, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Stage summaries in the Prometheus text exposition format"""
+        def fmt_labels(**extra: str) -> str:
+            pairs = {**self.labels, **extra}
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in pairs.values())
+            return "{" + ",".join(f'{k}="{v}"' for k, v in zip(pairs.keys(), escaped)) + "}"
+
+        duration = f"{METRIC_PREFIX}_stage_duration_seconds"
+        counter = f"{METRIC_PREFIX}_stage_events_total"
+        lines = [
+            f"# HELP {duration} Time spent per pipeline stage execution.",
+            f"# TYPE {duration} summary",
+        ]
+        summaries = self.summaries()
+        for s in summaries:
+            for q, value in s.quantiles.items():
+                lines.append(f"{duration}{fmt_labels(stage=s.stage, quantile=q)} {value}")
+            lines.append(f"{duration}_sum{fmt_labels(stage=s.stage)} {s.total_seconds}")
+            lines.append(f"{duration}_count{fmt_labels(stage=s.stage)} {s.calls}")
+        lines += [
+            f"# HELP {counter} Items processed per pipeline stage (chunks, tokens, nodes created, ...).",
+            f"# TYPE {counter} counter",
+        ]
+        for s in summaries:
+            for name, value in s.counters.items():
+                lines.append(f"{counter}{fmt_labels(stage=s.stage, name=name)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Path, basename: str = "metrics") -> Dict[str, Path]:
+        """Write the JSON and Prometheus exports to the directory"""
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = {"json": directory / f"{basename}.json", "prometheus": directory / f"{basename}.prom"}
+        paths["json"].write_text(self.to_json(), encoding="utf-8")
+        paths["prometheus"].write_text(self.to_prometheus(), encoding="utf-8")
+        return paths
+
+    def format_summary(self) -> str:
+        """Human readable table of the stage summaries, slowest stage first"""
+        lines = []
+        for s in self.summaries():
+            counters = ", ".join(f"{k}={v:g}" for k, v in s.counters.items())
+            lines.append(f"{s.stage:22s} {s.calls:5d} calls  {s.total_seconds:9.3f}s total  "
+                         f"p95 {s.quantiles['0.95']:.3f}s  {counters}")
+        lines.append(f"Bottleneck: {self.bottleneck()}")
+        return "\n".join(lines)
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o") -> Tuple[int, bool]:
+    """Number of tokens in the text, and whether it is an estimate"""
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(model_name).encode(text)), False
+        except KeyError:
+            pass
+    return max(1, len(text) // CHARS_PER_TOKEN), True
+
+
+class InstrumentedLLM(LLMInterface):
+    """Wraps an LLM of neo4j_graphrag and records latency and tokens of every call in the `llm_call` stage"""
+
+    def __init__(self, llm: LLMInterface, metrics: PipelineMetrics, stage: str = "llm_call"):
+        super().__init__(model_name=llm.model_name, model_params=llm.model_params)
+        self.llm = llm
+        self.metrics = metrics
+        self.stage = stage
+
+    def _count(self, span: Span, prompt: str, response: LLMResponse):
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            span.count("prompt_tokens", usage.prompt_tokens)
+            span.count("completion_tokens", usage.completion_tokens)
+            return
+        prompt_tokens, estimated = count_tokens(prompt, self.model_name)
+        completion_tokens, _ = count_tokens(response.content, self.model_name)
+        span.count("prompt_tokens", prompt_tokens)
+        span.count("completion_tokens", completion_tokens)
+        if estimated:
+            span.attributes["tokens_estimated"] = True
+
+    def invoke(self, input: str, message_history=None, system_instruction: Optional[str] = None) -> LLMResponse:
+        with self.metrics.span(self.stage) as span:
+            response = self.llm.invoke(input, message_history, system_instruction)
+            self._count(span, (system_instruction or "") + input, response)
+        return response
+
+    async def ainvoke(self, input: str, message_history=None, system_instruction: Optional[str] = None) -> LLMResponse:
+        with self.metrics.span(self.stage) as span:
+            response = await self.llm.ainvoke(input, message_history, system_instruction)
+            self._count(span, (system_instruction or "") + input, response)
+        return response
+
+
+class InstrumentedEmbedder(Embedder):
+    """Wraps an embedder of neo4j_graphrag and records every embedding call in the `embedding` stage"""
+
+    def __init__(self, embedder: Embedder, metrics: PipelineMetrics, stage: str = "embedding"):
+        self.embedder = embedder
+        self.metrics = metrics
+        self.stage = stage
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.metrics.span(self.stage) as span:
+            embedding = self.embedder.embed_query(text)
+            span.count("texts")
+            span.count("chars", len(text))
+        return embedding
+
+
+def write_counters(counters) -> Dict[str, int]:
+    """Counters of a neo4j ResultSummary (summary.counters) as a dict"""
+    return {
+        "statements": 1,
+        "nodes_created": counters.nodes_created,
+        "nodes_deleted": counters.nodes_deleted,
+        "relationships_created": counters.relationships_created,
+        "relationships_deleted": counters.relationships_deleted,
+        "properties_set": counters.properties_set,
+    }
+
+
+def record_write_summary(span: Span, summary):
+    """Add the counters of a neo4j ResultSummary to a span"""
+    for name, value in write_counters(summary.counters).items():
+        span.count(name, value)
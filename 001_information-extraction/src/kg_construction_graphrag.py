@@ -6,17 +6,18 @@ from time import sleep
 
 from dotenv import load_dotenv
 from pypdf import PdfReader
-from neo4j import GraphDatabase
-from neo4j_graphrag.embeddings import OpenAIEmbeddings, SentenceTransformerEmbeddings
+from neo4j_graphrag.embeddings import OpenAIEmbeddings
 from neo4j_graphrag.experimental.components.text_splitters.fixed_size_splitter import FixedSizeSplitter
 from neo4j_graphrag.experimental.pipeline.kg_builder import SimpleKGPipeline
 from neo4j_graphrag.llm.openai_llm import OpenAILLM
 from neo4j_graphrag.experimental.components.resolver import SinglePropertyExactMatchResolver
 from rdflib import Graph
-import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from utils import get_schema_from_onto, get_pkeys, get_classes_from_onto, chunk_text
+from utils import get_schema_from_onto, get_pkeys, get_classes_from_onto, chunk_text, filter_relevant_chunks
+from instrumentation import PipelineMetrics, InstrumentedLLM, InstrumentedEmbedder
+from neo4j_connection import get_driver, get_graph_io, close_drivers
+from embedding_store import SharedModelEmbeddings, get_similarity_model
+from graphrag_retrieval import record_ingestion_run
 
 ####### VARIABLES #########################
 
@@ -31,54 +32,65 @@ NEO4J_PASSWORD = "testtest"
 
 SIMILARITY_THRESHOLD = 0.42  # (0.0 = no similarity, 1.0 = identical)
 TOKENS_LIMIT = 10000  # Max tokens for OpenAI API
+METRICS_DIR = Path(__file__).resolve().parents[1] / "metrics"  # stage summaries as JSON and Prometheus text
 ###########################################
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+metrics = PipelineMetrics(document=FILE_TO_BE_PROCESSED.name)
+
+# One connection pool for the whole run: the sync driver for the neo4j_graphrag components, the async one for our own queries
+driver = get_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+graph_io = get_graph_io(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
 
 graph = Graph()
 g = graph.parse(ONTOLOGY_FILE)
 labels = get_classes_from_onto(g)
 
-similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-reader = PdfReader(FILE_TO_BE_PROCESSED)
+# One model for the relevance filter and the KG builder; EMBEDDING_BACKEND in .env selects the CPU backend
+similarity_model = get_similarity_model()
 
 ########### PREPARING TEXTS ################################
 
-text = ""
-for page in reader.pages:
-    text+=page.extract_text()   
+with metrics.span("pdf_extraction") as span:
+    reader = PdfReader(FILE_TO_BE_PROCESSED)
+    text = ""
+    for page in reader.pages:
+        text+=page.extract_text()   
+    span.count("pages", len(reader.pages))
+    span.count("chars", len(text))
 
 # Split into chunks
-chunks = chunk_text(text, chunk_size=2000, overlap=200)
+with metrics.span("chunking") as span:
+    chunks = chunk_text(text, chunk_size=2000, overlap=200)
+    span.count("chunks", len(chunks))
 print(f"Created {len(chunks)} chunks from PDF")
 
-# Container for relevant chunks
-relevant_chunks = []
-
 print(f"Processing chunks with similarity threshold: {SIMILARITY_THRESHOLD}")
 
 # Create a single ontology text representation
 ontology_text = " ".join(labels)
-ontology_embedding = similarity_model.encode([ontology_text])
+with metrics.span("embedding") as span:
+    ontology_embedding = similarity_model.encode([ontology_text])
+    span.count("texts")
 
 # ############################
 
-neo4j_schema = get_schema_from_onto(g, ["Risk", "Organization"])
+with metrics.span("schema_from_ontology"):
+    neo4j_schema = get_schema_from_onto(g, ["Risk", "Organization"])
 print(neo4j_schema)  # pydantic model -> Tuple of node types
 
 splitter = FixedSizeSplitter(chunk_size=2500, chunk_overlap=10)
-embedder = SentenceTransformerEmbeddings()
-# embedder = OpenAIEmbeddings(model="text-embedding-3-small")
+embedder = InstrumentedEmbedder(SharedModelEmbeddings(similarity_model), metrics)
+# embedder = InstrumentedEmbedder(OpenAIEmbeddings(model="text-embedding-3-small"), metrics)
 
-llm = OpenAILLM(
+# Every LLM call of the pipeline is recorded with latency and prompt/completion tokens
+llm = InstrumentedLLM(OpenAILLM(
     model_name="gpt-4o",
     model_params={
         "max_tokens": 10000,
         "response_format": {"type": "json_object"},
         "temperature": 0,
     },
-)
+), metrics)
 
 # It is possible to build own pipeline using specific components, like this one: https://neo4j.com/docs/neo4j-graphrag-python/current/user_guide_kg_builder.html#lexical-graph-builder
 kg_builder = SimpleKGPipeline(
@@ -92,28 +104,31 @@ kg_builder = SimpleKGPipeline(
     from_pdf=False,
 )
 
+def graph_counts():
+    """Number of nodes and relationships in the database (answered from the count store)"""
+    nodes = graph_io.read("MATCH (n) RETURN count(n) AS count")
+    rels = graph_io.read("MATCH ()-[r]->() RETURN count(r) AS count")
+    return nodes.result()[0]["count"], rels.result()[0]["count"]
+
+def build_kg(text_chunk: str):
+    """Run the knowledge graph builder on a piece of text and record the written nodes/relationships"""
+    nodes_before, rels_before = graph_counts()
+    with metrics.span("extract_and_write") as span:
+        asyncio.run(kg_builder.run_async(text=text_chunk))
+        nodes_after, rels_after = graph_counts()
+        span.count("chars", len(text_chunk))
+        span.count("nodes_created", nodes_after - nodes_before)
+        span.count("relationships_created", rels_after - rels_before)
+
 def main():
     """Main function to run the knowledge graph construction"""
     ############# CHECKING SIMILARITY ###############################
 
     # Iterate through chunks and check similarity with ontology
-    for i, chunk in enumerate(chunks):
-        chunk_embedding = similarity_model.encode([chunk])
-        
-        # Calculate cosine similarity with the ontology as a whole
-        similarity = np.dot(chunk_embedding, ontology_embedding.T).flatten()[0]
-        
-        # Check if chunk passes threshold
-        if similarity >= SIMILARITY_THRESHOLD:
-            chunk_info = {
-                'chunk_index': i,
-                'content': chunk,
-                'similarity_to_ontology': float(similarity)
-            }
-            relevant_chunks.append(chunk_info)
-            print(f"✓ Chunk {i:3d}: similarity {similarity:.3f} - RELEVANT")
-        else:
-            print(f"✗ Chunk {i:3d}: similarity {similarity:.3f} - filtered out")
+    with metrics.span("relevance_filter") as span:
+        relevant_chunks = filter_relevant_chunks(chunks, similarity_model, ontology_embedding, SIMILARITY_THRESHOLD)
+        span.count("chunks", len(chunks))
+        span.count("relevant_chunks", len(relevant_chunks))
 
     print(f"\n" + "="*60)
     print(f"RESULTS:")
@@ -158,27 +173,38 @@ def main():
             # Process each chunk
             for i, chunk in enumerate(text_chunks, 1):
                 print(f"\nProcessing chunk {i}/{len(text_chunks)}... Length of the chunk: {len(chunk)} characters")
-                asyncio.run(kg_builder.run_async(text=chunk))
+                build_kg(chunk)
                 print(f"✓ Completed chunk {i}")
                 sleep(60)
                 
         else:
             print(f"Text length is manageable ({length_relevant_text} chars), processing as single chunk")
-            asyncio.run(kg_builder.run_async(text=relevant_text))
+            build_kg(relevant_text)
         
         print("\n" + "="*60)
         print("Running entity resolvers...")
         
         # Run the resolvers
         for pk in get_pkeys(g):
-            resolver = SinglePropertyExactMatchResolver(driver=driver, resolve_property=pk)
-            asyncio.run(resolver.run())
+            with metrics.span("resolution", resolve_property=pk) as span:
+                resolver = SinglePropertyExactMatchResolver(driver=driver, resolve_property=pk)
+                stats = asyncio.run(resolver.run())
+                span.count("nodes_to_resolve", getattr(stats, "number_of_nodes_to_resolve", 0) or 0)
+                span.count("nodes_created", getattr(stats, "number_of_created_nodes", 0) or 0)
+
+        # Retrieval results cached before this run are stale now
+        record_ingestion_run(graph_io, FILE_TO_BE_PROCESSED.name)
+        # The SHACL shapes target the Risk nodes, which kg_post_processing.py links, so it validates the chunks
             
     except Exception as e:
         print(f"Error during knowledge graph construction: {e}")
         raise
     finally:
-        driver.close()
+        close_drivers()
+        print("\n" + "="*60)
+        print(metrics.format_summary())
+        paths = metrics.write(METRICS_DIR, basename=FILE_TO_BE_PROCESSED.stem)
+        print(f"Stage metrics written to {paths['json']} and {paths['prometheus']}")
 
 if __name__ == "__main__":
     main()
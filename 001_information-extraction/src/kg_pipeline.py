@@ -0,0 +1,299 @@
+"""
+Knowledge Graph Pipeline
+
+Runs the knowledge graph construction (kg_construction_graphrag.py) and the post-processing
+(kg_post_processing.py) as one DAG of stages with the pipeline runner:
+
+    load ──► chunk ──► chunk_embeddings ──┐
+    ontology_embedding ───────────────────┴─► filter ──► extract ──► resolve ──┬─► map_taxonomy ──┬─► analytics
+                                                                                └─► link_company ───┴─► validate
+
+Stage outputs are stored under artifacts/<stage>/ (Parquet tables, int8 .npy embeddings), keyed by
+the hashes of the document, the ontology and the stage parameters. After a failure, e.g. in the
+resolver or halfway through the LLM slices, the next run continues with the first incomplete
+stage (and the first unprocessed slice). Independent stages run in parallel.
+
+Usage:
+    python kg_pipeline.py                      # run or resume
+    python kg_pipeline.py --force extract      # re-run extraction and everything after it
+    python kg_pipeline.py --status             # show which stages are complete
+
+Requirements:
+- pypdf for text extraction
+- sentence-transformers for the relevance filter and the taxonomy mapping (EMBEDDING_BACKEND
+  selects the inference backend, see embedding_store.py)
+- neo4j and neo4j-graphrag for the graph construction
+- pyarrow for the stage artifacts
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from time import sleep
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from pypdf import PdfReader
+from neo4j_graphrag.experimental.components.text_splitters.fixed_size_splitter import FixedSizeSplitter
+from neo4j_graphrag.experimental.pipeline.kg_builder import SimpleKGPipeline
+from neo4j_graphrag.llm.openai_llm import OpenAILLM
+from neo4j_graphrag.experimental.components.resolver import SinglePropertyExactMatchResolver
+from rdflib import Graph
+
+from utils import get_schema_from_onto, get_pkeys, get_classes_from_onto, chunk_text, filter_relevant_chunks
+from shacl_validation import IncrementalShaclValidator
+from instrumentation import PipelineMetrics, InstrumentedLLM, InstrumentedEmbedder
+from kg_post_processing import RiskTaxonomyMapper, create_company_risk_event_relationships
+from risk_analytics import RiskAnalytics
+from graphrag_retrieval import record_ingestion_run
+from neo4j_connection import get_driver, get_graph_io, close_drivers
+from embedding_store import DEFAULT_BACKEND, SIMILARITY_MODEL, SharedModelEmbeddings, get_similarity_model
+from pipeline_runner import (ARRAY, EMBEDDINGS, EMBEDDINGS_DTYPE, JSON, ArtifactStore, PipelineError, PipelineRunner,
+                             Stage, StageContext)
+
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+BASE_DIR = Path(__file__).resolve().parents[1]
+ONTOLOGY_FILE = BASE_DIR / "semantics" / "bizrisk.ttl"
+ARTIFACTS_DIR = BASE_DIR / "artifacts"
+METRICS_DIR = BASE_DIR / "metrics"
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND)
+SIMILARITY_THRESHOLD = 0.42  # (0.0 = no similarity, 1.0 = identical)
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+TOKENS_LIMIT = 10000  # Max tokens for OpenAI API
+LLM_MODEL = "gpt-4o"
+SLICE_PAUSE_SECONDS = 60  # pause between LLM slices (rate limit)
+GRAPH_WRITING_STAGES = ("extract", "resolve", "map_taxonomy", "link_company")
+
+
+class KnowledgeGraphPipeline:
+    def __init__(self, document: Path, company_name: Optional[str], ontology_file: Path = ONTOLOGY_FILE,
+                 artifacts_dir: Path = ARTIFACTS_DIR, max_workers: int = 4,
+                 neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME, neo4j_password: str = NEO4J_PASSWORD):
+        """Set up the stages for one document; the Neo4j connections and the embedding model are shared by all stages"""
+        self.document = document
+        self.company_name = company_name
+        self.ontology_file = ontology_file
+        self.neo4j_uri = neo4j_uri
+        self.neo4j_user = neo4j_user
+        self.neo4j_password = neo4j_password
+        self.neo4j_driver = get_driver(neo4j_uri, neo4j_user, neo4j_password)  # for the neo4j_graphrag components
+        self.graph_io = get_graph_io(neo4j_uri, neo4j_user, neo4j_password)
+        self.metrics = PipelineMetrics(document=document.name)
+        self.ontology = Graph()
+        self.ontology.parse(str(ontology_file), format="turtle")
+        self.runner = PipelineRunner(self.stages(), ArtifactStore(artifacts_dir / document.stem),
+                                     max_workers=max_workers, metrics=self.metrics)
+
+    @property
+    def similarity_model(self):
+        """Loaded on first use, so runs that resume after the embedding stages do not load it"""
+        return get_similarity_model(EMBEDDING_BACKEND)
+
+    def stages(self) -> List[Stage]:
+        onto = [self.ontology_file]
+        return [
+            Stage("load", self.load_document, inputs=[self.document]),
+            Stage("chunk", self.chunk, depends_on=["load"],
+                  params={"chunk_size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}),
+            Stage("chunk_embeddings", self.embed_chunks, depends_on=["chunk"], kind=EMBEDDINGS,
+                  params={"model": SIMILARITY_MODEL, "backend": EMBEDDING_BACKEND, "dtype": EMBEDDINGS_DTYPE}),
+            Stage("ontology_embedding", self.embed_ontology, inputs=onto, kind=ARRAY,
+                  params={"model": SIMILARITY_MODEL, "backend": EMBEDDING_BACKEND}),
+            Stage("filter", self.filter_chunks, depends_on=["chunk", "chunk_embeddings", "ontology_embedding"],
+                  params={"threshold": SIMILARITY_THRESHOLD}),
+            Stage("extract", self.extract, depends_on=["filter"], inputs=onto,
+                  params={"tokens_limit": TOKENS_LIMIT, "llm": LLM_MODEL}),
+            Stage("resolve", self.resolve, depends_on=["extract"], inputs=onto),
+            Stage("map_taxonomy", self.map_taxonomy, depends_on=["resolve"], inputs=onto,
+                  params={"model": SIMILARITY_MODEL, "backend": EMBEDDING_BACKEND}),
+            Stage("link_company", self.link_company, depends_on=["resolve"],
+                  params={"company": self.company_name}),
+            Stage("validate", self.validate, depends_on=["map_taxonomy", "link_company"], inputs=onto),
+            Stage("analytics", self.refresh_analytics, depends_on=["map_taxonomy", "link_company"], kind=JSON),
+        ]
+
+    ########### PREPARING TEXTS ################################
+
+    def load_document(self, ctx: StageContext) -> List[Dict]:
+        reader = PdfReader(self.document)
+        return [{"page": i, "text": page.extract_text()} for i, page in enumerate(reader.pages)]
+
+    def chunk(self, ctx: StageContext) -> List[Dict]:
+        text = "".join(page["text"] for page in ctx.inputs["load"])
+        chunks = chunk_text(text, chunk_size=ctx.stage.params["chunk_size"], overlap=ctx.stage.params["overlap"])
+        print(f"Created {len(chunks)} chunks from PDF")
+        return [{"chunk_index": i, "content": chunk} for i, chunk in enumerate(chunks)]
+
+    def embed_chunks(self, ctx: StageContext) -> np.ndarray:
+        contents = [chunk["content"] for chunk in ctx.inputs["chunk"]]
+        return self.similarity_model.encode(contents)
+
+    def embed_ontology(self, ctx: StageContext) -> np.ndarray:
+        # Create a single ontology text representation
+        ontology_text = " ".join(get_classes_from_onto(self.ontology))
+        return self.similarity_model.encode([ontology_text])
+
+    def filter_chunks(self, ctx: StageContext) -> List[Dict]:
+        chunks = [chunk["content"] for chunk in ctx.inputs["chunk"]]
+        print(f"Processing chunks with similarity threshold: {ctx.stage.params['threshold']}")
+        relevant_chunks = filter_relevant_chunks(chunks, None, ctx.inputs["ontology_embedding"],
+                                                 ctx.stage.params["threshold"],
+                                                 chunk_embeddings=ctx.inputs["chunk_embeddings"])
+        print(f"Relevant chunks found: {len(relevant_chunks)} of {len(chunks)}")
+        return relevant_chunks
+
+    ########### BUILDING THE GRAPH ################################
+
+    def _graph_counts(self):
+        nodes = self.graph_io.read("MATCH (n) RETURN count(n) AS count")
+        rels = self.graph_io.read("MATCH ()-[r]->() RETURN count(r) AS count")
+        return nodes.result()[0]["count"], rels.result()[0]["count"]
+
+    def _kg_builder(self) -> SimpleKGPipeline:
+        llm = InstrumentedLLM(OpenAILLM(
+            model_name=LLM_MODEL,
+            model_params={
+                "max_tokens": 10000,
+                "response_format": {"type": "json_object"},
+                "temperature": 0,
+            },
+        ), self.metrics)
+        return SimpleKGPipeline(
+            llm=llm,
+            driver=self.neo4j_driver,
+            text_splitter=FixedSizeSplitter(chunk_size=2500, chunk_overlap=10),
+            embedder=InstrumentedEmbedder(SharedModelEmbeddings(self.similarity_model), self.metrics),
+            schema=get_schema_from_onto(self.ontology, ["Risk", "Organization"]),
+            on_error="IGNORE",
+            from_pdf=False,
+        )
+
+    def extract(self, ctx: StageContext) -> List[Dict]:
+        """Run the KG builder slice by slice; processed slices are checkpointed, so a failed run continues after them"""
+        relevant_text = " ".join(chunk["content"] for chunk in ctx.inputs["filter"])
+        limit = ctx.stage.params["tokens_limit"]
+        slices = [relevant_text[start:start + limit] for start in range(0, len(relevant_text), limit)]
+        done = ctx.checkpoint() or []
+        if done:
+            logger.info(f"Resuming extraction after {len(done)} of {len(slices)} slices")
+
+        kg_builder = self._kg_builder()
+        nodes_after, rels_after = self._graph_counts()
+        for i in range(len(done), len(slices)):
+            print(f"\nProcessing slice {i + 1}/{len(slices)}... Length of the slice: {len(slices[i])} characters")
+            nodes_before, rels_before = nodes_after, rels_after
+            asyncio.run(kg_builder.run_async(text=slices[i]))
+            nodes_after, rels_after = self._graph_counts()
+            done.append({"slice_index": i, "chars": len(slices[i]),
+                         "nodes_created": nodes_after - nodes_before,
+                         "relationships_created": rels_after - rels_before})
+            ctx.save_checkpoint(done)
+            print(f"✓ Completed slice {i + 1}")
+            if i < len(slices) - 1:
+                sleep(SLICE_PAUSE_SECONDS)
+        return done
+
+    def resolve(self, ctx: StageContext) -> List[Dict]:
+        results = []
+        for pk in get_pkeys(self.ontology):
+            resolver = SinglePropertyExactMatchResolver(driver=self.neo4j_driver, resolve_property=pk)
+            stats = asyncio.run(resolver.run())
+            results.append({"property": pk,
+                            "nodes_to_resolve": getattr(stats, "number_of_nodes_to_resolve", 0) or 0,
+                            "nodes_created": getattr(stats, "number_of_created_nodes", 0) or 0})
+        return results
+
+    ########### POST-PROCESSING ################################
+
+    def map_taxonomy(self, ctx: StageContext) -> List[Dict]:
+        mapper = RiskTaxonomyMapper(
+            ontology_file=str(self.ontology_file),
+            neo4j_uri=self.neo4j_uri,
+            neo4j_user=self.neo4j_user,
+            neo4j_password=self.neo4j_password,
+            graph_io=self.graph_io,
+            similarity_model=self.similarity_model,
+            metrics=self.metrics,
+        )
+        return [{"risk_event_id": m.neo4j_id, "risk_type": m.skos_type, "ancestors": m.ancestors}
+                for m in mapper.run_complete_mapping()]
+
+    def link_company(self, ctx: StageContext) -> List[Dict]:
+        if not self.company_name:
+            raise ValueError("COMPANY_NAME is not set")
+        connected = create_company_risk_event_relationships(
+            company_name=self.company_name,
+            processing_date=datetime.today().strftime('%Y-%m-%d'),
+            neo4j_uri=self.neo4j_uri,
+            neo4j_user=self.neo4j_user,
+            neo4j_password=self.neo4j_password,
+            graph_io=self.graph_io,
+        )
+        return [{"company": self.company_name, "connected_risk_events": connected}]
+
+    def validate(self, ctx: StageContext) -> List[Dict]:
+        reports = IncrementalShaclValidator(self.neo4j_driver, ontology_file=self.ontology_file).validate_new_chunks()
+        return [{"chunk_id": r.chunk_id, "chunk_index": r.chunk_index, "focus_nodes": r.focus_nodes,
+                 "violations": r.violations} for r in reports]
+
+    def refresh_analytics(self, ctx: StageContext) -> Dict[str, int]:
+        """Add the company (and any other changed company) to the cached cross-company risk analytics"""
+        return RiskAnalytics(graph_io=self.graph_io).refresh()
+
+    def run(self, force: List[str] = ()) -> Dict[str, str]:
+        status = self.runner.run(force=force)
+        if any(status.get(stage) == "completed" for stage in GRAPH_WRITING_STAGES):
+            # cached retrieval results from before this run are stale now
+            record_ingestion_run(self.graph_io, self.document.name)
+        return status
+
+    def close(self):
+        """Write the stage metrics (the shared Neo4j connections are closed by the entry point)"""
+        paths = self.metrics.write(METRICS_DIR, basename=f"{self.document.stem}_pipeline")
+        logger.info(f"Stage metrics written to {paths['json']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run or resume the knowledge graph pipeline for a document")
+    parser.add_argument("--document", type=Path, default=None,
+                        help="PDF to process (default: FILE_PATH_RELATIVE_TO_HOME from .env)")
+    parser.add_argument("--company", default=os.getenv('COMPANY_NAME'))
+    parser.add_argument("--force", nargs="*", default=[], help="stages to run again, with everything downstream")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--status", action="store_true", help="only show which stages are complete")
+    args = parser.parse_args()
+
+    document = args.document or Path.home() / os.getenv('FILE_PATH_RELATIVE_TO_HOME')
+    pipeline = KnowledgeGraphPipeline(document, args.company, max_workers=args.workers)
+    try:
+        if args.status:
+            for name, complete in pipeline.runner.status().items():
+                print(f"{'✓' if complete else '·'} {name:20s} {pipeline.runner.keys[name]}")
+            return
+        status = pipeline.run(force=args.force)
+        logger.info(f"Pipeline completed: {status}")
+    except PipelineError as e:
+        logger.error(f"{e}. Run again to resume from this stage.")
+    finally:
+        pipeline.close()
+        close_drivers()
+        print(pipeline.metrics.format_summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -12,18 +12,22 @@ Requirements:
 
 import os
 import logging
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import Callable, List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
 import uuid
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import Future, wait
 
 from dotenv import load_dotenv
 from rdflib import Graph
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+from instrumentation import PipelineMetrics, write_counters
+from neo4j_connection import GraphIO, close_drivers, get_driver, get_graph_io
+from shacl_validation import RESET_CHUNK_VALIDATION, IncrementalShaclValidator
+from embedding_store import get_similarity_model
+from graphrag_retrieval import record_ingestion_run
 
 load_dotenv()
 
@@ -35,6 +39,7 @@ logger = logging.getLogger(__name__)
 NEO4J_URI = "neo4j://localhost:7687"
 NEO4J_USERNAME = "neo4j"
 NEO4J_PASSWORD = "testtest"
+METRICS_DIR = Path(__file__).resolve().parents[1] / "metrics"
 ONTOLOGY_FILE =  Path.home() / "Documents" / "repositories" / "biz-strategy-knowledge-base-ai/001_information-extraction/semantics/bizrisk.ttl"
 
 @dataclass
@@ -43,6 +48,12 @@ class SKOSConcept:
     uri: str
     label: str
     definition: str = ""
+    broader: List[str] = field(default_factory=list)  # URIs of the direct parent concepts
+
+    @property
+    def name(self) -> str:
+        """Concept name from the URI, as used for the Risk type"""
+        return self.uri.split('#')[-1] if '#' in self.uri else self.label
     
 @dataclass
 class RiskEventNode:
@@ -57,18 +68,108 @@ class MappedRisk:
     neo4j_id: str
     description: str
     skos_type: str
+    ancestors: List[str] = field(default_factory=list)  # concept names of all broader concepts, nearest first
+
+@dataclass
+class TaxonomyIndex:
+    """
+    Precomputed broader/narrower closure of the risk taxonomy.
+    Allows to classify top-down and to look up all ancestors of a concept without traversal.
+    """
+    concepts: Dict[str, SKOSConcept]
+    children: Dict[str, List[str]]
+    ancestors: Dict[str, List[str]]
+    roots: List[str]
+
+    @classmethod
+    def from_concepts(cls, concepts: List[SKOSConcept]) -> "TaxonomyIndex":
+        by_uri = {concept.uri: concept for concept in concepts}
+        children: Dict[str, List[str]] = {uri: [] for uri in by_uri}
+        for concept in concepts:
+            for parent in concept.broader:
+                if parent in children and concept.uri not in children[parent]:
+                    children[parent].append(concept.uri)
+
+        ancestors: Dict[str, List[str]] = {}
+
+        def collect_ancestors(uri: str, visiting: frozenset) -> List[str]:
+            if uri in ancestors:
+                return ancestors[uri]
+            result = []
+            for parent in by_uri[uri].broader:
+                if parent not in by_uri or parent in visiting:  # outside the scheme, or a cycle
+                    continue
+                for ancestor in [parent] + collect_ancestors(parent, visiting | {uri}):
+                    if ancestor not in result:
+                        result.append(ancestor)
+            ancestors[uri] = result
+            return result
+
+        for uri in by_uri:
+            collect_ancestors(uri, frozenset())
+
+        roots = [uri for uri in by_uri if not ancestors[uri]]
+        return cls(concepts=by_uri, children=children, ancestors=ancestors, roots=roots)
+
+    def is_leaf(self, uri: str) -> bool:
+        return not self.children[uri]
+
+    def descend(self, score: Callable[[List[str]], List[Tuple[str, float]]], beam_width: int = 1) -> Tuple[str, float]:
+        """
+        Beam search from the top-level categories to the best scoring concept; score returns
+        (uri, similarity) for a list of concept URIs
+        """
+        def ranked(items: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+            return sorted(items, key=lambda item: item[1], reverse=True)[:beam_width]
+
+        frontier = ranked(score(self.roots))
+        visited = {uri for uri, _ in frontier}
+        while True:
+            candidates = [child for uri, _ in frontier for child in self.children[uri] if child not in visited]
+            if not candidates:
+                break
+            visited.update(candidates)
+            # leaves already in the beam compete with the concepts of the next level
+            frontier = ranked(score(candidates) + [item for item in frontier if self.is_leaf(item[0])])
+        return frontier[0]
+
 
 class RiskTaxonomyMapper:
-    def __init__(self, ontology_file: str, neo4j_uri: str, neo4j_user: str, neo4j_password: str):
-        """Initialize the mapper with ontology and Neo4j connection"""
+    def __init__(self, ontology_file: str, neo4j_uri: str, neo4j_user: str, neo4j_password: str,
+                 hierarchical: bool = True, beam_width: int = 1, attach_to_ancestors: bool = False,
+                 graph_io: Optional[GraphIO] = None, similarity_model=None, metrics: Optional[PipelineMetrics] = None):
+        """
+        Initialize the mapper with ontology and Neo4j connection.
+
+        hierarchical: classify top-down through the taxonomy instead of against every concept
+        beam_width: number of best scoring branches to descend into on each level
+        attach_to_ancestors: also connect the broader Risk nodes to the RiskEvent (materializedIn)
+        graph_io, similarity_model: graph I/O / embedding model to use instead of the shared connection and model
+        metrics: collects the stage timings (taxonomy mapping, Neo4j writes)
+        """
         self.ontology_file = ontology_file
         self.graph = Graph()
-        self.neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-        self.similarity_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self._graph_io = graph_io
+        self._connection = (neo4j_uri, neo4j_user, neo4j_password)
+        self.similarity_model = similarity_model or get_similarity_model()
+        self.hierarchical = hierarchical
+        self.beam_width = beam_width
+        self.attach_to_ancestors = attach_to_ancestors
+        self.taxonomy: Optional[TaxonomyIndex] = None
+        self._concept_embeddings: Dict[str, np.ndarray] = {}
+        self.comparisons = 0
+        self.metrics = metrics or PipelineMetrics()
         
         # Load ontology
         self._load_ontology()
         
+    @property
+    def graph_io(self) -> GraphIO:
+        """Shared graph I/O, opened on first use (e.g. never by the offline CSV export, which only classifies)"""
+        if self._graph_io is None:
+            self._graph_io = get_graph_io(*self._connection)
+        return self._graph_io
+
     def _load_ontology(self):
         """Load the ontology from file"""
         try:
@@ -90,23 +191,36 @@ class RiskTaxonomyMapper:
         PREFIX bizrisk: <http://example.com/bizrisk#>
         PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
         
-        SELECT ?concept ?label ?definition WHERE {
+        SELECT ?concept ?label ?definition ?broader WHERE {
             ?concept a skos:Concept ;
                      skos:inScheme bizrisk:RiskTaxonomy ;
                      skos:prefLabel ?label .
             OPTIONAL { ?concept skos:definition ?definition }
+            OPTIONAL {
+                { ?concept skos:broader ?broader }
+                UNION
+                { ?broader skos:narrower ?concept }
+            }
         }
         """
         
         try:
             results = self.graph.query(query)
+            by_uri: Dict[str, SKOSConcept] = {}
             for row in results:
-                concept = SKOSConcept(
-                    uri=str(row.concept),
-                    label=str(row.label),
-                    definition=str(row.definition) if row.definition else ""
-                )
-                concepts.append(concept)
+                uri = str(row.concept)
+                concept = by_uri.get(uri)
+                if concept is None:
+                    concept = SKOSConcept(
+                        uri=uri,
+                        label=str(row.label),
+                        definition=str(row.definition) if row.definition else ""
+                    )
+                    by_uri[uri] = concept
+                    concepts.append(concept)
+                # one row per broader concept
+                if row.broader and str(row.broader) not in concept.broader:
+                    concept.broader.append(str(row.broader))
                 
             logger.info(f"Found {len(concepts)} SKOS concepts in RiskTaxonomy")
             return concepts
@@ -115,34 +229,36 @@ class RiskTaxonomyMapper:
             logger.error(f"Error querying SKOS concepts: {e}")
             return []
 
-    def get_risk_event_nodes_from_neo4j(self) -> List[RiskEventNode]:
+    def request_risk_event_nodes(self) -> Future:
         """
-        Get all RiskEvent nodes and their relationships from Neo4j
+        Start reading all RiskEvent nodes from Neo4j; the future resolves to the records
         """
-        risks = []
-
-        # Cypher query to get RiskEvent nodes with their properties
         query = """
         MATCH (r:RiskEvent)
         WITH r, 
              id(r) as node_id
         RETURN r, node_id
         """
+        return self.graph_io.read(query)
+
+    def get_risk_event_nodes_from_neo4j(self, pending: Optional[Future] = None) -> List[RiskEventNode]:
+        """
+        Get all RiskEvent nodes and their relationships from Neo4j (from an already started read, if given)
+        """
+        risks = []
         
         try:
-            with self.neo4j_driver.session() as session:
-                result = session.run(query)
+            records = (pending or self.request_risk_event_nodes()).result()
+            for record in records:
+                node = record['r']
+                node_id = str(record['node_id'])
                 
-                for record in result:
-                    node = record['r']
-                    node_id = str(record['node_id'])
-                    
-                    risk_event = RiskEventNode(
-                        neo4j_id=node_id,
-                        description=node.get('hasRiskEventDescription', ''),
-                        properties=dict(node),
-                    )
-                    risks.append(risk_event)
+                risk_event = RiskEventNode(
+                    neo4j_id=node_id,
+                    description=node.get('hasRiskEventDescription', ''),
+                    properties=dict(node),
+                )
+                risks.append(risk_event)
                     
             logger.info(f"Found {len(risks)} RiskEvent nodes in Neo4j")
             return risks
@@ -174,6 +290,7 @@ class RiskTaxonomyMapper:
         
         # Calculate cosine similarities
         similarities = np.dot(risk_embedding, concept_embedding.T).flatten()
+        self.comparisons += len(concepts)
 
         # Find the best match
         best_index = np.argmax(similarities)
@@ -186,89 +303,188 @@ class RiskTaxonomyMapper:
             logger.warning(f"Low confidence match for '{description[:100]}...': '{concepts[best_index].label}' (score: {best_score:.3f})")
         
         return concepts[best_index]
+
+    def build_taxonomy_index(self, concepts: List[SKOSConcept]) -> TaxonomyIndex:
+        """
+        Precompute the broader/narrower closure and embed every concept once
+        """
+        self.taxonomy = TaxonomyIndex.from_concepts(concepts)
+        concept_texts = [f"{concept.label}: {concept.definition}".lower() for concept in concepts]
+        embeddings = self.similarity_model.encode(concept_texts)
+        self._concept_embeddings = {concept.uri: embeddings[i] for i, concept in enumerate(concepts)}
+        logger.info(f"Built taxonomy index: {len(self.taxonomy.roots)} top-level categories, "
+                    f"{sum(self.taxonomy.is_leaf(uri) for uri in self.taxonomy.concepts)} leaf concepts")
+        return self.taxonomy
+
+    def classify_hierarchically(self, description: str) -> Optional[Tuple[SKOSConcept, float]]:
+        """
+        Find the SKOS concept for the risk description top-down: score the top-level categories first,
+        then descend only into the best scoring branches until a leaf concept is reached
+        """
+        if not description or not self.taxonomy:
+            logger.warning(f"Cannot find match - description: '{description}', taxonomy index built: {self.taxonomy is not None}")
+            return None
+
+        risk_embedding = self.similarity_model.encode([description.lower()])[0]
+
+        def score(uris: List[str]) -> List[Tuple[str, float]]:
+            self.comparisons += len(uris)
+            matrix = np.stack([self._concept_embeddings[uri] for uri in uris])
+            similarities = np.dot(matrix, risk_embedding)
+            return list(zip(uris, similarities.tolist()))
+
+        best_uri, best_score = self.taxonomy.descend(score, self.beam_width)
+
+        best_concept = self.taxonomy.concepts[best_uri]
+        if best_score > 0.1:  # Minimum threshold for meaningful matches
+            logger.info(f"Best match for '{description[:100]}...': '{best_concept.label}' (score: {best_score:.3f})")
+        else:
+            logger.warning(f"Low confidence match for '{description[:100]}...': '{best_concept.label}' (score: {best_score:.3f})")
+        return best_concept, best_score
     
-    def create_mapped_risks(self, risk_events: List[RiskEventNode], concepts: List[SKOSConcept]) -> List[MappedRisk]:
+    def create_mapped_risks(self, risk_events: List[RiskEventNode], concepts: List[SKOSConcept],
+                            on_mapped: Optional[Callable[[MappedRisk], None]] = None) -> List[MappedRisk]:
         """
-        Create mapped risks with SKOS types
+        Create mapped risks with SKOS types. on_mapped is called for every mapped risk as soon as it is
+        classified, e.g. to write it while the next ones are classified.
         """
         mapped_risk_events = []
         
         logger.info(f"Starting to map {len(risk_events)} risks to {len(concepts)} concepts")
+        if self.taxonomy is None or set(self.taxonomy.concepts) != {concept.uri for concept in concepts}:
+            self.build_taxonomy_index(concepts)
+        self.comparisons = 0
         
         for i, risk_event in enumerate(risk_events):
             logger.info(f"Processing risk {i+1}/{len(risk_events)}: {risk_event.description[:100]}...")
             
-            best_concept = self.find_best_matching_concept(risk_event.description, concepts)
+            if self.hierarchical:
+                match = self.classify_hierarchically(risk_event.description)
+                best_concept = match[0] if match else None
+            else:
+                best_concept = self.find_best_matching_concept(risk_event.description, concepts)
             
             if best_concept:
                 # Extract just the concept name from URI for the type
-                concept_name = best_concept.uri.split('#')[-1] if '#' in best_concept.uri else best_concept.label
+                concept_name = best_concept.name
                 
                 mapped_risk = MappedRisk(
                     neo4j_id=risk_event.neo4j_id,
                     description=best_concept.definition,
                     skos_type=concept_name,
+                    ancestors=[self.taxonomy.concepts[uri].name for uri in self.taxonomy.ancestors[best_concept.uri]],
                 )
                 mapped_risk_events.append(mapped_risk)
+                if on_mapped:
+                    on_mapped(mapped_risk)
                 logger.info(f"✓ Mapped risk event {risk_event.neo4j_id} to concept: {concept_name}")
             else:
                 logger.warning(f"✗ No matching concept found for risk event: {risk_event.description[:50]}...")
 
         logger.info(f"Successfully mapped {len(mapped_risk_events)} out of {len(risk_events)} risk events to risk classes")
+        if risk_events:
+            logger.info(f"Concept comparisons per risk event: {self.comparisons / len(risk_events):.1f}")
         return mapped_risk_events
 
-    def generate_cypher_statements(self, mapped_risks: List[MappedRisk]) -> List[str]:
+    def generate_cypher_statements(self, mapped_risks: List[MappedRisk]) -> List[Tuple[str, Dict]]:
         """
-        Generate Cypher statements to create new Risk nodes and connect them to RiskEvent nodes
+        Generate Cypher statements (with their parameters) to create new Risk nodes and connect them to RiskEvent nodes
         """
         cypher_statements = []
         
         for mapped_risk in mapped_risks:
             print(mapped_risk)
-            risk_event_id = mapped_risk.neo4j_id
-            new_uuid = str(uuid.uuid4())
-            
-           
-            # 1. Merge Risk node - create only if it doesn't exist based on type
-            # This will find existing Risk with same type or create new one
-
-            risk_type = mapped_risk.skos_type.replace("'", ".")
-            risk_description = mapped_risk.description.replace("'", ".")
-            merge_risk_statement = f"""MERGE (risk:Risk {{type: '{risk_type}'}}) ON CREATE SET risk.description = '{risk_description}', risk.uuid = '{new_uuid}' RETURN risk.uuid as risk_uuid;"""
-            cypher_statements.append(merge_risk_statement)
-            
-            # 2. Create materializedIn relationship from Risk to RiskEvent
-            # Use the type to find the Risk node since it might be existing or new
-            relationship_statement = f"""MATCH (risk:Risk {{type: '{risk_type}'}}), (risk_event:RiskEvent) WHERE id(risk_event) = {risk_event_id} MERGE (risk)-[:materializedIn]->(risk_event);"""
-            cypher_statements.append(relationship_statement)
-            
-            # Add separator
-            cypher_statements.append("\n// " + "="*50 + "\n")
+            cypher_statements.extend(self.statements_for_mapped_risk(mapped_risk))
+        
+        return cypher_statements
+
+    def statements_for_mapped_risk(self, mapped_risk: MappedRisk) -> List[Tuple[str, Dict]]:
+        """
+        Cypher statements and their parameters that create the Risk node of a mapped risk and connect it
+        to its RiskEvent node. The concept names are passed as parameters, so a Risk node has the same
+        type whichever post-processing wrote it.
+        """
+        cypher_statements = []
+        # The ancestors (taxonomy closure) are stored on the Risk node, so that aggregations on
+        # a broader category are a property lookup, e.g. WHERE 'TechnologicalRisk' IN risk.ancestors
+        parameters = {
+            "risk_type": mapped_risk.skos_type,
+            "risk_description": mapped_risk.description,
+            "risk_uuid": str(uuid.uuid4()),
+            "risk_ancestors": mapped_risk.ancestors,
+            "risk_event_id": int(mapped_risk.neo4j_id),
+        }
+       
+        # 1. Merge Risk node - create only if it doesn't exist based on type
+        # This will find existing Risk with same type or create new one
+        merge_risk_statement = """MERGE (risk:Risk {type: $risk_type}) ON CREATE SET risk.description = $risk_description, risk.uuid = $risk_uuid SET risk.ancestors = $risk_ancestors RETURN risk.uuid as risk_uuid"""
+        cypher_statements.append((merge_risk_statement, parameters))
+        
+        # 2. Create materializedIn relationship from Risk to RiskEvent
+        # Use the type to find the Risk node since it might be existing or new
+        relationship_statement = """MATCH (risk:Risk {type: $risk_type}), (risk_event:RiskEvent) WHERE id(risk_event) = $risk_event_id MERGE (risk)-[:materializedIn]->(risk_event)"""
+        # the chunks of the RiskEvent have a new SHACL focus node now
+        relationship_statement += RESET_CHUNK_VALIDATION
+        if self.attach_to_ancestors and mapped_risk.ancestors:
+            # 3. Connect the broader Risk nodes as well, in the same write
+            relationship_statement += """ WITH risk_event UNWIND $risk_ancestors AS ancestor_type MERGE (ancestor:Risk {type: ancestor_type}) ON CREATE SET ancestor.uuid = randomUUID() MERGE (ancestor)-[:materializedIn]->(risk_event)"""
+        cypher_statements.append((relationship_statement, parameters))
         
         return cypher_statements
+
+    def write_lock_keys(self, mapped_risk: MappedRisk) -> List[str]:
+        """Risk types whose nodes the statements of the mapped risk MERGE"""
+        if self.attach_to_ancestors:
+            return [mapped_risk.skos_type] + mapped_risk.ancestors
+        return [mapped_risk.skos_type]
+
+    def write_mapped_risk(self, mapped_risk: MappedRisk) -> Future:
+        """
+        Write a mapped risk in one managed transaction, concurrently with other writes. Writes that
+        MERGE the same Risk nodes are serialized, so concurrent MERGEs cannot create duplicates.
+        """
+        statements = self.statements_for_mapped_risk(mapped_risk)
+        future = self.graph_io.write_transaction(statements, lock_keys=self.write_lock_keys(mapped_risk))
+        future.add_done_callback(self._record_write)
+        return future
+
+    def _record_write(self, future: Future):
+        if future.exception() is not None:
+            self.metrics.record("neo4j_write", 0.0, errors=1)
+            return
+        for result in future.result():
+            self.metrics.record("neo4j_write", result.seconds, **write_counters(result.counters))
+
+    def wait_for_writes(self, writes: List[Future]):
+        """Wait until all writes are done; raise the first error after all of them finished"""
+        wait(writes)
+        errors = [future.exception() for future in writes if future.exception() is not None]
+        logger.info(f"Finished {len(writes) - len(errors)} of {len(writes)} write transactions")
+        if errors:
+            logger.error(f"{len(errors)} write transactions failed, first error: {errors[0]}")
+            raise errors[0]
     
-    def execute_cypher_statements(self, statements: List[str]):
+    def execute_cypher_statements(self, statements: List[Tuple[str, Dict]]):
         """
-        Execute the generated Cypher statements
+        Execute the generated Cypher statements with their parameters
         """
         executed_count = 0
         
         print(statements)
         try:
-            with self.neo4j_driver.session() as session:
-                for statement in statements:
-                    if statement.strip() and not statement.strip().startswith('//'):
-                        try:
-                            logger.info(f"Executing statement {executed_count + 1}: {statement.strip()[:100]}...")
-                            result = session.run(statement)
-                            # Consume the result to ensure execution
-                            summary = result.consume()
-                            executed_count += 1
-                            logger.info(f"✓ Statement executed successfully. Nodes created: {summary.counters.nodes_created}, Relationships created: {summary.counters.relationships_created}, Nodes deleted: {summary.counters.nodes_deleted}")
-                        except Exception as stmt_error:
-                            logger.error(f"Error executing statement {executed_count + 1}: {stmt_error}")
-                            logger.error(f"Failed statement: {statement}")
-                            raise
+            # in order, one managed transaction each: later statements MATCH what earlier ones MERGE
+            for statement, parameters in statements:
+                if statement.strip():
+                    try:
+                        logger.info(f"Executing statement {executed_count + 1}: {statement.strip()[:100]}...")
+                        result = self.graph_io.write(statement, parameters).result()
+                        self.metrics.record("neo4j_write", result.seconds, **write_counters(result.counters))
+                        executed_count += 1
+                        logger.info(f"✓ Statement executed successfully. Nodes created: {result.counters.nodes_created}, Relationships created: {result.counters.relationships_created}, Nodes deleted: {result.counters.nodes_deleted}")
+                    except Exception as stmt_error:
+                        logger.error(f"Error executing statement {executed_count + 1}: {stmt_error}")
+                        logger.error(f"Failed statement: {statement} with {parameters}")
+                        raise
                             
             logger.info(f"Successfully executed {executed_count} Cypher statements")
             
@@ -276,9 +492,9 @@ class RiskTaxonomyMapper:
             logger.error(f"Error executing Cypher statements: {e}")
             raise
     
-    def run_complete_mapping(self):
+    def run_complete_mapping(self) -> List[MappedRisk]:
         """
-        Execute the complete mapping process
+        Execute the complete mapping process and return the mapped risks
         """
         logger.info("Starting complete risk taxonomy mapping process...")
         
@@ -286,40 +502,43 @@ class RiskTaxonomyMapper:
         concepts = self.get_skos_concepts_from_scheme()
         if not concepts:
             logger.error("No SKOS concepts found. Aborting.")
-            return
+            return []
 
-        # Step 2: Get RiskEvent nodes from Neo4j
-        risks_events = self.get_risk_event_nodes_from_neo4j()
+        # Step 2: Get RiskEvent nodes from Neo4j, while the concepts are embedded
+        pending_risk_events = self.request_risk_event_nodes()
+        self.build_taxonomy_index(concepts)
+        risks_events = self.get_risk_event_nodes_from_neo4j(pending_risk_events)
         if not risks_events:
             logger.error("No RiskEvent nodes found in Neo4j. Aborting.")
-            return
+            return []
         
         print(risks_events)
-        # Step 3: Map risk events to risk classes
-        mapped_risks = self.create_mapped_risks(risks_events, concepts)
+        # Step 3: Map risk events to risk classes; each mapped risk is written (Step 4) while the next ones are mapped
+        writes: List[Future] = []
+        with self.metrics.span("taxonomy_mapping") as span:
+            mapped_risks = self.create_mapped_risks(
+                risks_events, concepts, on_mapped=lambda mapped_risk: writes.append(self.write_mapped_risk(mapped_risk)))
+            span.count("risk_events", len(risks_events))
+            span.count("concept_comparisons", self.comparisons)
         if not mapped_risks:
             logger.error("No risk events could be mapped. Aborting.")
-            return
+            return []
         
-        # Step 4: Generate Cypher statements
-        statements = self.generate_cypher_statements(mapped_risks)
-    
-    
-        for i, stmt in enumerate(statements[:5]):  # Show first 5 statements
-            logger.info(f"Statement {i+1}: {stmt.strip()}")
-        logger.info(f"... and {len(statements)-5} more statements would be generated")
-
-        logger.info(f"About to execute {len(statements)} Cypher statements...")
-        # Step 5: Execute statements
-        self.execute_cypher_statements(statements)
+        # Step 4: Wait for the writes of the mapped risks
+        logger.info(f"Waiting for {len(writes)} write transactions...")
+        self.wait_for_writes(writes)
         
         logger.info("Risk taxonomy mapping process completed successfully!")
+        return mapped_risks
     
     def close(self):
-        """Close the Neo4j driver"""
-        self.neo4j_driver.close()
+        """
+        Nothing to release: the graph I/O and the embedding model are shared with other users,
+        the entry point closes the connections with close_drivers()
+        """
 
-def create_company_risk_event_relationships(company_name, processing_date, neo4j_uri, neo4j_user, neo4j_password):
+def create_company_risk_event_relationships(company_name, processing_date, neo4j_uri, neo4j_user, neo4j_password,
+                                            graph_io: Optional[GraphIO] = None):
     """
     Create a Company node and connect all RiskEvent nodes to it with 'relevantFor' relationships.
     
@@ -329,40 +548,40 @@ def create_company_risk_event_relationships(company_name, processing_date, neo4j
         neo4j_uri (str): Neo4j database URI
         neo4j_user (str): Neo4j username
         neo4j_password (str): Neo4j password
+        graph_io (GraphIO): Graph I/O to use instead of the shared connection
+
+    Returns:
+        int: Number of connected RiskEvent nodes
     """
-    driver = None
+    connected_events = 0
     try:
-        from neo4j import GraphDatabase
-        driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+        graph_io = graph_io or get_graph_io(neo4j_uri, neo4j_user, neo4j_password)
         
-        with driver.session() as session:
-            # Create Company node if it doesn't exist
-            create_company_query = """
-            MERGE (c:Company {name: $company_name})
-            RETURN c.name as name
-            """
-            result = session.run(create_company_query, company_name=company_name)
-            company_record = result.single()
-            if company_record:
-                logger.info(f"Company node created/found: {company_record['name']}")
-            
-            # Connect all RiskEvent nodes to the Company with date property
-            connect_events_query = """
-            MATCH (c:Company {name: $company_name})
-            MATCH (re:RiskEvent)
-            MERGE (re)-[:occursFor {date: $processing_date}]->(c)
-            RETURN count(re) as connected_events
-            """
-            result = session.run(connect_events_query, company_name=company_name, processing_date=processing_date)
-            count_record = result.single()
-            if count_record:
-                logger.info(f"Connected {count_record['connected_events']} RiskEvent nodes to Company '{company_name}'")
+        # Create Company node if it doesn't exist
+        create_company_query = """
+        MERGE (c:Company {name: $company_name})
+        RETURN c.name as name
+        """
+        # Connect all RiskEvent nodes to the Company with date property
+        connect_events_query = """
+        MATCH (c:Company {name: $company_name})
+        MATCH (re:RiskEvent)
+        MERGE (re)-[:occursFor {date: $processing_date}]->(c)
+        RETURN count(re) as connected_events
+        """
+        parameters = {"company_name": company_name, "processing_date": processing_date}
+        company, connected = graph_io.write_transaction(
+            [(create_company_query, parameters), (connect_events_query, parameters)]).result()
+        if company.records:
+            logger.info(f"Company node created/found: {company.records[0]['name']}")
+        if connected.records:
+            connected_events = connected.records[0]['connected_events']
+            logger.info(f"Connected {connected_events} RiskEvent nodes to Company '{company_name}'")
                 
     except Exception as e:
         logger.error(f"Error creating company relationships: {e}")
-    finally:
-        if driver:
-            driver.close()
+        raise
+    return connected_events
 
 def main():
     """Main function to run the risk taxonomy mapping"""
@@ -388,11 +607,22 @@ def main():
             neo4j_user=NEO4J_USERNAME,
             neo4j_password=NEO4J_PASSWORD
         )
+        record_ingestion_run(mapper.graph_io, "post_processing")
+
+        # The Risk nodes targeted by the SHACL shapes exist now; only chunks not validated yet are checked
+        with mapper.metrics.span("shacl_validation") as span:
+            validator = IncrementalShaclValidator(get_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD))
+            reports = validator.validate_new_chunks()
+            span.count("chunks", len(reports))
+        logger.info(f"Chunks with violations: {sum(not r.conforms for r in reports)}/{len(reports)}")
 
     except Exception as e:
         logger.error(f"Error in main execution: {e}")
     finally:
         mapper.close()
+        close_drivers()
+        logger.info("Stage metrics:\n" + mapper.metrics.format_summary())
+        mapper.metrics.write(METRICS_DIR, basename="post_processing")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,192 @@
+"""
+Shared Neo4j Connections
+
+One connection pool per database for all pipeline stages instead of a driver per script,
+class and function:
+- get_driver: shared sync driver, for the neo4j_graphrag components (SimpleKGPipeline,
+  resolvers), which need a sync driver
+- get_graph_io: shared async driver running on its own event loop thread. Reads and writes
+  are submitted as managed transactions (retried on transient errors such as deadlocks or
+  leader changes) and return futures, so graph I/O runs concurrently while the calling
+  thread keeps embedding texts or waiting for the LLM.
+
+Writes that touch the same nodes can be serialized with lock keys (e.g. the type of the
+Risk node they MERGE), while all other writes run concurrently up to the pool size.
+
+Usage:
+    graph_io = get_graph_io()
+    pending = graph_io.read("MATCH (r:RiskEvent) RETURN r")
+    ...  # other work
+    records = pending.result()
+    close_drivers()
+
+Requirements:
+- neo4j (5.x) for the sync and async drivers
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from neo4j import AsyncGraphDatabase, GraphDatabase
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+
+# Connection pool shared by all stages of a run
+POOL_SETTINGS = {
+    "max_connection_pool_size": 50,
+    "connection_acquisition_timeout": 120.0,  # LLM stages can hold sessions for a while
+    "max_connection_lifetime": 3600,
+    "liveness_check_timeout": 60.0,  # test connections idle for longer before reuse
+    "keep_alive": True,
+    "max_transaction_retry_time": 30.0,  # retries of managed transactions on transient errors
+}
+MAX_CONCURRENT_TRANSACTIONS = 16
+
+Statement = Tuple[str, Optional[Dict[str, Any]]]
+
+
+@dataclass
+class WriteResult:
+    """Records and counters of one statement of a write transaction"""
+    records: List[Dict[str, Any]]
+    counters: Any  # neo4j SummaryCounters
+    seconds: float
+
+
+class GraphIO:
+    def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str, database: Optional[str] = None,
+                 max_concurrency: int = MAX_CONCURRENT_TRANSACTIONS, **pool_settings):
+        """Start the event loop thread and open the async driver on it"""
+        self.database = database
+        self.max_concurrency = max_concurrency
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="neo4j-graph-io", daemon=True)
+        self._thread.start()
+        settings = {**POOL_SETTINGS, **pool_settings}
+        self.neo4j_driver = self._submit(self._open(neo4j_uri, (neo4j_user, neo4j_password), settings)).result()
+
+    async def _open(self, uri: str, auth: Tuple[str, str], settings: Dict[str, Any]):
+        # created on the loop thread, which all transactions run on
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # lock per key with the number of transactions holding or waiting for it, dropped when unused
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = defaultdict(int)
+        return AsyncGraphDatabase.driver(uri, auth=auth, **settings)
+
+    def _submit(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    @staticmethod
+    async def _read_work(tx, query: str, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        result = await tx.run(query, parameters)
+        return await result.data()
+
+    @staticmethod
+    async def _write_work(tx, statements: Sequence[Statement]) -> List[WriteResult]:
+        results = []
+        for query, parameters in statements:
+            started = time.perf_counter()
+            result = await tx.run(query, parameters or {})
+            records = await result.data()
+            summary = await result.consume()
+            results.append(WriteResult(records, summary.counters, time.perf_counter() - started))
+        return results
+
+    async def _run(self, write: bool, work, *args, lock_keys: Sequence[str] = ()):
+        # locks are taken in sorted order, so transactions with overlapping keys cannot deadlock
+        keys = sorted(set(lock_keys))
+        for key in keys:
+            self._lock_users[key] += 1
+        acquired = []
+        try:
+            for key in keys:
+                lock = self._locks.setdefault(key, asyncio.Lock())
+                await lock.acquire()
+                acquired.append(lock)
+            async with self._semaphore:
+                async with self.neo4j_driver.session(database=self.database) as session:
+                    if write:
+                        return await session.execute_write(work, *args)
+                    return await session.execute_read(work, *args)
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for key in keys:
+                self._lock_users[key] -= 1
+                if not self._lock_users[key]:
+                    del self._lock_users[key]
+                    self._locks.pop(key, None)
+
+    def read(self, query: str, parameters: Optional[Dict[str, Any]] = None) -> Future:
+        """Run a read query in a managed transaction; the future resolves to the records as dicts"""
+        return self._submit(self._run(False, self._read_work, query, parameters or {}))
+
+    def write(self, query: str, parameters: Optional[Dict[str, Any]] = None, lock_keys: Sequence[str] = ()) -> Future:
+        """Run a write query in a managed transaction; the future resolves to a WriteResult"""
+        return self._submit(self._write_single(query, parameters or {}, lock_keys))
+
+    async def _write_single(self, query: str, parameters: Dict[str, Any], lock_keys: Sequence[str]) -> WriteResult:
+        results = await self._run(True, self._write_work, [(query, parameters)], lock_keys=lock_keys)
+        return results[0]
+
+    def write_transaction(self, statements: Sequence[Statement], lock_keys: Sequence[str] = ()) -> Future:
+        """Run several statements in order in one managed transaction; resolves to one WriteResult per statement"""
+        return self._submit(self._run(True, self._write_work, list(statements), lock_keys=lock_keys))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._submit(self.neo4j_driver.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_drivers: Dict[Tuple[str, str], Any] = {}
+_graph_ios: Dict[Tuple[str, str], GraphIO] = {}
+_registry_lock = threading.Lock()
+
+
+def get_driver(neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME, neo4j_password: str = NEO4J_PASSWORD):
+    """Sync driver with the tuned pool, shared by everything connecting to the same database"""
+    with _registry_lock:
+        key = (neo4j_uri, neo4j_user)
+        if key not in _drivers:
+            _drivers[key] = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password), **POOL_SETTINGS)
+            logger.info(f"Opened shared Neo4j driver for {neo4j_uri}")
+        return _drivers[key]
+
+
+def get_graph_io(neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME,
+                 neo4j_password: str = NEO4J_PASSWORD) -> GraphIO:
+    """Async graph I/O with the tuned pool, shared by everything connecting to the same database"""
+    with _registry_lock:
+        key = (neo4j_uri, neo4j_user)
+        if key not in _graph_ios:
+            _graph_ios[key] = GraphIO(neo4j_uri, neo4j_user, neo4j_password)
+            logger.info(f"Opened shared async Neo4j driver for {neo4j_uri}")
+        return _graph_ios[key]
+
+
+def close_drivers():
+    """Close all shared drivers (at the end of a run)"""
+    with _registry_lock:
+        for driver in _drivers.values():
+            driver.close()
+        for graph_io in _graph_ios.values():
+            graph_io.close()
+        _drivers.clear()
+        _graph_ios.clear()
@@ -0,0 +1,320 @@
+"""
+Pipeline Runner
+
+Runs a pipeline modelled as a DAG of stages. Every stage output is persisted as an artifact
+(tables as Parquet, arrays as .npy, everything else as JSON) under a key derived from the
+stage parameters, the content of its input files and the keys of the stages it depends on.
+
+- A stage whose artifact exists for the current key is not run again, so a failed run resumes
+  from the first incomplete stage. Changing a document, the ontology or a parameter only
+  re-runs the stages downstream of the change.
+- Long running stages can store checkpoints (e.g. the LLM slices already processed) and
+  continue from there after a failure.
+- Stages whose dependencies are complete run in parallel in a thread pool.
+
+Embedding matrices can be stored compactly (int8 with per-vector scales, memory-mapped) with
+the EMBEDDINGS kind.
+
+Usage:
+    stages = [
+        Stage("load", load_document, inputs=[pdf_path]),
+        Stage("chunk", chunk, depends_on=["load"], params={"chunk_size": 2000}),
+    ]
+    PipelineRunner(stages, ArtifactStore(Path("artifacts"))).run()
+
+Requirements:
+- pyarrow for the Parquet artifacts
+- numpy for the array and embedding artifacts
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import PipelineMetrics
+from embedding_store import EmbeddingStore
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Artifact kinds and their file extensions
+TABLE = "table"  # list of dicts with the same keys -> Parquet
+ARRAY = "array"  # numpy array -> .npy
+JSON = "json"    # any JSON serializable value
+EMBEDDINGS = "embeddings"  # float matrix -> int8 EmbeddingStore (codes .npy, .scales.npy, metadata .json)
+EXTENSIONS = {TABLE: ".parquet", ARRAY: ".npy", JSON: ".json", EMBEDDINGS: ".json"}
+EMBEDDINGS_DTYPE = "int8"
+
+
+class PipelineError(Exception):
+    """Raised when a stage fails; completed stages stay persisted for the next run"""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[["StageContext"], Any]
+    depends_on: List[str] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)  # part of the key, must be JSON serializable
+    inputs: List[Path] = field(default_factory=list)  # external files whose content is part of the key
+    kind: str = TABLE
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 of the file content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Stage artifacts on disk: <root>/<stage>/<key>.<ext> with a <key>.done.json manifest written last"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, stage: str, key: str, suffix: str) -> Path:
+        return self.root / stage / f"{key}{suffix}"
+
+    def is_complete(self, stage: str, key: str) -> bool:
+        return self._path(stage, key, ".done.json").exists()
+
+    def save(self, stage: str, key: str, kind: str, value: Any, duration: float):
+        directory = self.root / stage
+        directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(stage, key, EXTENSIONS[kind])
+        # written under a temporary name and renamed, so an interrupted write never looks complete
+        tmp = path.with_name(path.name + ".tmp")
+        if kind == EMBEDDINGS:
+            # several files (codes, scales, metadata); only the manifest below marks them complete
+            EmbeddingStore.save(directory / key, value, dtype=EMBEDDINGS_DTYPE)
+        else:
+            if kind == TABLE:
+                pq.write_table(pa.Table.from_pylist(list(value or [])), tmp)
+            elif kind == ARRAY:
+                with open(tmp, "wb") as f:
+                    np.save(f, np.asarray(value))
+            else:
+                tmp.write_text(json.dumps(value, default=str), encoding="utf-8")
+            tmp.replace(path)
+
+        manifest = {
+            "stage": stage,
+            "key": key,
+            "kind": kind,
+            "file": path.name,
+            "rows": len(value) if hasattr(value, "__len__") else None,
+            "duration_seconds": duration,
+            "completed_at": datetime.now().isoformat(),
+        }
+        self._path(stage, key, ".done.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        self.clear_checkpoint(stage, key)
+
+    def load(self, stage: str, key: str, kind: str) -> Any:
+        path = self._path(stage, key, EXTENSIONS[kind])
+        if kind == TABLE:
+            return pq.read_table(path).to_pylist()
+        if kind == ARRAY:
+            return np.load(path, mmap_mode="r")
+        if kind == EMBEDDINGS:
+            return EmbeddingStore.open(self.root / stage / key)
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def load_checkpoint(self, stage: str, key: str) -> Optional[Any]:
+        path = self._path(stage, key, ".checkpoint.json")
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def save_checkpoint(self, stage: str, key: str, state: Any):
+        directory = self.root / stage
+        directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(stage, key, ".checkpoint.json")
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(state, default=str), encoding="utf-8")
+        tmp.replace(path)
+
+    def clear_checkpoint(self, stage: str, key: str):
+        self._path(stage, key, ".checkpoint.json").unlink(missing_ok=True)
+
+
+@dataclass
+class StageContext:
+    """What a stage function gets: the outputs of its dependencies and access to its checkpoint"""
+    stage: Stage
+    key: str
+    inputs: Dict[str, Any]
+    store: ArtifactStore
+
+    def checkpoint(self) -> Optional[Any]:
+        """State saved by an earlier, interrupted run of this stage (None if there is none)"""
+        return self.store.load_checkpoint(self.stage.name, self.key)
+
+    def save_checkpoint(self, state: Any):
+        self.store.save_checkpoint(self.stage.name, self.key, state)
+
+
+class PipelineRunner:
+    def __init__(self, stages: List[Stage], store: ArtifactStore, max_workers: int = 4,
+                 metrics: Optional[PipelineMetrics] = None):
+        """Validate the DAG and compute the key of every stage"""
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.store = store
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self.order = self._topological_order()
+        self.keys = self._compute_keys()
+        self._outputs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str, path: List[str]):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}' (required by '{path[-1]}')")
+            state[name] = "visiting"
+            for dependency in self.stages[name].depends_on:
+                visit(dependency, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def _compute_keys(self) -> Dict[str, str]:
+        keys: Dict[str, str] = {}
+        for name in self.order:
+            stage = self.stages[name]
+            description = {
+                "stage": name,
+                "params": stage.params,
+                "inputs": {str(path): file_digest(path) for path in stage.inputs},
+                "depends_on": {dependency: keys[dependency] for dependency in stage.depends_on},
+            }
+            encoded = json.dumps(description, sort_keys=True, default=str).encode("utf-8")
+            keys[name] = hashlib.sha256(encoded).hexdigest()[:16]
+        return keys
+
+    def _downstream(self, names: Iterable[str]) -> set:
+        """The given stages and all stages depending on them"""
+        selected = set(names)
+        for name in self.order:
+            if any(dependency in selected for dependency in self.stages[name].depends_on):
+                selected.add(name)
+        return selected
+
+    def _required(self, targets: Iterable[str]) -> set:
+        """The given stages and all stages they depend on"""
+        required: set = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].depends_on)
+        return required
+
+    def status(self) -> Dict[str, bool]:
+        """Whether the artifact of each stage exists for its current key"""
+        return {name: self.store.is_complete(name, self.keys[name]) for name in self.order}
+
+    def output(self, name: str) -> Any:
+        """Output of a completed stage, loaded from its artifact if it was not produced in this run"""
+        with self._lock:
+            if name not in self._outputs:
+                stage = self.stages[name]
+                self._outputs[name] = self.store.load(name, self.keys[name], stage.kind)
+            return self._outputs[name]
+
+    def _execute(self, name: str) -> Any:
+        stage = self.stages[name]
+        key = self.keys[name]
+        context = StageContext(stage=stage, key=key, store=self.store,
+                               inputs={dependency: self.output(dependency) for dependency in stage.depends_on})
+        logger.info(f"▶ Running stage '{name}' ({key})")
+        started = time.perf_counter()
+        if self.metrics is not None:
+            with self.metrics.span(f"stage:{name}"):
+                result = stage.run(context)
+        else:
+            result = stage.run(context)
+        duration = time.perf_counter() - started
+        self.store.save(name, key, stage.kind, result, duration)
+        # dependent stages get the stored artifact (int8 embeddings, Parquet/JSON types), exactly as after a resume
+        result = self.store.load(name, key, stage.kind)
+        with self._lock:
+            self._outputs[name] = result
+        logger.info(f"✓ Stage '{name}' completed in {duration:.1f}s")
+        return result
+
+    def run(self, targets: Optional[List[str]] = None, force: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        Run the stages needed for the targets (default: all), skipping stages that are complete.
+        Stages in `force` and everything downstream of them are run again.
+        Returns the status per stage: "cached", "completed", "failed" or "skipped".
+        """
+        required = self._required(targets or self.order)
+        forced = self._downstream(force)
+        status: Dict[str, str] = {}
+        for name in self.order:
+            if name in required and name not in forced and self.store.is_complete(name, self.keys[name]):
+                status[name] = "cached"
+                logger.info(f"↺ Stage '{name}' is complete ({self.keys[name]}), skipping")
+        pending = [name for name in self.order if name in required and name not in status]
+
+        running: Dict[Future, str] = {}
+        failure: Optional[PipelineError] = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if failure is None:
+                    for name in list(pending):
+                        dependencies = self.stages[name].depends_on
+                        if all(status.get(d) in ("cached", "completed") for d in dependencies):
+                            pending.remove(name)
+                            running[executor.submit(self._execute, name)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        status[name] = "completed"
+                    else:
+                        status[name] = "failed"
+                        logger.error(f"✗ Stage '{name}' failed: {error}")
+                        # stages already running are allowed to finish, so their work is kept
+                        failure = failure or PipelineError(name, error)
+
+        for name in pending:
+            status[name] = "skipped"
+        if failure is not None:
+            logger.error(f"Pipeline stopped, completed stages are kept. Stage status: {status}")
+            raise failure
+        return status
@@ -0,0 +1,430 @@
+"""
+Portfolio Post-Processing
+
+Post-processing (kg_post_processing.py) for a database with the reports of many companies:
+instead of mapping every RiskEvent in one pass and linking all of them to COMPANY_NAME, the
+RiskEvents are partitioned and the partitions are mapped in parallel.
+
+- Partitions: by ingestion run (the IngestionRun stamped on the RiskEvents, see
+  graphrag_retrieval.record_ingestion_run), the default, or by company. Extraction does not link
+  RiskEvents to companies (occursFor is written by the post-processing), so freshly ingested
+  RiskEvents are partitioned by run, and a JSON file mapping documents to companies (or
+  --company for all runs) links each run to its company. Company mode is for re-mapping
+  (--remap) RiskEvents that are already linked.
+- The concepts are embedded once; the concept matrix is placed in shared memory and the worker
+  processes classify against it without copies. Each worker loads the embedding model once and
+  encodes the descriptions of a partition in one batch.
+- The mapped risks of a partition are written in batches (UNWIND) as concurrent managed
+  transactions, while the workers continue with the next partitions.
+- A failing partition (classification or write) is reported and the others continue.
+
+Usage:
+    python portfolio_post_processing.py --companies companies.json --workers 8
+    python portfolio_post_processing.py --partition company --remap
+
+Requirements:
+- rdflib for ontology processing
+- neo4j for database operations
+- sentence-transformers for semantic similarity matching
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from embedding_store import get_similarity_model
+from instrumentation import PipelineMetrics, write_counters
+from kg_post_processing import MappedRisk, RiskTaxonomyMapper, TaxonomyIndex
+from neo4j_connection import GraphIO, close_drivers, get_graph_io
+from shacl_validation import RESET_CHUNK_VALIDATION
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+ONTOLOGY_FILE = Path(__file__).resolve().parents[1] / "semantics" / "bizrisk.ttl"
+METRICS_DIR = Path(__file__).resolve().parents[1] / "metrics"
+
+PARTITION_MODES = ("company", "run")
+UNASSIGNED = "unassigned"  # RiskEvents without company / ingestion run
+WRITE_BATCH_SIZE = 500
+
+# RiskEvents not mapped yet (all with $remap), with their partition key
+PARTITION_QUERIES = {
+    "company": """
+        MATCH (risk_event:RiskEvent)
+        WHERE $remap OR NOT (:Risk)-[:materializedIn]->(risk_event)
+        OPTIONAL MATCH (risk_event)-[:occursFor]->(company:Company)
+        WITH risk_event, min(company.name) AS partition
+        RETURN id(risk_event) AS node_id, risk_event.hasRiskEventDescription AS description, partition
+        """,
+    "run": """
+        MATCH (risk_event:RiskEvent)
+        WHERE $remap OR NOT (:Risk)-[:materializedIn]->(risk_event)
+        RETURN id(risk_event) AS node_id, risk_event.hasRiskEventDescription AS description,
+               risk_event.ingestion_run AS partition
+        """,
+}
+
+RUN_DOCUMENTS_QUERY = "MATCH (run:IngestionRun) RETURN run.id AS run_id, run.document AS document"
+
+# Same nodes and relationships as RiskTaxonomyMapper.statements_for_mapped_risk, for a batch of mapped risks;
+# with $remap the previous Risk links of the RiskEvents are replaced
+WRITE_MAPPED_RISKS_QUERY = """
+UNWIND $rows AS row
+MATCH (risk_event:RiskEvent) WHERE id(risk_event) = row.risk_event_id
+CALL {
+    WITH risk_event
+    OPTIONAL MATCH (:Risk)-[previous:materializedIn]->(risk_event)
+    WITH previous WHERE $remap
+    DELETE previous
+}
+MERGE (risk:Risk {type: row.type})
+ON CREATE SET risk.description = row.description, risk.uuid = randomUUID()
+SET risk.ancestors = row.ancestors
+MERGE (risk)-[:materializedIn]->(risk_event)
+""" + RESET_CHUNK_VALIDATION + """
+WITH risk_event, row
+UNWIND CASE WHEN $attach_to_ancestors THEN row.ancestors ELSE [] END AS ancestor_type
+MERGE (ancestor:Risk {type: ancestor_type})
+ON CREATE SET ancestor.uuid = randomUUID()
+MERGE (ancestor)-[:materializedIn]->(risk_event)
+"""
+
+LINK_COMPANY_QUERY = """
+MERGE (company:Company {name: $company_name})
+WITH company
+UNWIND $risk_event_ids AS risk_event_id
+MATCH (risk_event:RiskEvent) WHERE id(risk_event) = risk_event_id
+MERGE (risk_event)-[:occursFor {date: $processing_date}]->(company)
+RETURN count(risk_event) AS connected_events
+"""
+
+
+@dataclass
+class Partition:
+    key: str
+    risk_event_ids: List[int] = field(default_factory=list)
+    descriptions: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PartitionResult:
+    key: str
+    risk_events: int
+    mapped: int = 0
+    written: int = 0
+    linked_company: Optional[str] = None
+    status: str = "pending"  # "completed" or "failed"
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+class SharedConceptMatrix:
+    """Concept embeddings (one row per concept) in shared memory, attached by the workers without copying"""
+
+    def __init__(self, matrix: np.ndarray):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.shape = matrix.shape
+        self.memory = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.float32, buffer=self.memory.buf)[:] = matrix
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @staticmethod
+    def attach(name: str, shape: Tuple[int, int]) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)  # owned by the parent process
+        except TypeError:  # Python < 3.13
+            memory = shared_memory.SharedMemory(name=name)
+        return memory, np.ndarray(shape, dtype=np.float32, buffer=memory.buf)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+# State of a worker process, set once by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(matrix_name: str, shape: Tuple[int, int], taxonomy: TaxonomyIndex, concept_uris: List[str],
+                 hierarchical: bool, beam_width: int, model_factory: Optional[Callable[[], Any]]):
+    memory, matrix = SharedConceptMatrix.attach(matrix_name, shape)
+    _worker.update(
+        memory=memory,  # keeps the mapping alive
+        matrix=matrix,
+        taxonomy=taxonomy,
+        concept_uris=concept_uris,
+        rows={uri: i for i, uri in enumerate(concept_uris)},
+        hierarchical=hierarchical,
+        beam_width=beam_width,
+        model=model_factory() if model_factory else get_similarity_model(),
+    )
+
+
+def map_partition(partition: Partition) -> Tuple[List[MappedRisk], float]:
+    """Classify the RiskEvents of a partition (runs in a worker process); returns the mapped risks and the seconds"""
+    started = time.perf_counter()
+    taxonomy: TaxonomyIndex = _worker["taxonomy"]
+    matrix: np.ndarray = _worker["matrix"]
+    rows: Dict[str, int] = _worker["rows"]
+    # RiskEvents without a description cannot be matched, like in RiskTaxonomyMapper
+    events = [(i, d) for i, d in zip(partition.risk_event_ids, partition.descriptions) if d]
+    if not events:
+        return [], time.perf_counter() - started
+    embeddings = np.asarray(_worker["model"].encode([d.lower() for _, d in events]), dtype=np.float32)
+
+    if _worker["hierarchical"]:
+        best = []
+        for embedding in embeddings:
+            def score(uris: List[str]) -> List[Tuple[str, float]]:
+                return list(zip(uris, (matrix[[rows[uri] for uri in uris]] @ embedding).tolist()))
+            best.append(taxonomy.descend(score, _worker["beam_width"])[0])
+    else:
+        best = [_worker["concept_uris"][i] for i in np.argmax(embeddings @ matrix.T, axis=1)]
+
+    mapped = []
+    for (risk_event_id, _), uri in zip(events, best):
+        concept = taxonomy.concepts[uri]
+        mapped.append(MappedRisk(neo4j_id=str(risk_event_id), description=concept.definition, skos_type=concept.name,
+                                 ancestors=[taxonomy.concepts[a].name for a in taxonomy.ancestors[uri]]))
+    return mapped, time.perf_counter() - started
+
+
+class PortfolioPostProcessor:
+    def __init__(self, ontology_file: Path = ONTOLOGY_FILE, partition_by: str = "run",
+                 workers: Optional[int] = None, neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME,
+                 neo4j_password: str = NEO4J_PASSWORD, graph_io: Optional[GraphIO] = None,
+                 hierarchical: bool = True, beam_width: int = 1, attach_to_ancestors: bool = False,
+                 write_batch_size: int = WRITE_BATCH_SIZE, model_factory: Optional[Callable[[], Any]] = None,
+                 metrics: Optional[PipelineMetrics] = None):
+        """
+        partition_by: "run" (ingestion run) or "company" (RiskEvents already linked with occursFor)
+        workers: worker processes (default: number of CPU cores)
+        model_factory: picklable callable creating the embedding model in each worker (default: shared model)
+        """
+        if partition_by not in PARTITION_MODES:
+            raise ValueError(f"Unknown partition mode '{partition_by}', expected one of {PARTITION_MODES}")
+        self.partition_by = partition_by
+        self.workers = workers or os.cpu_count() or 1
+        self.graph_io = graph_io or get_graph_io(neo4j_uri, neo4j_user, neo4j_password)
+        self.write_batch_size = write_batch_size
+        self.model_factory = model_factory
+        self.metrics = metrics or PipelineMetrics()
+        # the mapper provides the concepts, their embeddings and the write settings
+        self.mapper = RiskTaxonomyMapper(
+            ontology_file=str(ontology_file), neo4j_uri=neo4j_uri, neo4j_user=neo4j_user,
+            neo4j_password=neo4j_password, hierarchical=hierarchical, beam_width=beam_width,
+            attach_to_ancestors=attach_to_ancestors, graph_io=self.graph_io,
+            similarity_model=model_factory() if model_factory else None, metrics=self.metrics)
+
+    def request_partitions(self, remap: bool = False) -> Future:
+        """Start reading the RiskEvents to map; the future resolves to the records"""
+        return self.graph_io.read(PARTITION_QUERIES[self.partition_by], {"remap": remap})
+
+    def read_partitions(self, remap: bool = False, pending: Optional[Future] = None) -> List[Partition]:
+        """RiskEvents to map, grouped by company or ingestion run (from an already started read, if given)"""
+        records = (pending or self.request_partitions(remap)).result()
+        partitions: Dict[str, Partition] = {}
+        for record in records:
+            key = record["partition"] or UNASSIGNED
+            partition = partitions.setdefault(key, Partition(key))
+            partition.risk_event_ids.append(record["node_id"])
+            partition.descriptions.append(record["description"] or "")
+        # largest first, so a big partition does not end up running alone at the end
+        return sorted(partitions.values(), key=lambda p: len(p.risk_event_ids), reverse=True)
+
+    def write_batches(self, mapped_risks: List[MappedRisk], remap: bool = False) -> List[Future]:
+        """
+        Write the mapped risks in batches; batches MERGE-ing the same Risk types are serialized.
+        remap: replace the Risks the RiskEvents are already linked to
+        """
+        writes = []
+        mapped_risks = sorted(mapped_risks, key=lambda m: m.skos_type)  # same lock order in every batch
+        for start in range(0, len(mapped_risks), self.write_batch_size):
+            batch = mapped_risks[start:start + self.write_batch_size]
+            rows = [{"risk_event_id": int(m.neo4j_id), "type": m.skos_type, "description": m.description,
+                     "ancestors": m.ancestors} for m in batch]
+            lock_keys = {key for m in batch for key in self.mapper.write_lock_keys(m)}
+            future = self.graph_io.write(WRITE_MAPPED_RISKS_QUERY,
+                                         {"rows": rows, "attach_to_ancestors": self.mapper.attach_to_ancestors,
+                                          "remap": remap},
+                                         lock_keys=sorted(lock_keys))
+            future.add_done_callback(self._record_write)
+            writes.append(future)
+        return writes
+
+    def _record_write(self, future: Future):
+        if future.exception() is not None:
+            self.metrics.record("neo4j_write", 0.0, errors=1)
+        else:
+            result = future.result()
+            self.metrics.record("neo4j_write", result.seconds, **write_counters(result.counters))
+
+    def link_company(self, company: str, risk_event_ids: List[int], processing_date: str) -> Future:
+        return self.graph_io.write(LINK_COMPANY_QUERY, {"company_name": company, "risk_event_ids": risk_event_ids,
+                                                        "processing_date": processing_date})
+
+    def run_companies(self, companies: Dict[str, str], default_company: Optional[str] = None) -> Dict[str, str]:
+        """
+        Companies of the ingestion runs (run mode), from a mapping of document names to companies;
+        runs of other documents belong to default_company
+        """
+        if self.partition_by != "run" or not (companies or default_company):
+            return {}
+        records = self.graph_io.read(RUN_DOCUMENTS_QUERY).result()
+        run_companies = {r["run_id"]: companies.get(r["document"], default_company) for r in records}
+        return {run_id: company for run_id, company in run_companies.items() if company}
+
+    def warn_unpartitioned(self, partitions: List[Partition], run_companies: Dict[str, str]):
+        """Point out runs that would map everything in one partition or link no company"""
+        if partitions and all(p.key == UNASSIGNED for p in partitions):
+            if self.partition_by == "company":
+                logger.warning("No RiskEvent to map is linked to a company (occursFor is only written by the "
+                               "post-processing), so all of them are in one partition. Use --partition run.")
+            else:
+                logger.warning("No RiskEvent to map is stamped with an ingestion run, so all of them are in one "
+                               "partition. Record the ingestion runs (record_ingestion_run) after the extraction.")
+        elif self.partition_by == "run" and not any(p.key in run_companies for p in partitions):
+            logger.warning("No ingestion run has a company (--companies / --company), "
+                           "the RiskEvents are mapped but not linked to companies")
+
+    def run(self, remap: bool = False, companies: Optional[Dict[str, str]] = None,
+            default_company: Optional[str] = None) -> List[PartitionResult]:
+        """
+        Map all partitions in the worker pool and write them; returns one result per partition.
+        companies, default_company: companies of the ingestion runs (run mode), see run_companies
+        """
+        # the RiskEvents are read while the concepts are embedded
+        pending = self.request_partitions(remap)
+        concepts = self.mapper.get_skos_concepts_from_scheme()
+        if not concepts:
+            raise ValueError("No SKOS concepts found in the ontology")
+        taxonomy = self.mapper.build_taxonomy_index(concepts)
+        partitions = self.read_partitions(remap, pending)
+        run_companies = self.run_companies(companies or {}, default_company)
+        self.warn_unpartitioned(partitions, run_companies)
+        processing_date = datetime.today().strftime('%Y-%m-%d')
+        logger.info(f"{sum(len(p.risk_event_ids) for p in partitions)} RiskEvents in {len(partitions)} partitions "
+                    f"(by {self.partition_by}), {self.workers} workers")
+
+        uris = list(taxonomy.concepts)
+        shared = SharedConceptMatrix(np.stack([self.mapper._concept_embeddings[uri] for uri in uris]))
+        results = {p.key: PartitionResult(key=p.key, risk_events=len(p.risk_event_ids)) for p in partitions}
+        started: Dict[str, float] = {}
+        writes: Dict[str, List[Future]] = {}
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(shared.name, shared.shape, taxonomy, uris, self.mapper.hierarchical,
+                              self.mapper.beam_width, self.model_factory)) as pool:
+                futures = {}
+                for partition in partitions:
+                    started[partition.key] = time.perf_counter()
+                    futures[pool.submit(map_partition, partition)] = partition
+                for future in as_completed(futures):
+                    partition = futures[future]
+                    result = results[partition.key]
+                    try:
+                        mapped, seconds = future.result()
+                    except Exception as e:
+                        self._fail(result, "mapping", e)
+                        result.seconds = time.perf_counter() - started[partition.key]
+                        continue
+                    result.mapped = len(mapped)
+                    self.metrics.record("partition_mapping", seconds, risk_events=len(partition.risk_event_ids))
+                    try:
+                        partition_writes = self.write_batches(mapped, remap)
+                        company = run_companies.get(partition.key)
+                        if company:
+                            result.linked_company = company
+                            partition_writes.append(
+                                self.link_company(company, partition.risk_event_ids, processing_date))
+                    except Exception as e:
+                        self._fail(result, "writing", e)
+                        result.seconds = time.perf_counter() - started[partition.key]
+                        continue
+                    writes[partition.key] = partition_writes
+                    logger.info(f"Partition '{partition.key}': mapped {len(mapped)} of "
+                                f"{len(partition.risk_event_ids)} RiskEvents, writing")
+        finally:
+            shared.close()
+
+        for key, partition_writes in writes.items():
+            wait(partition_writes)
+            result = results[key]
+            errors = [f.exception() for f in partition_writes if f.exception() is not None]
+            if errors:
+                self._fail(result, "writing", errors[0])
+            else:
+                result.written = result.mapped
+                result.status = "completed"
+            result.seconds = time.perf_counter() - started[key]
+        failed = [r for r in results.values() if r.status == "failed"]
+        logger.info(f"Post-processing finished: {len(results) - len(failed)} of {len(results)} partitions completed")
+        return list(results.values())
+
+    @staticmethod
+    def _fail(result: PartitionResult, step: str, error: BaseException):
+        result.status = "failed"
+        result.error = f"{step}: {error}"
+        logger.error(f"✗ Partition '{result.key}' failed while {step}: {error}")
+
+    def close(self):
+        """Nothing to release: the graph I/O is shared, the entry point closes it with close_drivers()"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map the RiskEvents of many companies to the taxonomy in parallel")
+    parser.add_argument("--partition", choices=PARTITION_MODES, default="run")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU cores)")
+    parser.add_argument("--companies", type=Path, help="run mode: JSON file mapping document file names to companies")
+    parser.add_argument("--company", default=os.getenv('COMPANY_NAME'), help="run mode: company of the other runs")
+    parser.add_argument("--remap", action="store_true",
+                        help="also map RiskEvents that are already mapped, replacing their Risk links")
+    parser.add_argument("--attach-to-ancestors", action="store_true")
+    args = parser.parse_args()
+
+    companies = json.loads(args.companies.read_text(encoding="utf-8")) if args.companies else {}
+    processor = None
+    try:
+        processor = PortfolioPostProcessor(partition_by=args.partition, workers=args.workers,
+                                           attach_to_ancestors=args.attach_to_ancestors)
+        results = processor.run(remap=args.remap, companies=companies, default_company=args.company)
+        for result in sorted(results, key=lambda r: r.key):
+            line = f"{'✓' if result.status == 'completed' else '✗'} {result.key:30s} " \
+                   f"{result.mapped}/{result.risk_events} mapped, {result.seconds:.1f}s"
+            print(line + (f"  ({result.error})" if result.error else ""))
+    except Exception as e:
+        logger.error(f"Error in portfolio post-processing: {e}")
+    finally:
+        if processor is not None:
+            processor.close()
+            logger.info("Stage metrics:\n" + processor.metrics.format_summary())
+            processor.metrics.write(METRICS_DIR, basename="portfolio_post_processing")
+        close_drivers()
+
+
+if __name__ == "__main__":
+    main()
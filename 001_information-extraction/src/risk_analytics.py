@@ -0,0 +1,333 @@
+"""
+Cross-Company Risk Analytics
+
+Finds risks that materialize together across companies (Risk -[materializedIn]-> RiskEvent
+-[occursFor]-> Company) without traversing the graph for every dashboard query:
+- The Company x Risk incidence (number of RiskEvents per company and risk type) is read once
+  into a sparse matrix.
+- Risk co-occurrence (number of companies in which both risks materialized), lift and the
+  cosine / Jaccard similarity between companies are computed from it with sparse matrix
+  products.
+- Incidence and products are cached on disk. A refresh only reads the companies that are new or
+  whose events changed since the last refresh and updates the products with their rows.
+
+Usage:
+    analytics = RiskAnalytics()
+    analytics.refresh()
+    analytics.risk_pairs(min_companies=2)
+    analytics.similar_companies("ACME Corp")
+
+Requirements:
+- scipy for the sparse matrices
+- neo4j for reading the incidence
+"""
+
+import argparse
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from neo4j_connection import GraphIO, close_drivers, get_graph_io
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+CACHE_DIR = Path(__file__).resolve().parents[1] / "analytics"
+
+# Per company: what the cached rows were computed from, including the RiskEvents per risk type (a remap
+# can change the types without changing the counts); a company whose fingerprint differs is read again
+FINGERPRINT_QUERY = """
+MATCH (re:RiskEvent)-[o:occursFor]->(c:Company)
+OPTIONAL MATCH (risk:Risk)-[:materializedIn]->(re)
+WITH c, max(o.date) AS date, count(DISTINCT re) AS events, count(risk) AS links
+CALL {
+    WITH c
+    MATCH (risk:Risk)-[:materializedIn]->(re:RiskEvent)-[:occursFor]->(c)
+    WITH risk.type AS type, count(DISTINCT re) AS type_events
+    ORDER BY type
+    RETURN collect([type, type_events]) AS risks
+}
+RETURN c.name AS company, date, events, links, risks
+"""
+
+INCIDENCE_QUERY = """
+MATCH (risk:Risk)-[:materializedIn]->(re:RiskEvent)-[:occursFor]->(c:Company)
+WHERE c.name IN $companies
+RETURN c.name AS company, risk.type AS risk, count(DISTINCT re) AS events
+"""
+
+
+@dataclass
+class RiskPair:
+    """Two risks that materialized in the same companies"""
+    risk_a: str
+    risk_b: str
+    companies: int  # companies in which both materialized
+    lift: float  # > 1: together more often than if they were independent
+
+
+@dataclass
+class CompanySimilarity:
+    company: str
+    cosine: float  # on the number of events per risk
+    jaccard: float  # on the sets of risks
+    shared_risks: int
+
+
+def _resize(matrix: sp.spmatrix, shape: Tuple[int, int]) -> sp.csr_matrix:
+    """Same entries in a larger matrix (new companies / risk types)"""
+    coo = matrix.tocoo()
+    return sp.csr_matrix((coo.data, (coo.row, coo.col)), shape=shape)
+
+
+class RiskAnalytics:
+    def __init__(self, neo4j_uri: str = NEO4J_URI, neo4j_user: str = NEO4J_USERNAME,
+                 neo4j_password: str = NEO4J_PASSWORD, cache_dir: Path = CACHE_DIR,
+                 graph_io: Optional[GraphIO] = None):
+        """Load the cached incidence, if there is one; refresh() brings it up to date with the graph"""
+        self.graph_io = graph_io or get_graph_io(neo4j_uri, neo4j_user, neo4j_password)
+        self.cache_dir = cache_dir
+        self._lock = threading.RLock()
+        self.companies: List[str] = []
+        self.risks: List[str] = []
+        self.fingerprints: Dict[str, Dict] = {}
+        self.counts = sp.csr_matrix((0, 0), dtype=np.float64)  # companies x risks, RiskEvents per pair
+        self.cooccurrence = sp.csr_matrix((0, 0), dtype=np.float64)  # risks x risks, companies with both
+        self.company_products = np.zeros((0, 0))  # companies x companies, counts @ counts.T
+        self.company_overlap = np.zeros((0, 0))  # companies x companies, number of shared risks
+        self.updated_at: Optional[str] = None
+        self._load()
+
+    ########### CACHE ################################
+
+    def _paths(self) -> Dict[str, Path]:
+        return {
+            "counts": self.cache_dir / "counts.npz",
+            "cooccurrence": self.cache_dir / "cooccurrence.npz",
+            "companies": self.cache_dir / "companies.npz",
+            "index": self.cache_dir / "index.json",
+        }
+
+    def _load(self):
+        paths = self._paths()
+        if not paths["index"].exists():
+            return
+        index = json.loads(paths["index"].read_text(encoding="utf-8"))
+        self.companies = index["companies"]
+        self.risks = index["risks"]
+        self.fingerprints = index["fingerprints"]
+        self.updated_at = index["updated_at"]
+        self.counts = sp.load_npz(paths["counts"]).tocsr()
+        self.cooccurrence = sp.load_npz(paths["cooccurrence"]).tocsr()
+        with np.load(paths["companies"]) as products:
+            self.company_products = products["products"]
+            self.company_overlap = products["overlap"]
+        if self.counts.shape != (len(self.companies), len(self.risks)):
+            logger.warning("Risk analytics cache is incomplete (interrupted save), rebuilding on the next refresh")
+            self._reset()
+            return
+        logger.info(f"Loaded risk analytics cache: {len(self.companies)} companies, {len(self.risks)} risks "
+                    f"(updated {self.updated_at})")
+
+    def _save(self):
+        # the index is written last; a cache whose matrices do not match it is discarded on load
+        paths = self._paths()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        sp.save_npz(paths["counts"], self.counts)
+        sp.save_npz(paths["cooccurrence"], self.cooccurrence)
+        np.savez(paths["companies"], products=self.company_products, overlap=self.company_overlap)
+        index = {"companies": self.companies, "risks": self.risks, "fingerprints": self.fingerprints,
+                 "updated_at": self.updated_at}
+        tmp = paths["index"].with_name(paths["index"].name + ".tmp")
+        tmp.write_text(json.dumps(index, indent=2, default=str), encoding="utf-8")
+        tmp.replace(paths["index"])
+
+    ########### INCREMENTAL UPDATE ################################
+
+    def fetch_fingerprints(self) -> Dict[str, Dict]:
+        records = self.graph_io.read(FINGERPRINT_QUERY).result()
+        return {r["company"]: {"date": r["date"], "events": r["events"], "links": r["links"],
+                               "risks": [list(risk) for risk in r["risks"]]} for r in records}
+
+    def fetch_incidence(self, companies: List[str]) -> Dict[str, Dict[str, int]]:
+        """RiskEvents per risk type for each of the companies"""
+        rows: Dict[str, Dict[str, int]] = {company: {} for company in companies}
+        for record in self.graph_io.read(INCIDENCE_QUERY, {"companies": companies}).result():
+            if record["risk"] is not None:
+                rows[record["company"]][record["risk"]] = record["events"]
+        return rows
+
+    def refresh(self, force: bool = False) -> Dict[str, int]:
+        """
+        Bring the cache up to date with the graph: only new and changed companies are read.
+        A full rebuild happens with `force` or when companies were removed from the graph.
+        """
+        with self._lock:
+            fingerprints = self.fetch_fingerprints()
+            removed = set(self.companies) - set(fingerprints)
+            if force or removed:
+                if removed:
+                    logger.info(f"{len(removed)} companies were removed, rebuilding the analytics cache")
+                self._reset()
+            changed = [company for company, fingerprint in fingerprints.items()
+                       if self.fingerprints.get(company) != fingerprint]
+            if changed:
+                self.update(self.fetch_incidence(changed))
+            self.fingerprints = fingerprints
+            self.updated_at = datetime.now().isoformat()
+            self._save()
+            logger.info(f"Risk analytics refreshed: {len(changed)} of {len(fingerprints)} companies read")
+            return {"companies": len(self.companies), "risks": len(self.risks), "companies_read": len(changed)}
+
+    def _reset(self):
+        self.companies, self.risks, self.fingerprints = [], [], {}
+        self.counts = sp.csr_matrix((0, 0), dtype=np.float64)
+        self.cooccurrence = sp.csr_matrix((0, 0), dtype=np.float64)
+        self.company_products = np.zeros((0, 0))
+        self.company_overlap = np.zeros((0, 0))
+
+    def update(self, rows: Dict[str, Dict[str, int]]):
+        """
+        Replace or add the incidence rows of some companies and update the products with them:
+        co-occurrence changes by new.T @ new - old.T @ old, the company products only in the rows
+        and columns of these companies.
+        """
+        with self._lock:
+            company_index = {company: i for i, company in enumerate(self.companies)}
+            risk_index = {risk: i for i, risk in enumerate(self.risks)}
+            for company in rows:
+                if company not in company_index:
+                    company_index[company] = len(self.companies)
+                    self.companies.append(company)
+            for risk_counts in rows.values():
+                for risk in risk_counts:
+                    if risk not in risk_index:
+                        risk_index[risk] = len(self.risks)
+                        self.risks.append(risk)
+            n_companies, n_risks = len(self.companies), len(self.risks)
+            counts = _resize(self.counts, (n_companies, n_risks))
+            cooccurrence = _resize(self.cooccurrence, (n_risks, n_risks))
+
+            updated = np.array([company_index[company] for company in rows], dtype=np.int64)
+            entries = [(i, risk_index[risk], events) for i, risk_counts in enumerate(rows.values())
+                       for risk, events in risk_counts.items() if events]
+            r, c, v = (np.array(column) for column in zip(*entries)) if entries else ([], [], [])
+            new_rows = sp.csr_matrix((v, (r, c)), shape=(len(updated), n_risks), dtype=np.float64)
+            old_rows = counts[updated]
+
+            old_binary, new_binary = (old_rows > 0).astype(np.float64), (new_rows > 0).astype(np.float64)
+            cooccurrence = cooccurrence + new_binary.T @ new_binary - old_binary.T @ old_binary
+            cooccurrence.eliminate_zeros()
+
+            # replace the rows: counts - P.T @ old + P.T @ new, with P selecting the updated rows
+            selector = sp.csr_matrix((np.ones(len(updated)), (np.arange(len(updated)), updated)),
+                                     shape=(len(updated), n_companies))
+            counts = counts + selector.T @ (new_rows - old_rows)
+            counts.eliminate_zeros()
+
+            products = np.zeros((n_companies, n_companies))
+            overlap = np.zeros((n_companies, n_companies))
+            kept = len(self.company_products)
+            products[:kept, :kept] = self.company_products
+            overlap[:kept, :kept] = self.company_overlap
+            binary = (counts > 0).astype(np.float64)
+            products[updated, :] = (new_rows @ counts.T).toarray()
+            products[:, updated] = products[updated, :].T
+            overlap[updated, :] = (new_binary @ binary.T).toarray()
+            overlap[:, updated] = overlap[updated, :].T
+
+            self.counts, self.cooccurrence = counts, cooccurrence.tocsr()
+            self.company_products, self.company_overlap = products, overlap
+
+    ########### DASHBOARD QUERIES ################################
+
+    def risk_support(self) -> Dict[str, int]:
+        """Number of companies in which each risk materialized"""
+        support = self.cooccurrence.diagonal()
+        return {risk: int(support[i]) for i, risk in enumerate(self.risks)}
+
+    def risk_pairs(self, min_companies: int = 2, min_lift: float = 0.0, top: int = 20,
+                   risk: Optional[str] = None) -> List[RiskPair]:
+        """Pairs of risks by number of companies in which both materialized, then by lift"""
+        with self._lock:
+            n_companies = len(self.companies)
+            support = self.cooccurrence.diagonal()
+            if risk is None:
+                pairs = sp.triu(self.cooccurrence, k=1).tocoo()
+                rows, cols, together = pairs.row, pairs.col, pairs.data
+            else:
+                i = self.risks.index(risk)
+                row = self.cooccurrence[i].tocoo()
+                cols, together = row.col[row.col != i], row.data[row.col != i]
+                rows = np.full(len(cols), i)
+            lift = together * n_companies / (support[rows] * support[cols])
+            keep = (together >= min_companies) & (lift >= min_lift)
+            rows, cols, together, lift = rows[keep], cols[keep], together[keep], lift[keep]
+            order = np.lexsort((-lift, -together))[:top]
+            return [RiskPair(self.risks[rows[k]], self.risks[cols[k]], int(together[k]), float(lift[k]))
+                    for k in order]
+
+    def similar_companies(self, company: str, top: int = 5) -> List[CompanySimilarity]:
+        with self._lock:
+            i = self.companies.index(company)
+            norms = np.sqrt(np.diag(self.company_products))
+            cosine = self.company_products[i] / np.maximum(norms[i] * norms, 1e-12)
+            risks_per_company = np.diag(self.company_overlap)
+            union = risks_per_company[i] + risks_per_company - self.company_overlap[i]
+            jaccard = self.company_overlap[i] / np.maximum(union, 1)
+            order = [j for j in np.argsort(-cosine) if j != i][:top]
+            return [CompanySimilarity(self.companies[j], float(cosine[j]), float(jaccard[j]),
+                                      int(self.company_overlap[i, j])) for j in order]
+
+    def company_similarity_matrix(self) -> np.ndarray:
+        """Cosine similarity of all companies (order of self.companies)"""
+        with self._lock:
+            norms = np.sqrt(np.diag(self.company_products))
+            return self.company_products / np.maximum(np.outer(norms, norms), 1e-12)
+
+    def companies_with_risk(self, risk: str) -> Dict[str, int]:
+        """RiskEvents of the risk per company"""
+        with self._lock:
+            column = self.counts[:, self.risks.index(risk)].tocoo()
+            return {self.companies[i]: int(events) for i, events in zip(column.row, column.data)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the cached cross-company risk analytics")
+    parser.add_argument("--rebuild", action="store_true", help="read the whole incidence again")
+    parser.add_argument("--company", default=None, help="show the companies most similar to this one")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    analytics = None
+    try:
+        analytics = RiskAnalytics()
+        print(analytics.refresh(force=args.rebuild))
+        print("\nRisks materializing together across companies:")
+        for pair in analytics.risk_pairs(top=args.top):
+            print(f"  {pair.risk_a} + {pair.risk_b}: {pair.companies} companies, lift {pair.lift:.2f}")
+        if args.company:
+            print(f"\nCompanies most similar to {args.company}:")
+            for similar in analytics.similar_companies(args.company, top=args.top):
+                print(f"  {similar.company}: cosine {similar.cosine:.3f}, jaccard {similar.jaccard:.3f}, "
+                      f"{similar.shared_risks} shared risks")
+    except Exception as e:
+        logger.error(f"Risk analytics failed: {e}")
+    finally:
+        close_drivers()
+
+
+if __name__ == "__main__":
+    main()
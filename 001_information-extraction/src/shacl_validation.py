@@ -0,0 +1,267 @@
+"""
+Incremental SHACL Validation
+
+This script validates what the extraction pipeline wrote to Neo4j against the SHACL
+shapes in semantics/shapes.ttl. Instead of exporting the whole graph, only the subgraph
+touched since the last validation is exported: the Chunk nodes that were not validated yet,
+the entities extracted from them (FROM_CHUNK) and their relationships, e.g. to the Risk
+nodes linked by the post-processing.
+
+Validation is scoped to the focus nodes of that subgraph, and the results are reported per
+chunk. Every exported chunk is marked as validated (shaclFocusNodes = 0 and no shaclConforms
+if it had nothing to validate), so the next run only looks at new data. The Risk nodes
+targeted by the shapes are linked later by the post-processing: its writes append
+RESET_CHUNK_VALIDATION, which clears the mark of the chunks of the linked RiskEvent, so they
+are validated again. The parsed shapes, their target classes and the ontology term mapping
+are cached per file version.
+
+Requirements:
+- rdflib for ontology processing
+- pyshacl for SHACL validation
+- neo4j for database operations
+"""
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import OWL, RDF, SH, SKOS
+from pyshacl import validate
+
+from utils import get_local_part
+from neo4j_connection import get_driver, close_drivers
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+SEMANTICS_DIR = Path(__file__).resolve().parents[1] / "semantics"
+ONTOLOGY_FILE = SEMANTICS_DIR / "bizrisk.ttl"
+SHAPES_FILE = SEMANTICS_DIR / "shapes.ttl"
+
+NODE_NS = Namespace("http://example.com/bizrisk/node/")
+# Relationships of the lexical graph, which are not part of the domain ontology
+LEXICAL_RELATIONSHIPS = ["FROM_CHUNK", "NEXT_CHUNK", "FROM_DOCUMENT"]
+# Appended to writes that link a Risk to `risk_event`: its chunks are validated again by the next run
+RESET_CHUNK_VALIDATION = """
+CALL {
+    WITH risk_event
+    MATCH (risk_event)-[:FROM_CHUNK]->(chunk:Chunk)
+    SET chunk.shaclValidated = NULL
+}
+"""
+
+
+@dataclass
+class CompiledShapes:
+    """Parsed shapes graph and the classes its shapes target"""
+    graph: Graph
+    target_classes: Set[URIRef]
+
+
+@dataclass
+class OntologyTerms:
+    """Local names of ontology terms (as used for Neo4j labels/properties) mapped to their IRIs"""
+    graph: Graph
+    classes: Dict[str, URIRef]
+    datatype_properties: Dict[str, URIRef]
+    object_properties: Dict[str, URIRef]
+    concepts: Dict[str, URIRef]
+
+
+@dataclass
+class ChunkValidationReport:
+    chunk_id: str
+    chunk_index: Optional[int]
+    focus_nodes: int = 0
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def conforms(self) -> bool:
+        return not self.violations
+
+
+@lru_cache(maxsize=8)
+def _compile_shapes(shapes_file: str, mtime: float) -> CompiledShapes:
+    graph = Graph()
+    graph.parse(shapes_file, format="turtle")
+    target_classes = {URIRef(str(c)) for c in graph.objects(None, SH.targetClass)}
+    logger.info(f"Compiled {len(set(graph.subjects(RDF.type, SH.NodeShape)))} node shapes from {shapes_file}")
+    return CompiledShapes(graph=graph, target_classes=target_classes)
+
+
+def load_shapes(shapes_file: Path = SHAPES_FILE) -> CompiledShapes:
+    """Parse the shapes file once per file version"""
+    return _compile_shapes(str(shapes_file), shapes_file.stat().st_mtime)
+
+
+@lru_cache(maxsize=8)
+def _load_ontology_terms(ontology_file: str, mtime: float) -> OntologyTerms:
+    graph = Graph()
+    graph.parse(ontology_file, format="turtle")
+    classes = {get_local_part(str(c)): c for c in graph.subjects(RDF.type, OWL.Class) if isinstance(c, URIRef)}
+    datatype_properties = {get_local_part(str(p)): p for p in graph.subjects(RDF.type, OWL.DatatypeProperty)}
+    object_properties = {get_local_part(str(p)): p for p in graph.subjects(RDF.type, OWL.ObjectProperty)}
+    concepts = {get_local_part(str(c)): c for c in graph.subjects(RDF.type, SKOS.Concept)}
+    return OntologyTerms(graph, classes, datatype_properties, object_properties, concepts)
+
+
+def load_ontology_terms(ontology_file: Path = ONTOLOGY_FILE) -> OntologyTerms:
+    """Parse the ontology once per file version"""
+    return _load_ontology_terms(str(ontology_file), ontology_file.stat().st_mtime)
+
+
+class IncrementalShaclValidator:
+    def __init__(self, driver, ontology_file: Path = ONTOLOGY_FILE, shapes_file: Path = SHAPES_FILE):
+        """Initialize the validator with an existing Neo4j driver"""
+        self.neo4j_driver = driver
+        self.terms = load_ontology_terms(ontology_file)
+        self.shapes = load_shapes(shapes_file)
+        self._concept_iris = set(self.terms.concepts.values())
+
+    def node_iri(self, element_id: str, labels: List[str], props: Dict) -> URIRef:
+        """
+        IRI of an exported Neo4j node. Risk nodes created by the post-processing are merged by
+        their taxonomy type, so they are identified with the SKOS concept itself.
+        """
+        if "Risk" in labels and props.get("type") in self.terms.concepts:
+            return self.terms.concepts[props["type"]]
+        return NODE_NS[quote(element_id, safe="")]
+
+    def _add_node(self, data: Graph, iri: URIRef, labels: List[str], props: Dict):
+        if iri in self._concept_iris:
+            # taxonomy concepts bring their own description (type, skos:broader, ...) from the ontology
+            for triple in self.terms.graph.triples((iri, None, None)):
+                data.add(triple)
+        for label in labels:
+            if label in self.terms.classes:
+                data.add((iri, RDF.type, self.terms.classes[label]))
+        for name, value in props.items():
+            if name in self.terms.datatype_properties and value is not None:
+                for item in (value if isinstance(value, list) else [value]):
+                    data.add((iri, self.terms.datatype_properties[name], Literal(item)))
+
+    def export_unvalidated_subgraph(self) -> Tuple[Graph, Dict[URIRef, Set[str]], Dict[str, ChunkValidationReport]]:
+        """
+        Export entities of not yet validated chunks as RDF.
+        Returns the data graph, the chunks each focus node was extracted from, and an empty report per chunk.
+        """
+        query = """
+        MATCH (c:Chunk) WHERE c.shaclValidated IS NULL
+        OPTIONAL MATCH (e)-[:FROM_CHUNK]->(c)
+        OPTIONAL MATCH (e)-[r]-(o) WHERE NOT type(r) IN $lexical
+        RETURN elementId(c) AS chunk_id, c.index AS chunk_index,
+               elementId(e) AS id, labels(e) AS labels, properties(e) AS props,
+               collect(CASE WHEN r IS NULL THEN NULL ELSE
+                   {type: type(r), outgoing: startNode(r) = e,
+                    id: elementId(o), labels: labels(o), props: properties(o)} END) AS rels
+        """
+        data = Graph()
+        focus_chunks: Dict[URIRef, Set[str]] = defaultdict(set)
+        reports: Dict[str, ChunkValidationReport] = {}
+
+        with self.neo4j_driver.session() as session:
+            for record in session.run(query, lexical=LEXICAL_RELATIONSHIPS):
+                chunk_id = record["chunk_id"]
+                if chunk_id not in reports:
+                    reports[chunk_id] = ChunkValidationReport(chunk_id=chunk_id, chunk_index=record["chunk_index"])
+                if record["id"] is None:
+                    continue
+
+                iri = self.node_iri(record["id"], record["labels"], record["props"])
+                self._add_node(data, iri, record["labels"], record["props"])
+                focus_chunks[iri].add(chunk_id)
+
+                for rel in record["rels"]:
+                    target = self.node_iri(rel["id"], rel["labels"], rel["props"])
+                    # target nodes are exported one hop deep, so that value constraints on them can be checked
+                    self._add_node(data, target, rel["labels"], rel["props"])
+                    if rel["type"] in self.terms.object_properties:
+                        source, obj = (iri, target) if rel["outgoing"] else (target, iri)
+                        data.add((source, self.terms.object_properties[rel["type"]], obj))
+                    if any(c in self.shapes.target_classes for c in data.objects(target, RDF.type)):
+                        focus_chunks[target].add(chunk_id)
+
+        logger.info(f"Exported {len(data)} triples for {len(reports)} unvalidated chunks")
+        return data, focus_chunks, reports
+
+    def validate_new_chunks(self) -> List[ChunkValidationReport]:
+        """
+        Validate the subgraph extracted since the last validation and mark its chunks as validated.
+        Run it after the taxonomy mapping has linked the Risk nodes.
+        """
+        data, focus_chunks, reports = self.export_unvalidated_subgraph()
+        if not reports:
+            logger.info("No unvalidated chunks found")
+            return []
+
+        # Only nodes of classes targeted by a shape can produce results
+        focus_nodes = [iri for iri in focus_chunks
+                       if any(c in self.shapes.target_classes for c in data.objects(iri, RDF.type))]
+        for iri in focus_nodes:
+            for chunk_id in focus_chunks[iri]:
+                reports[chunk_id].focus_nodes += 1
+
+        if focus_nodes:
+            conforms, results_graph, _ = validate(
+                data,
+                shacl_graph=self.shapes.graph,
+                inference="none",
+                focus_nodes=focus_nodes,
+            )
+            for result in results_graph.subjects(RDF.type, SH.ValidationResult):
+                focus = results_graph.value(result, SH.focusNode)
+                message = results_graph.value(result, SH.resultMessage) or results_graph.value(result, SH.sourceShape)
+                for chunk_id in focus_chunks.get(focus, ()):
+                    reports[chunk_id].violations.append(f"{get_local_part(str(focus))}: {message}")
+            logger.info(f"Validated {len(focus_nodes)} focus nodes, conforms: {conforms}")
+
+        self._mark_validated(list(reports.values()))
+
+        for report in sorted(reports.values(), key=lambda r: (r.chunk_index is None, r.chunk_index)):
+            if report.conforms:
+                logger.info(f"✓ Chunk {report.chunk_index}: {report.focus_nodes} focus nodes conform")
+            else:
+                logger.warning(f"✗ Chunk {report.chunk_index}: {len(report.violations)} violations")
+                for violation in report.violations:
+                    logger.warning(f"    {violation}")
+        return list(reports.values())
+
+    def _mark_validated(self, reports: List[ChunkValidationReport]):
+        query = """
+        UNWIND $rows AS row
+        MATCH (c:Chunk) WHERE elementId(c) = row.chunk_id
+        SET c.shaclValidated = datetime(), c.shaclConforms = row.conforms, c.shaclFocusNodes = row.focus_nodes
+        """
+        # chunks without focus nodes had nothing to conform to
+        rows = [{"chunk_id": r.chunk_id, "conforms": r.conforms if r.focus_nodes else None,
+                 "focus_nodes": r.focus_nodes} for r in reports]
+        if not rows:
+            return
+        with self.neo4j_driver.session() as session:
+            session.run(query, rows=rows).consume()
+
+
+def main():
+    """Validate the chunks that were extracted since the last validation"""
+    driver = get_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+    try:
+        validator = IncrementalShaclValidator(driver)
+        validator.validate_new_chunks()
+    except Exception as e:
+        logger.error(f"Error during SHACL validation: {e}")
+    finally:
+        close_drivers()
+
+
+if __name__ == "__main__":
+    main()
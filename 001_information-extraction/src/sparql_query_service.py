@@ -0,0 +1,172 @@
+"""
+SPARQL Query Service
+
+This script loads ontology and instance TTL files once into an in-memory rdflib store
+and serves the .sparql queries of this repository as pre-compiled (prepared) queries.
+
+Results are memoized per (query, bindings) and invalidated by a graph version counter,
+which is increased every time the graph is modified through the service. Repeated
+lookups, such as finding the owner of a scope id, are then answered from the cache
+instead of re-parsing the TTL files and the query text.
+
+Requirements:
+- rdflib for ontology processing and SPARQL evaluation
+"""
+
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.term import Identifier
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.sparql import Query
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+REPO_ROOT = Path(__file__).resolve().parents[2]
+ORG_SEMANTICS_DIR = REPO_ROOT / "002_master-data-and-asset-management" / "semantics"
+ORG_QUERIES_DIR = REPO_ROOT / "002_master-data-and-asset-management" / "queries"
+BIZRISK_SEMANTICS_DIR = REPO_ROOT / "001_information-extraction" / "semantics"
+BIZRISK_QUERIES_DIR = REPO_ROOT / "001_information-extraction" / "sparql"
+
+Binding = Union[Identifier, str, int, float, bool]
+CacheKey = Tuple[str, Tuple[Tuple[str, Identifier], ...]]
+
+
+class SparqlQueryService:
+    def __init__(self, ttl_files: Iterable[Union[str, Path]] = (), query_dirs: Iterable[Union[str, Path]] = (),
+                 cache_size: int = 1024):
+        """Initialize the service, load the TTL files and pre-compile the queries"""
+        # rdflib's default "Memory" store keeps SPO/POS/OSP indices, so triple patterns with
+        # any bound position are answered without scanning the whole graph
+        self.graph = Graph(store="Memory")
+        self.version = 0
+        self.cache_size = cache_size
+        self._queries: Dict[str, Query] = {}
+        self._cache: "OrderedDict[CacheKey, Tuple[int, List[Dict[str, Optional[str]]]]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        for ttl_file in ttl_files:
+            self.load(ttl_file)
+        for query_dir in query_dirs:
+            self.register_query_dir(query_dir)
+
+    def load(self, ttl_file: Union[str, Path]):
+        """Parse a TTL file into the store and invalidate cached results"""
+        try:
+            self.graph.parse(str(ttl_file), format="turtle")
+            self._bump_version()
+            logger.info(f"Loaded {ttl_file} (graph now has {len(self.graph)} triples, version {self.version})")
+        except Exception as e:
+            logger.error(f"Failed to load {ttl_file}: {e}")
+            raise
+
+    def add_triples(self, triples: Iterable[Tuple[Identifier, Identifier, Identifier]]):
+        """Add triples to the store and invalidate cached results"""
+        for triple in triples:
+            self.graph.add(triple)
+        self._bump_version()
+
+    def remove_triples(self, triples: Iterable[Tuple[Identifier, Identifier, Identifier]]):
+        """Remove triples from the store and invalidate cached results"""
+        for triple in triples:
+            self.graph.remove(triple)
+        self._bump_version()
+
+    def _bump_version(self):
+        self.version += 1
+        # Entries of older versions can never be served again
+        self._cache.clear()
+
+    def register_query(self, name: str, query_text: str):
+        """Pre-compile a SPARQL query and register it under the given name"""
+        self._queries[name] = prepareQuery(query_text)
+        logger.info(f"Prepared query '{name}'")
+
+    def register_query_dir(self, query_dir: Union[str, Path]):
+        """Pre-compile all .sparql files of a directory; the file stem is used as query name"""
+        for query_file in sorted(Path(query_dir).glob("*.sparql")):
+            self.register_query(query_file.stem, query_file.read_text(encoding="utf-8"))
+
+    @property
+    def query_names(self) -> List[str]:
+        return list(self._queries.keys())
+
+    def query(self, name: str, **bindings: Binding) -> List[Dict[str, Optional[str]]]:
+        """
+        Run a registered query with the given variable bindings.
+
+        Plain Python values are bound as literals; pass rdflib terms (e.g. URIRef) to bind IRIs.
+        Results are returned as a list of rows (variable name -> string value, None if unbound).
+        """
+        if name not in self._queries:
+            raise KeyError(f"Unknown query '{name}'. Registered queries: {self.query_names}")
+
+        init_bindings = {var: self._to_term(value) for var, value in bindings.items()}
+        key = (name, tuple(sorted(init_bindings.items())))
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == self.version:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return [dict(row) for row in cached[1]]
+
+        self.cache_misses += 1
+        result = self.graph.query(self._queries[name], initBindings=init_bindings)
+        rows = [
+            {str(var): (str(row[var]) if row[var] is not None else None) for var in result.vars}
+            for row in result
+        ]
+
+        self._cache[key] = (self.version, rows)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        # copies: callers may modify the rows they get, the cached ones have to stay intact
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _to_term(value: Binding) -> Identifier:
+        if isinstance(value, Identifier):
+            return value
+        return Literal(value)
+
+
+def find_owner_by_scope_id(service: SparqlQueryService, scope_id: str) -> List[Dict[str, Optional[str]]]:
+    """Find the organizational unit owning an external service scope (e.g. an AWS account id)"""
+    return service.query("01_find_owner_by_scope_id", scopeIdentifier=scope_id)
+
+
+def main():
+    """Load the organizational model once and serve the master-data queries"""
+    service = SparqlQueryService(
+        ttl_files=[ORG_SEMANTICS_DIR / "organizational-ontology.ttl",
+                   ORG_SEMANTICS_DIR / "organizational-instances.ttl"],
+        query_dirs=[ORG_QUERIES_DIR],
+    )
+
+    for attempt in ("cold", "warm"):
+        start = perf_counter()
+        rows = find_owner_by_scope_id(service, "123456789012")
+        elapsed_ms = (perf_counter() - start) * 1000
+        logger.info(f"[{attempt}] 01_find_owner_by_scope_id returned {len(rows)} rows in {elapsed_ms:.3f} ms")
+
+    for row in rows:
+        print(row)
+
+    for name in ("03_cost_allocation_mapping", "05_organizational_hierarchy"):
+        rows = service.query(name)
+        logger.info(f"{name} returned {len(rows)} rows")
+
+    logger.info(f"Cache hits: {service.cache_hits}, misses: {service.cache_misses}")
+
+
+if __name__ == "__main__":
+    main()
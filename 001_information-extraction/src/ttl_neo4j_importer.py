@@ -0,0 +1,302 @@
+"""
+TTL to Neo4j Bulk Importer
+
+This script streams instance triples from TTL files (e.g. organizational-instances.ttl
+or bizrisk_examples.ttl) into the Neo4j graph that the extraction pipeline writes to.
+
+The triples are never collected into an rdflib Graph: the parser feeds them one by one
+into a sink, which groups them by subject into nodes (rdf:type -> labels, literals ->
+properties) and relationships (IRI objects), and writes them in batched UNWIND transactions.
+N-Triples files (.nt) are read line by line, so memory use is bounded by the batch size.
+rdflib's Turtle parser reads the whole file into memory first (but still keeps no triples);
+convert very large files to N-Triples. Turtle instance files that use the prefixes of their
+ontology without declaring them (bizrisk_examples.ttl) get the ontology's @prefix lines.
+
+Values of a subject that appears again later in the stream (or in another file) are merged
+with the values already in Neo4j: a property with different values becomes a list of them.
+
+Class and property names are mapped with get_local_part; if an ontology is given, only
+classes and object properties from get_schema_from_onto become labels and relationships.
+
+Requirements:
+- rdflib for parsing the TTL files
+- neo4j for database operations
+"""
+
+import logging
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDF
+from rdflib.store import Store
+from neo4j import GraphDatabase
+
+from utils import get_local_part, get_schema_from_onto
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+REPO_ROOT = Path(__file__).resolve().parents[2]
+ORG_SEMANTICS_DIR = REPO_ROOT / "002_master-data-and-asset-management" / "semantics"
+BIZRISK_SEMANTICS_DIR = REPO_ROOT / "001_information-extraction" / "semantics"
+
+BATCH_SIZE = 5000
+RDF_FORMATS = {".ttl": "turtle", ".nt": "nt"}
+PREFIX_PATTERN = re.compile(r"^@prefix\s+([\w.-]*):", re.MULTILINE)
+# Label shared by all imported nodes; backed by a uniqueness constraint on `uri`, so that MERGE is an index lookup
+RESOURCE_LABEL = "Resource"
+
+
+@dataclass
+class SubjectRecord:
+    """Triples collected for one subject, until the subject changes in the stream"""
+    uri: str
+    labels: Set[str] = field(default_factory=set)
+    properties: Dict[str, List] = field(default_factory=lambda: defaultdict(list))
+    relationships: List[Tuple[str, str]] = field(default_factory=list)  # (relationship type, target uri)
+
+
+@dataclass
+class ImportStats:
+    triples: int = 0
+    nodes: int = 0
+    relationships: int = 0
+    batches: int = 0
+
+
+class _TripleSink(Store):
+    """rdflib store that forwards every parsed triple to a callback instead of keeping it"""
+
+    def __init__(self, on_triple):
+        super().__init__()
+        self.on_triple = on_triple
+
+    def add(self, triple, context, quoted=False):
+        self.on_triple(triple)
+
+
+def quote_identifier(name: str) -> str:
+    """Escape a label or relationship type for use in a Cypher statement"""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def to_property_value(values: List):
+    """Convert the literal values of one property to a Neo4j property value"""
+    converted = []
+    for value in values:
+        python_value = value.toPython() if isinstance(value, Literal) else value
+        if not isinstance(python_value, (str, int, float, bool)):
+            python_value = str(python_value)
+        converted.append(python_value)
+    if len(converted) == 1:
+        return converted[0]
+    # Neo4j lists must be homogeneous
+    if len({type(v) for v in converted}) > 1:
+        converted = [str(v) for v in converted]
+    return converted
+
+
+class TtlNeo4jImporter:
+    def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str,
+                 ontology_file: Optional[Union[str, Path]] = None, batch_size: int = BATCH_SIZE):
+        """Initialize the importer with Neo4j connection and optional ontology for the class/property mapping"""
+        self.neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+        self.batch_size = batch_size
+        self.allowed_labels: Optional[Set[str]] = None
+        self.allowed_relationships: Optional[Set[str]] = None
+        self.ontology_prefixes: Dict[str, str] = {}  # prefix -> @prefix line of the ontology
+        if ontology_file:
+            self._load_mapping(ontology_file)
+
+        self._current: Optional[SubjectRecord] = None
+        # Pending rows, grouped by label combination and property names / relationship type, since
+        # those cannot be parameterized
+        self._node_batches: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict]] = defaultdict(list)
+        self._rel_batches: Dict[str, List[Dict]] = defaultdict(list)
+        self._pending = 0
+        self.stats = ImportStats()
+
+    def _load_mapping(self, ontology_file: Union[str, Path]):
+        """Derive allowed labels and relationship types from the ontology schema"""
+        onto = Graph()
+        onto.parse(str(ontology_file), format="turtle")
+        for line in Path(ontology_file).read_text(encoding="utf-8").splitlines():
+            match = PREFIX_PATTERN.match(line)
+            if match:
+                self.ontology_prefixes[match.group(1)] = line
+        schema = get_schema_from_onto(onto, [])
+        self.allowed_labels = {node_type.label for node_type in schema.node_types}
+        self.allowed_relationships = {rel_type.label for rel_type in schema.relationship_types}
+        logger.info(f"Loaded mapping from {ontology_file}: {len(self.allowed_labels)} classes, "
+                    f"{len(self.allowed_relationships)} relationship types")
+
+    def create_constraints(self):
+        """Create the uniqueness constraint used by the MERGE statements"""
+        query = (f"CREATE CONSTRAINT resource_uri IF NOT EXISTS "
+                 f"FOR (n:{RESOURCE_LABEL}) REQUIRE n.uri IS UNIQUE")
+        with self.neo4j_driver.session() as session:
+            session.run(query).consume()
+        logger.info(f"Ensured uniqueness constraint on :{RESOURCE_LABEL}(uri)")
+
+    def with_ontology_prefixes(self, text: str) -> str:
+        """Turtle text with the @prefix lines of the ontology that it uses without declaring them"""
+        declared = set(PREFIX_PATTERN.findall(text))
+        missing = [line for prefix, line in self.ontology_prefixes.items() if prefix not in declared]
+        return "\n".join(missing + [text])
+
+    def import_file(self, ttl_file: Union[str, Path], rdf_format: Optional[str] = None) -> ImportStats:
+        """Stream a TTL or N-Triples file into Neo4j (format from the file extension by default)"""
+        ttl_file = Path(ttl_file)
+        rdf_format = rdf_format or RDF_FORMATS.get(ttl_file.suffix, "turtle")
+        logger.info(f"Streaming {ttl_file} into Neo4j (batch size {self.batch_size})")
+        sink = Graph(store=_TripleSink(self._on_triple))
+        try:
+            if rdf_format == "turtle":
+                # the Turtle parser reads the whole file anyway
+                sink.parse(data=self.with_ontology_prefixes(ttl_file.read_text(encoding="utf-8")),
+                           format=rdf_format, publicID=ttl_file.resolve().as_uri())
+            else:
+                sink.parse(str(ttl_file), format=rdf_format)
+            self._finish_subject()
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error importing {ttl_file}: {e}")
+            raise
+        logger.info(f"Imported {ttl_file}: {self.stats.triples} triples, {self.stats.nodes} node rows, "
+                    f"{self.stats.relationships} relationship rows in {self.stats.batches} batches")
+        return self.stats
+
+    def _on_triple(self, triple):
+        subject, predicate, obj = triple
+        self.stats.triples += 1
+        # blank nodes are skipped: they have no stable identity to MERGE on
+        if not isinstance(subject, URIRef):
+            return
+        subject_uri = str(subject)
+
+        # Turtle files list the triples of a subject together; a subject seen again later is merged in Neo4j
+        if self._current is None or self._current.uri != subject_uri:
+            self._finish_subject()
+            self._current = SubjectRecord(uri=subject_uri)
+
+        if predicate == RDF.type:
+            label = get_local_part(str(obj))
+            if self.allowed_labels is None or label in self.allowed_labels:
+                self._current.labels.add(label)
+        elif isinstance(obj, Literal):
+            self._current.properties[get_local_part(str(predicate))].append(obj)
+        elif isinstance(obj, URIRef):
+            rel_type = get_local_part(str(predicate))
+            if self.allowed_relationships is None or rel_type in self.allowed_relationships:
+                self._current.relationships.append((rel_type, str(obj)))
+            else:
+                # IRI-valued datatype properties (e.g. xsd:anyURI links) are kept as plain properties
+                self._current.properties[rel_type].append(str(obj))
+
+    def _finish_subject(self):
+        record = self._current
+        if record is None:
+            return
+        self._current = None
+
+        properties = {name: to_property_value(values) for name, values in record.properties.items()}
+        self._node_batches[tuple(sorted(record.labels)), tuple(sorted(properties))].append(
+            {"uri": record.uri, "props": properties})
+        self._pending += 1
+        for rel_type, target in record.relationships:
+            self._rel_batches[rel_type].append({"source": record.uri, "target": target})
+            self._pending += 1
+
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all pending node and relationship rows"""
+        if not self._pending:
+            return
+        with self.neo4j_driver.session() as session:
+            # Nodes first, so that relationship endpoints usually exist already
+            for (labels, property_names), rows in self._node_batches.items():
+                session.execute_write(self._write_nodes, labels, property_names, rows)
+                self.stats.nodes += len(rows)
+                self.stats.batches += 1
+            for rel_type, rows in self._rel_batches.items():
+                session.execute_write(self._write_relationships, rel_type, rows)
+                self.stats.relationships += len(rows)
+                self.stats.batches += 1
+        self._node_batches.clear()
+        self._rel_batches.clear()
+        self._pending = 0
+
+    @staticmethod
+    def merge_property(name: str) -> str:
+        """
+        Cypher that merges a property of the row into the node: a new or equal value is set,
+        different values become a list of the distinct values (`[] + x` is a list for values and lists)
+        """
+        current, new = f"n.{quote_identifier(name)}", f"row.props.{quote_identifier(name)}"
+        return (f"{current} = CASE WHEN {current} IS NULL OR {current} = {new} THEN {new} "
+                f"ELSE reduce(merged = [], value IN [] + {current} + {new} | "
+                f"CASE WHEN value IN merged THEN merged ELSE merged + value END) END")
+
+    @staticmethod
+    def _write_nodes(tx, labels: Tuple[str, ...], property_names: Tuple[str, ...], rows: List[Dict]):
+        set_labels = "".join(f":{quote_identifier(label)}" for label in labels)
+        set_properties = ", ".join(TtlNeo4jImporter.merge_property(name) for name in property_names)
+        query = f"""
+        UNWIND $rows AS row
+        MERGE (n:{RESOURCE_LABEL} {{uri: row.uri}})
+        {f"SET {set_properties}" if property_names else ""}
+        {f"SET n{set_labels}" if labels else ""}
+        """
+        tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def _write_relationships(tx, rel_type: str, rows: List[Dict]):
+        query = f"""
+        UNWIND $rows AS row
+        MERGE (source:{RESOURCE_LABEL} {{uri: row.source}})
+        MERGE (target:{RESOURCE_LABEL} {{uri: row.target}})
+        MERGE (source)-[:{quote_identifier(rel_type)}]->(target)
+        """
+        tx.run(query, rows=rows).consume()
+
+    def close(self):
+        """Close the Neo4j driver"""
+        self.neo4j_driver.close()
+
+
+def main():
+    """Import the organizational and bizrisk example instances into Neo4j"""
+    imports = [
+        (ORG_SEMANTICS_DIR / "organizational-ontology.ttl", ORG_SEMANTICS_DIR / "organizational-instances.ttl"),
+        (BIZRISK_SEMANTICS_DIR / "bizrisk.ttl", BIZRISK_SEMANTICS_DIR / "bizrisk_examples.ttl"),
+    ]
+
+    for ontology_file, instances_file in imports:
+        importer = TtlNeo4jImporter(
+            neo4j_uri=NEO4J_URI,
+            neo4j_user=NEO4J_USERNAME,
+            neo4j_password=NEO4J_PASSWORD,
+            ontology_file=ontology_file,
+        )
+        try:
+            importer.create_constraints()
+            importer.import_file(instances_file)
+        except Exception as e:
+            logger.error(f"Error in main execution: {e}")
+        finally:
+            importer.close()
+
+
+if __name__ == "__main__":
+    main()
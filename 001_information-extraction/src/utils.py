@@ -1,5 +1,6 @@
-from typing import List
+from typing import Dict, List
 
+import numpy as np
 from rdflib.namespace import RDF, OWL, RDFS
 from rdflib import Graph
 from neo4j_graphrag.experimental.components.schema import (
@@ -46,6 +47,34 @@ def chunk_text(text: str, chunk_size: int = 2500, overlap: int = 50) -> List[str
             break
     return chunks
 
+def filter_relevant_chunks(chunks: List[str], model, ontology_embedding, threshold: float,
+                           chunk_embeddings=None) -> List[Dict]:
+    """
+    Keep only chunks whose cosine similarity to the ontology embedding reaches the threshold.
+    Precomputed chunk_embeddings (one row per chunk) are used instead of encoding the chunks.
+    """
+    relevant_chunks = []
+    for i, chunk in enumerate(chunks):
+        if chunk_embeddings is not None:
+            chunk_embedding = chunk_embeddings[i:i + 1]
+        else:
+            chunk_embedding = model.encode([chunk])
+
+        # Calculate cosine similarity with the ontology as a whole
+        similarity = np.dot(chunk_embedding, ontology_embedding.T).flatten()[0]
+
+        # Check if chunk passes threshold
+        if similarity >= threshold:
+            relevant_chunks.append({
+                'chunk_index': i,
+                'content': chunk,
+                'similarity_to_ontology': float(similarity)
+            })
+            print(f"✓ Chunk {i:3d}: similarity {similarity:.3f} - RELEVANT")
+        else:
+            print(f"✗ Chunk {i:3d}: similarity {similarity:.3f} - filtered out")
+    return relevant_chunks
+
 def get_nl_ontology(g):
   result = ''
   definedcats = []
@@ -0,0 +1,353 @@
+"""
+PlantUML to Graph Compiler
+
+This script compiles PlantUML component diagrams (such as test_components.plantuml)
+directly into node and relationship batches and loads them into Neo4j, instead of
+hand-writing one CREATE statement per node (see helm-deployment-schema.cypher).
+
+Supported elements:
+- packages (`package "<label>" as <alias> { ... }`), which CONTAIN the elements nested in them
+- components (`component "<label>" as <alias>`, `[<label>] as <alias>`, `component <alias>`)
+- arrows between elements (`a -----> b : refers`), arrow length and direction are normalized
+- notes attached to elements (`note left of "<alias>" ... end note`), stored as description
+Sprites (`<$helm{scale=0.3}>`), skinparams and preprocessor lines are ignored.
+
+Loading uses constraint-backed UNWIND MERGE. Every node and relationship carries a content
+hash, so that re-syncing a changed diagram only writes what changed and removes what was
+deleted from the diagram; an unchanged diagram is skipped entirely.
+
+Requirements:
+- neo4j for database operations
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from neo4j import GraphDatabase
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configuration
+NEO4J_URI = "neo4j://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "testtest"
+DIAGRAMS_DIR = Path(__file__).resolve().parents[1]
+DIAGRAM_SUFFIXES = (".plantuml", ".puml")
+
+BATCH_SIZE = 1000
+# Label shared by all diagram elements; backed by a uniqueness constraint on `key`
+ELEMENT_LABEL = "DiagramElement"
+DEFAULT_RELATIONSHIP = "CONNECTS_TO"
+CONTAINS_RELATIONSHIP = "CONTAINS"
+
+SPRITE_PATTERN = re.compile(r"<\$[^>]*>")
+CONTAINER_PATTERN = re.compile(
+    r'^(?P<kind>package|node|folder|frame|cloud|database|rectangle|component)\s+'
+    r'(?:"(?P<label>[^"]*)"\s+as\s+(?P<alias>[\w.]+)|(?P<name>[\w.]+))'
+    r'(?:\s+<<[^>]*>>)?\s*(?P<open>\{)?\s*\}?\s*$'
+)
+BRACKET_COMPONENT_PATTERN = re.compile(r'^\[(?P<label>[^\]]+)\](?:\s+as\s+(?P<alias>[\w.]+))?\s*$')
+ARROW_PATTERN = re.compile(
+    r'^"?(?P<left>[\w.]+)"?\s*(?P<arrow><?[-.]+(?:\[[^\]]*\])?[-.]*>?)\s*"?(?P<right>[\w.]+)"?\s*(?::\s*(?P<label>.*))?$'
+)
+NOTE_BLOCK_PATTERN = re.compile(r'^note\s+(?:left|right|top|bottom)\s+of\s+"?(?P<alias>[\w.]+)"?\s*$')
+NOTE_INLINE_PATTERN = re.compile(r'^note\s+(?:left|right|top|bottom)\s+of\s+"?(?P<alias>[\w.]+)"?\s*:\s*(?P<text>.*)$')
+
+
+@dataclass
+class DiagramNode:
+    key: str
+    alias: str
+    name: str
+    kind: str
+    diagram: str
+    description: str = ""
+
+
+@dataclass
+class DiagramRelationship:
+    source: str
+    target: str
+    type: str
+    label: str = ""
+
+    @property
+    def key(self) -> str:
+        return f"{self.source}|{self.type}|{self.target}"
+
+
+@dataclass
+class DiagramGraph:
+    """Nodes and relationships compiled from one diagram"""
+    diagram: str
+    source_hash: str
+    nodes: Dict[str, DiagramNode] = field(default_factory=dict)  # alias -> node
+    relationships: List[DiagramRelationship] = field(default_factory=list)
+
+
+def content_hash(data: Dict) -> str:
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def relationship_type(label: str) -> str:
+    """Turn an arrow label such as 'published from' into a relationship type (PUBLISHED_FROM)"""
+    rel_type = re.sub(r"[^0-9A-Za-z]+", "_", label).strip("_").upper()
+    return rel_type or DEFAULT_RELATIONSHIP
+
+
+def clean_label(label: str) -> str:
+    """Remove sprites and PlantUML line breaks from a label"""
+    return SPRITE_PATTERN.sub("", label).replace("\\n", " ").strip()
+
+
+def compile_diagram(text: str, diagram: str) -> DiagramGraph:
+    """Parse a PlantUML component diagram into nodes and relationships"""
+    graph = DiagramGraph(diagram=diagram, source_hash=hashlib.sha1(text.encode("utf-8")).hexdigest())
+    parents: List[Optional[str]] = []  # stack of enclosing containers (None for non-container blocks)
+    note_alias: Optional[str] = None
+    note_lines: List[str] = []
+
+    def add_node(alias: str, name: str, kind: str) -> DiagramNode:
+        node = graph.nodes.get(alias)
+        if node is None:
+            node = DiagramNode(key=f"{diagram}:{alias}", alias=alias, name=name, kind=kind, diagram=diagram)
+            graph.nodes[alias] = node
+        parent = next((p for p in reversed(parents) if p), None)
+        if parent:
+            graph.relationships.append(DiagramRelationship(parent, alias, CONTAINS_RELATIONSHIP))
+        return node
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+
+        if note_alias is not None:
+            if line.lower() == "end note":
+                if note_alias in graph.nodes:
+                    graph.nodes[note_alias].description = " ".join(l for l in note_lines if l)
+                note_alias, note_lines = None, []
+            else:
+                note_lines.append(line.lstrip("*").strip())
+            continue
+
+        if not line or line.startswith("'") or line.startswith("!") or line.startswith("@") \
+                or line.startswith("skinparam") or line.startswith("title") or line.endswith("direction"):
+            continue
+
+        if line == "}":
+            if parents:
+                parents.pop()
+            continue
+
+        match = NOTE_INLINE_PATTERN.match(line)
+        if match:
+            if match["alias"] in graph.nodes:
+                graph.nodes[match["alias"]].description = match["text"].strip()
+            continue
+        match = NOTE_BLOCK_PATTERN.match(line)
+        if match:
+            note_alias = match["alias"]
+            continue
+
+        match = CONTAINER_PATTERN.match(line)
+        if match:
+            alias = match["alias"] or match["name"]
+            add_node(alias, clean_label(match["label"] or alias), match["kind"].capitalize())
+            # `{ }` on one line opens and closes the block, so only a dangling `{` starts nesting
+            if match["open"] and not line.endswith("}"):
+                parents.append(alias)
+            continue
+
+        match = BRACKET_COMPONENT_PATTERN.match(line)
+        if match:
+            label = clean_label(match["label"])
+            add_node(match["alias"] or label, label, "Component")
+            continue
+
+        match = ARROW_PATTERN.match(line)
+        if match:
+            left, right, arrow = match["left"], match["right"], match["arrow"]
+            for alias in (left, right):
+                if alias not in graph.nodes:
+                    add_node(alias, alias, "Component")
+            source, target = (right, left) if arrow.startswith("<") and not arrow.endswith(">") else (left, right)
+            label = (match["label"] or "").strip()
+            graph.relationships.append(DiagramRelationship(source, target, relationship_type(label), label))
+            continue
+
+        if line.endswith("{"):
+            parents.append(None)
+
+    return graph
+
+
+class DiagramGraphLoader:
+    def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str, batch_size: int = BATCH_SIZE):
+        """Initialize the loader with Neo4j connection"""
+        self.neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+        self.batch_size = batch_size
+
+    def create_constraints(self):
+        """Create the uniqueness constraints used by the MERGE statements"""
+        statements = [
+            f"CREATE CONSTRAINT diagram_element_key IF NOT EXISTS FOR (n:{ELEMENT_LABEL}) REQUIRE n.key IS UNIQUE",
+            "CREATE CONSTRAINT diagram_name IF NOT EXISTS FOR (d:Diagram) REQUIRE d.name IS UNIQUE",
+        ]
+        with self.neo4j_driver.session() as session:
+            for statement in statements:
+                session.run(statement).consume()
+
+    def sync(self, graph: DiagramGraph) -> Dict[str, int]:
+        """Write a compiled diagram, touching only nodes and relationships that changed since the last sync"""
+        counts = {"nodes_written": 0, "relationships_written": 0, "nodes_deleted": 0, "relationships_deleted": 0}
+
+        with self.neo4j_driver.session() as session:
+            stored_hash = session.execute_read(self._read_diagram_hash, graph.diagram)
+            if stored_hash == graph.source_hash:
+                logger.info(f"Diagram '{graph.diagram}' is unchanged, skipping")
+                return counts
+
+            existing_nodes, existing_kinds, existing_rels = session.execute_read(self._read_hashes, graph.diagram)
+
+            # grouped by (previous kind, kind): a node whose kind changed loses its previous kind label
+            node_rows: Dict[Tuple[Optional[str], str], List[Dict]] = defaultdict(list)
+            for node in graph.nodes.values():
+                props = {"name": node.name, "alias": node.alias, "kind": node.kind,
+                         "description": node.description, "diagram": node.diagram}
+                row = {"key": node.key, "props": {**props, "hash": content_hash(props)}}
+                if existing_nodes.get(node.key) != row["props"]["hash"]:
+                    node_rows[(existing_kinds.get(node.key), node.kind)].append(row)
+
+            rel_rows: Dict[str, List[Dict]] = defaultdict(list)
+            seen_rels = set()
+            for rel in graph.relationships:
+                source, target = graph.nodes[rel.source].key, graph.nodes[rel.target].key
+                key = f"{source}|{rel.type}|{target}"
+                if key in seen_rels:
+                    continue
+                seen_rels.add(key)
+                props = {"label": rel.label, "diagram": graph.diagram}
+                row = {"source": source, "target": target, "props": {**props, "key": key, "hash": content_hash(props)}}
+                if existing_rels.get(key) != row["props"]["hash"]:
+                    rel_rows[rel.type].append(row)
+
+            current_keys = {n.key for n in graph.nodes.values()}
+            stale_nodes = [key for key in existing_nodes if key not in current_keys]
+            stale_rels = [key for key in existing_rels if key not in seen_rels]
+
+            for (previous_kind, kind), rows in node_rows.items():
+                for batch in self._batches(rows):
+                    session.execute_write(self._write_nodes, kind, batch, previous_kind)
+                    counts["nodes_written"] += len(batch)
+            for rel_type, rows in rel_rows.items():
+                for batch in self._batches(rows):
+                    session.execute_write(self._write_relationships, rel_type, batch)
+                    counts["relationships_written"] += len(batch)
+            for batch in self._batches(stale_rels):
+                session.execute_write(self._delete_relationships, graph.diagram, batch)
+                counts["relationships_deleted"] += len(batch)
+            for batch in self._batches(stale_nodes):
+                session.execute_write(self._delete_nodes, batch)
+                counts["nodes_deleted"] += len(batch)
+
+            session.execute_write(self._write_diagram_hash, graph.diagram, graph.source_hash)
+
+        logger.info(f"Synced diagram '{graph.diagram}': {counts}")
+        return counts
+
+    def _batches(self, rows: List) -> List[List]:
+        return [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+
+    @staticmethod
+    def _read_diagram_hash(tx, diagram: str) -> Optional[str]:
+        record = tx.run("MATCH (d:Diagram {name: $diagram}) RETURN d.hash AS hash", diagram=diagram).single()
+        return record["hash"] if record else None
+
+    @staticmethod
+    def _read_hashes(tx, diagram: str) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+        records = list(tx.run(f"MATCH (n:{ELEMENT_LABEL} {{diagram: $diagram}}) "
+                              f"RETURN n.key AS key, n.hash AS hash, n.kind AS kind", diagram=diagram))
+        nodes = {r["key"]: r["hash"] for r in records}
+        kinds = {r["key"]: r["kind"] for r in records}
+        rels = {r["key"]: r["hash"] for r in tx.run(
+            f"MATCH (:{ELEMENT_LABEL})-[r {{diagram: $diagram}}]->(:{ELEMENT_LABEL}) RETURN r.key AS key, r.hash AS hash",
+            diagram=diagram)}
+        return nodes, kinds, rels
+
+    @staticmethod
+    def _write_nodes(tx, kind: str, rows: List[Dict], previous_kind: Optional[str] = None):
+        remove_previous = f"REMOVE n:`{previous_kind}`" if previous_kind and previous_kind != kind else ""
+        query = f"""
+        UNWIND $rows AS row
+        MERGE (n:{ELEMENT_LABEL} {{key: row.key}})
+        SET n += row.props, n:`{kind}`
+        {remove_previous}
+        """
+        tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def _write_relationships(tx, rel_type: str, rows: List[Dict]):
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (source:{ELEMENT_LABEL} {{key: row.source}})
+        MATCH (target:{ELEMENT_LABEL} {{key: row.target}})
+        MERGE (source)-[r:`{rel_type}`]->(target)
+        SET r += row.props
+        """
+        tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def _delete_relationships(tx, diagram: str, keys: List[str]):
+        query = f"""
+        MATCH (:{ELEMENT_LABEL})-[r {{diagram: $diagram}}]->(:{ELEMENT_LABEL})
+        WHERE r.key IN $keys
+        DELETE r
+        """
+        tx.run(query, diagram=diagram, keys=keys).consume()
+
+    @staticmethod
+    def _delete_nodes(tx, keys: List[str]):
+        query = f"""
+        UNWIND $keys AS key
+        MATCH (n:{ELEMENT_LABEL} {{key: key}})
+        DETACH DELETE n
+        """
+        tx.run(query, keys=keys).consume()
+
+    @staticmethod
+    def _write_diagram_hash(tx, diagram: str, source_hash: str):
+        tx.run("MERGE (d:Diagram {name: $diagram}) SET d.hash = $hash", diagram=diagram, hash=source_hash).consume()
+
+    def close(self):
+        """Close the Neo4j driver"""
+        self.neo4j_driver.close()
+
+
+def main():
+    """Compile all PlantUML diagrams in the demo directory and sync them into Neo4j"""
+    loader = DiagramGraphLoader(
+        neo4j_uri=NEO4J_URI,
+        neo4j_user=NEO4J_USERNAME,
+        neo4j_password=NEO4J_PASSWORD,
+    )
+    try:
+        loader.create_constraints()
+        for diagram_file in sorted(p for p in DIAGRAMS_DIR.rglob("*") if p.suffix in DIAGRAM_SUFFIXES):
+            graph = compile_diagram(diagram_file.read_text(encoding="utf-8"), diagram=diagram_file.stem)
+            logger.info(f"Compiled {diagram_file.name}: {len(graph.nodes)} nodes, {len(graph.relationships)} relationships")
+            loader.sync(graph)
+    except Exception as e:
+        logger.error(f"Error in main execution: {e}")
+    finally:
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()